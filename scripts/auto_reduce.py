@@ -1,13 +1,22 @@
 #!/bin/python
 from __future__ import print_function  # python >= 2.6
+import argparse
 import glob
 
 from os import chdir, listdir, makedirs, path, name as os_name, \
-               linesep as os_linesep, sep as os_sep
+               linesep as os_linesep, sep as os_sep, replace as os_replace
 from subprocess import Popen, PIPE, call
 from sys import exit as sys_exit, stderr
 from pprint import pprint
 from threading import Timer
+from multiprocessing import cpu_count
+from hashlib import sha256
+from json import dump as json_dump, load as json_load
+
+import option_reducer
+from option_reducer import ERROR_CODE
+
+FLAGS = None
 
 
 def term_proc(proc, timeout):
@@ -41,6 +50,133 @@ def proc_output(args, timeout_sec=None):
     return output if proc.returncode == 0 and not timeout["value"] else None
 
 
+def parse_test_file(test_file):
+    entries = []
+
+    with open(test_file, 'r') as f:
+        for line in f:
+            splits = line.split()
+
+            if len(splits) < 3 or splits[0][0] == '#':
+                continue
+
+            idx = splits[0]
+            if idx[-1] == '!':
+                idx = idx[:-1]
+
+            lang = None if len(splits) < 4 else splits[3]
+            entries.append((idx, splits[1], splits[2], lang))
+
+    return entries
+
+
+def file_digest(file_path, digest_cache=None):
+    if digest_cache is not None and file_path in digest_cache:
+        return digest_cache[file_path]
+
+    with open(file_path, 'rb') as f:
+        digest = sha256(f.read()).hexdigest()
+
+    if digest_cache is not None:
+        digest_cache[file_path] = digest
+    return digest
+
+
+def uncrustify_version(unc_bin_path):
+    version = proc_output([unc_bin_path, "--version"], timeout_sec=10)
+    if version is None:
+        return None
+
+    return "%s %s" % (version.strip(), file_digest(unc_bin_path))
+
+
+def manifest_entry(config_file_path, value_list, input_dir, output_dir,
+                   binary_version, digest_cache):
+    try:
+        files = sorted([file_digest(path.join(input_dir, "%s/%s"
+                                              % (lang_dir, file)),
+                                    digest_cache),
+                        file_digest(path.join(output_dir, "%s/%s-%s"
+                                              % (lang_dir, idx, file)),
+                                    digest_cache),
+                        lang]
+                       for idx, file, lang_dir, lang in value_list)
+
+        return {"config": file_digest(config_file_path),
+                "files": files,
+                "binary": binary_version}
+    except (IOError, OSError):
+        return None
+
+
+def load_manifest(manifest_path):
+    if not path.exists(manifest_path):
+        return {}
+
+    try:
+        with open(manifest_path, 'r') as f:
+            return json_load(f)
+    except ValueError:
+        print("ignoring invalid manifest: %s" % manifest_path, file=stderr)
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = "%s.tmp" % manifest_path
+    with open(tmp_path, 'w') as f:
+        json_dump(manifest, f, indent=1, sort_keys=True)
+    os_replace(tmp_path, manifest_path)
+
+
+def make_jobs(config_map, config_dir, input_dir, output_dir, tmp_root):
+    jobs = []
+
+    for job_id, (key, value_list) in enumerate(sorted(config_map.items())):
+        input_files = []
+        formatted_files = []
+        langs = []
+
+        for idx, file, lang_dir, lang in value_list:
+            input_files.append(path.join(input_dir, "%s/%s" % (lang_dir, file)))
+            formatted_files.append(path.join(output_dir, "%s/%s-%s"
+                                             % (lang_dir, idx, file)))
+            langs.append(lang)
+
+        jobs.append(option_reducer.make_job(
+            job_id, FLAGS.uncrustify_binary_path, path.join(config_dir, key),
+            input_files, formatted_files, langs, tmp_root, FLAGS.passes,
+            graph=FLAGS.graph, event_log=FLAGS.event_log, quiet=True,
+            jobs=FLAGS.jobs))
+
+    return jobs
+
+
+def write_reduced_config(job, result, manifest, key, entry):
+    print(".", end='', flush=True)
+    manifest.pop(key, None)
+
+    if result is None:
+        print("\nerror: %s" % job["config_file_path"], file=stderr)
+        save_manifest(FLAGS.manifest, manifest)
+        return
+
+    ret_flag, option_list, stats = result
+    if ret_flag != ERROR_CODE.NONE:
+        print("\nret_flag %d: %s" % (ret_flag, job["config_file_path"]),
+              file=stderr)
+        save_manifest(FLAGS.manifest, manifest)
+        return
+
+    with open(job["config_file_path"], 'w') as f:
+        option_reducer.print_reduce_result(option_list, stats, quiet=True,
+                                           target_file_obj=f)
+
+    # the reduced config is what the next run compares against
+    entry["config"] = file_digest(job["config_file_path"])
+    manifest[key] = entry
+    save_manifest(FLAGS.manifest, manifest)
+
+
 def main():
     root_dir = path.dirname(path.dirname(path.abspath(__file__)))
     test_dir = path.join(root_dir, "tests")
@@ -50,33 +186,17 @@ def main():
 
     chdir(test_dir)
 
+    for file_path in (FLAGS.manifest, FLAGS.graph):
+        file_dir = path.dirname(file_path)
+        if file_dir and not path.isdir(file_dir):
+            makedirs(file_dir)
+
     files = glob.glob('./*.test')
 
     config_map = {}
 
     for test_file in files:
-        rg_string = proc_output(["grep", "-P", ".cfg", test_file])
-        if rg_string is None:
-            print("error: %s" % test_file, file=stderr)
-            continue
-
-        lines = rg_string.splitlines()
-        for line in lines:
-            line = line.strip()
-            splits = line.split()
-            split_len = len(splits)
-
-            idx = splits[0]
-            if idx[-1] == '!':
-                idx = idx[:-1]
-
-            cfg = splits[1]
-            file_path = splits[2]
-            lang = None if split_len < 4 else splits[3]
-
-            if line[0] == '#':
-                continue
-
+        for idx, cfg, file_path, lang in parse_test_file(test_file):
             lang_dir, file = file_path.split('/', 1)
 
             if cfg not in config_map:
@@ -84,39 +204,124 @@ def main():
             else:
                 config_map[cfg].append((idx, file, lang_dir, lang))
 
-    for key, value_list in config_map.items():
-        config_file_path = path.join(config_dir, key)
-        args = ["python", "../scripts/option_reducer.py", '-q',
-                '-b', "../build/Debug/uncrustify",
-                "-c", config_file_path]
-
-        for value_pair in value_list:
-            input_file_path = path.join(input_dir, "%s/%s"
-                                        % (value_pair[2], value_pair[1]))
-            args.append("-i")
-            args.append(input_file_path)
-
-            output_file_path = path.join(output_dir, "%s/%s-%s"
-                                         % (value_pair[2], value_pair[0],
-                                            value_pair[1]))
-            args.append("-f")
-            args.append(output_file_path)
-
-            if len(value_pair) > 4:
-                args.append("-l")
-                args.append(value_pair[3])
-
-        print(".", end='', flush=True)
-        out = proc_output(args)
-        # out = None
-        if out is None:
-            continue
-
-        with open(config_file_path, 'w') as f:
-            f.write(out)
+    binary_version = uncrustify_version(FLAGS.uncrustify_binary_path)
+    if binary_version is None:
+        print("error: %s" % FLAGS.uncrustify_binary_path, file=stderr)
+        return 1
+
+    # skip the configs whose hashes match their last successful reduction
+    manifest = {} if FLAGS.force else load_manifest(FLAGS.manifest)
+    digest_cache = {}
+    entries = {}
+    unchanged = 0
+
+    for key, value_list in sorted(config_map.items()):
+        entry = manifest_entry(path.join(config_dir, key), value_list,
+                               input_dir, output_dir, binary_version,
+                               digest_cache)
+        if entry is None:
+            print("error: %s" % key, file=stderr)
+        elif manifest.get(key) == entry:
+            unchanged += 1
+        else:
+            entries[key] = entry
+
+    config_map = dict((key, config_map[key]) for key in entries)
+    print("%d configs unchanged, reducing %d" % (unchanged, len(config_map)))
+
+    # all configs are reduced by one pool, up to --active configs at a time
+    # keep their steps queued so that no process idles between the stages
+    with option_reducer.make_temp_directory() as tmp_root:
+        jobs = make_jobs(config_map, config_dir, input_dir, output_dir,
+                         tmp_root)
+        # the job ids are the indices of the sorted config_map keys, which are
+        # the config paths of the .test files (e.g. staging/<name>.cfg)
+        keys = sorted(config_map)
+
+        pool = option_reducer.create_pool(jobs, FLAGS.jobs)
+        try:
+            option_reducer.run_concurrent_steps(
+                pool,
+                ((job["id"], option_reducer.reduce_job_steps(job))
+                 for job in jobs),
+                FLAGS.active,
+                lambda job_id, result: write_reduced_config(
+                    jobs[job_id], result, manifest, keys[job_id],
+                    entries[keys[job_id]]))
+        finally:
+            pool.close()
+            pool.join()
+    print("")
 
     return 0
 
 
 if __name__ == "__main__":
-    sys_exit(main())
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument(
+        '-b', '--uncrustify_binary_path',
+        metavar='<path>',
+        type=str,
+        default="../build/Debug/uncrustify",
+        help="The Uncrustify binary file path, relative to the 'tests/' "
+             "directory."
+    )
+    arg_parser.add_argument(
+        '-j', '--jobs',
+        metavar='<nr>',
+        type=int,
+        default=cpu_count(),
+        help='Number of processes of the shared pool.'
+    )
+    arg_parser.add_argument(
+        '-a', '--active',
+        metavar='<nr>',
+        type=int,
+        default=None,
+        help='Number of configs that are reduced at the same time. '
+             'Defaults to twice the number of jobs.'
+    )
+    arg_parser.add_argument(
+        '-m', '--manifest',
+        metavar='<path>',
+        type=str,
+        default="../build/auto_reduce_manifest.json",
+        help="File with the content hashes of the last successful "
+             "reductions, relative to the 'tests/' directory."
+    )
+    arg_parser.add_argument(
+        '-g', '--graph',
+        metavar='<path>',
+        type=str,
+        default="../build/option_graph.json",
+        help="Option graph file shared by all reductions, relative to the "
+             "'tests/' directory."
+    )
+    arg_parser.add_argument(
+        '--event-log',
+        metavar='<path>',
+        type=str,
+        default=None,
+        help='File to which the progress and stage timing events of all '
+             'reductions are appended as JSON lines.'
+    )
+    arg_parser.add_argument(
+        '--force',
+        default=False,
+        action='store_true',
+        help='Reduce all configs, even if their hashes match the manifest.'
+    )
+    arg_parser.add_argument(
+        '-p', '--passes',
+        metavar='<nr>',
+        type=int,
+        default=5,
+        help='Max. number of cleaning passes.'
+    )
+
+    FLAGS = arg_parser.parse_args()
+    if FLAGS.active is None:
+        FLAGS.active = 2 * FLAGS.jobs
+
+    sys_exit(main())
@@ -0,0 +1,375 @@
+#!/usr/bin/python
+"""
+combination_groups.py
+
+Column store for the results of gen_config_combinations_uniq_output.py: every
+formatted (combination, input file) pair is one row, each option has a small
+int column with the index of its setting, the input file and the output group
+have a column each.
+
+The columns are saved as a binary file (a JSON header line followed by the raw
+little endian arrays) that can be queried with this script, e.g. which
+settings of an option produce group 3 on file 0:
+
+    combination_groups.py out/out.cols -g 3 -f 0 -o sp_arith
+
+:license: GPL v2+
+"""
+
+from __future__ import print_function  # python >= 2.6
+import argparse
+
+from array import array
+from json import dumps as json_dumps, loads as json_loads
+from sys import byteorder, exit as sys_exit, stderr
+
+COLUMNS_MAGIC = b"UNCRUSTIFY-COMBINATION-GROUPS 1\n"
+
+FILE_TYPECODE = 'H'
+GROUP_TYPECODE = 'I'
+
+
+def option_typecode(settings_len):
+    """Smallest array typecode for the setting indices of an option
+
+    :param settings_len: amount of settings of the option
+
+    :return: array typecode
+    """
+
+    return 'B' if settings_len <= 0x100 else 'H'
+
+
+def new_columns(option_settings, options, files):
+    """Creates an empty column store
+
+    :param option_settings: dict of option types to their list of settings
+
+    :param options: list of option dicts with 'name' and 'type'
+
+    :param files: list of input file paths
+
+    :return: dict
+             options -- list of setting index arrays, one per option
+             file    -- input file index array
+             group   -- group index array
+             first   -- row index array of the first row of every group
+             option_settings, option_names, option_types, files -- metadata
+    """
+
+    return {"option_settings": option_settings,
+            "option_names": [o["name"] for o in options],
+            "option_types": [o["type"] for o in options],
+            "files": files,
+            "options": [array(option_typecode(len(option_settings[o["type"]])))
+                        for o in options],
+            "file": array(FILE_TYPECODE),
+            "group": array(GROUP_TYPECODE),
+            "first": array(GROUP_TYPECODE)}
+
+
+def append_row(columns, combination, file_idx, group_idx):
+    """Appends a row to a column store, a new group_idx has to be the amount
+       of groups
+
+    :param columns: column store, see new_columns
+
+    :param combination: tuple of setting indices
+
+    :param file_idx: input file index
+
+    :param group_idx: group index
+    """
+
+    for column, setting_idx in zip(columns["options"], combination):
+        column.append(setting_idx)
+
+    if group_idx == len(columns["first"]):
+        columns["first"].append(len(columns["file"]))
+
+    columns["file"].append(file_idx)
+    columns["group"].append(group_idx)
+
+
+def row_count(columns):
+    return len(columns["file"])
+
+
+def group_count(columns):
+    return len(columns["first"])
+
+
+def row_combination(columns, row):
+    """Setting indices of a row
+
+    :param columns: column store, see new_columns
+
+    :param row: row index
+
+    :return: tuple of setting indices
+    """
+
+    return tuple(column[row] for column in columns["options"])
+
+
+def row_settings(columns, row):
+    """Settings of a row
+
+    :param columns: column store, see new_columns
+
+    :param row: row index
+
+    :return: list of settings, one per option
+    """
+
+    return [columns["option_settings"][option_type][column[row]]
+            for option_type, column in zip(columns["option_types"],
+                                           columns["options"])]
+
+
+def group_file_order(columns):
+    """Sorts the rows by group and file index, the rows of a group - file pair
+       keep their insertion order (counting sort, no per row objects)
+
+    :param columns: column store, see new_columns
+
+    :return: tuple of the row index array and an array of the start offsets of
+             every group - file pair (index group_idx * files_len + file_idx,
+             with one extra end offset)
+    """
+
+    files_len = len(columns["files"])
+    starts = array('L', [0]) * (group_count(columns) * files_len + 1)
+
+    for file_idx, group_idx in zip(columns["file"], columns["group"]):
+        starts[group_idx * files_len + file_idx + 1] += 1
+    for idx in range(1, len(starts)):
+        starts[idx] += starts[idx - 1]
+
+    fill = array('L', starts)
+    order = array('L', [0]) * row_count(columns)
+    for row, (file_idx, group_idx) in enumerate(zip(columns["file"],
+                                                    columns["group"])):
+        bucket = group_idx * files_len + file_idx
+        order[fill[bucket]] = row
+        fill[bucket] += 1
+
+    return order, starts
+
+
+def group_sizes(columns, file_idx):
+    """Amount of rows of every group that appears for an input file
+
+    :param columns: column store, see new_columns
+
+    :param file_idx: input file index
+
+    :return: list of ints
+    """
+
+    sizes = {}
+    for row_file_idx, group_idx in zip(columns["file"], columns["group"]):
+        if row_file_idx == file_idx:
+            sizes[group_idx] = sizes.get(group_idx, 0) + 1
+
+    return list(sizes.values())
+
+
+def column_items(columns):
+    """The arrays of a column store in their file order
+
+    :param columns: column store, see new_columns
+
+    :return: list of arrays
+    """
+
+    return columns["options"] + [columns["file"], columns["group"],
+                                 columns["first"]]
+
+
+def save_columns(columns, file_path, extra=None):
+    """Writes a column store into a binary file
+
+    :param columns: column store, see new_columns
+
+    :param file_path: path of the written file
+
+    :param extra: dict of additional JSON serializable header entries
+    """
+
+    header = {"option_settings": columns["option_settings"],
+              "option_names": columns["option_names"],
+              "option_types": columns["option_types"],
+              "files": columns["files"],
+              "typecodes": [a.typecode for a in column_items(columns)],
+              "lengths": [len(a) for a in column_items(columns)],
+              "extra": extra or {}}
+
+    with open(file_path, 'wb') as f:
+        f.write(COLUMNS_MAGIC)
+        f.write(json_dumps(header).encode("UTF-8"))
+        f.write(b"\n")
+
+        for column in column_items(columns):
+            if byteorder != "little":
+                column = array(column.typecode, column)
+                column.byteswap()
+            column.tofile(f)
+
+
+def load_columns(file_path):
+    """Reads a column store that was written by save_columns
+
+    :param file_path: path of the file
+
+    :return: tuple of the column store and the extra header entries
+    """
+
+    with open(file_path, 'rb') as f:
+        if f.read(len(COLUMNS_MAGIC)) != COLUMNS_MAGIC:
+            raise Exception("%s is not a combination groups file" % file_path)
+        header = json_loads(f.readline().decode("UTF-8"))
+
+        arrays = []
+        for typecode, length in zip(header["typecodes"], header["lengths"]):
+            column = array(typecode)
+            column.fromfile(f, length)
+            if byteorder != "little":
+                column.byteswap()
+            arrays.append(column)
+
+    options_len = len(header["option_names"])
+    columns = {"option_settings": header["option_settings"],
+               "option_names": header["option_names"],
+               "option_types": header["option_types"],
+               "files": header["files"],
+               "options": arrays[:options_len],
+               "file": arrays[options_len],
+               "group": arrays[options_len + 1],
+               "first": arrays[options_len + 2]}
+
+    return columns, header["extra"]
+
+
+def query_rows(columns, group_idx=None, file_idx=None, where=()):
+    """generator function that yields the rows that match all conditions
+
+    :param columns: column store, see new_columns
+
+    :param group_idx: group index or None for every group
+
+    :param file_idx: input file index or None for every file
+
+    :param where: list of (option index, setting index) pairs
+
+    :yield: row index
+    """
+
+    for row in range(row_count(columns)):
+        if group_idx is not None and columns["group"][row] != group_idx:
+            continue
+        if file_idx is not None and columns["file"][row] != file_idx:
+            continue
+        if all(columns["options"][option_idx][row] == setting_idx
+               for option_idx, setting_idx in where):
+            yield row
+
+
+def option_index(columns, name):
+    try:
+        return columns["option_names"].index(name)
+    except ValueError:
+        raise Exception("unknown option: %s" % name)
+
+
+def setting_index(columns, option_idx, setting):
+    settings = columns["option_settings"][columns["option_types"][option_idx]]
+    for idx, value in enumerate(settings):
+        if str(value) == setting:
+            return idx
+
+    raise Exception("unknown setting of %s: %s"
+                    % (columns["option_names"][option_idx], setting))
+
+
+def main(flags):
+    columns, extra = load_columns(flags.file)
+
+    where = []
+    for condition in flags.where:
+        name, _, setting = condition.partition('=')
+        option_idx = option_index(columns, name)
+        where.append((option_idx, setting_index(columns, option_idx,
+                                                setting)))
+
+    rows = query_rows(columns, flags.group, flags.file_idx, where)
+
+    # settings of a single option with their amount of rows
+    if flags.option:
+        option_idx = option_index(columns, flags.option)
+        settings = columns["option_settings"][
+            columns["option_types"][option_idx]]
+        counts = [0] * len(settings)
+        for row in rows:
+            counts[columns["options"][option_idx][row]] += 1
+
+        for setting, count in zip(settings, counts):
+            if count:
+                print("%s = %s: %d" % (flags.option, setting, count))
+        return 0
+
+    print("# group - file: %s" % " - ".join(columns["option_names"]))
+    for row in rows:
+        print("%d - %d: %s" % (columns["group"][row], columns["file"][row],
+                               " - ".join(str(s)
+                                          for s in row_settings(columns, row))))
+
+    return 0
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Queries the combination groups file that is written by "
+                    "gen_config_combinations_uniq_output.py.")
+
+    arg_parser.add_argument(
+        'file',
+        metavar='<path>',
+        type=str,
+        help='The combination groups file.'
+    )
+    arg_parser.add_argument(
+        '-g', '--group',
+        metavar='<nr>',
+        type=int,
+        default=None,
+        help='Only rows of this output group.'
+    )
+    arg_parser.add_argument(
+        '-f', '--file-idx',
+        metavar='<nr>',
+        type=int,
+        default=None,
+        help='Only rows of this input file index.'
+    )
+    arg_parser.add_argument(
+        '-w', '--where',
+        metavar='<option=setting>',
+        nargs='+',
+        default=[],
+        help='Only rows with these option settings.'
+    )
+    arg_parser.add_argument(
+        '-o', '--option',
+        metavar='<name>',
+        type=str,
+        default=None,
+        help='Print only the settings of this option that occur in the '
+             'matching rows and their amount.'
+    )
+
+    try:
+        sys_exit(main(arg_parser.parse_args()))
+    except Exception as e:
+        print(e, file=stderr)
+        sys_exit(1)
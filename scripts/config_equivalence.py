@@ -0,0 +1,294 @@
+#!/usr/bin/python
+"""
+config_equivalence.py
+
+finds configs in tests/config that are interchangeable: every input of a
+language is formatted with every config that is used for that language, and
+configs that produce byte identical output on all inputs they are paired with
+are proposed to be merged.
+
+The amount of Uncrustify runs is (configs x inputs) per language.
+
+:license: GPL v2+
+"""
+
+from __future__ import print_function  # python >= 2.6
+import argparse
+
+from os import chdir, path
+from glob import glob
+from hashlib import blake2b
+from json import dump as json_dump
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool
+from sys import exit as sys_exit, stderr
+
+from auto_reduce import parse_test_file
+from option_reducer import uncrustify
+
+FLAGS = None
+
+# binary, config and input paths, installed once per worker by init_worker()
+WORKER_STATE = {}
+
+
+def init_worker(unc_bin_path, config_files, input_files, langs):
+    """
+    pool initializer, see output_digest()
+
+    accesses global var(s): WORKER_STATE
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param unc_bin_path: str
+        path to the Uncrustify binary
+
+    :param config_files: list< str >
+        paths of all configs
+
+    :param input_files: list< str >
+        paths of all input files
+
+    :param langs: list< str / None >
+        Uncrustifys -l argument for each input file
+    """
+    WORKER_STATE.update(unc_bin_path=unc_bin_path, config_files=config_files,
+                        input_files=input_files, langs=langs)
+
+
+def output_digest(args):
+    """
+    formats an input file with a config file
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param args: tuple< int, int >
+        this function is intended to be called by multiprocessing.pool.map(),
+        the index of the config and the index of the input file
+
+
+    :return: tuple< int, int, str / None >
+    ----------------------------------------------------------------------------
+        the indices and the BLAKE2 digest of the output, None if Uncrustify
+        failed
+    """
+    config_idx, input_idx = args
+
+    output = uncrustify(WORKER_STATE["unc_bin_path"],
+                        WORKER_STATE["config_files"][config_idx],
+                        WORKER_STATE["input_files"][input_idx],
+                        WORKER_STATE["langs"][input_idx])
+    if output is None:
+        return config_idx, input_idx, None
+
+    return config_idx, input_idx, blake2b(output, digest_size=16).hexdigest()
+
+
+def collect_tests(test_dir, languages=None):
+    """
+    reads all .test files and groups the tests by language
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param test_dir: str
+        the directory that contains the .test files
+
+    :param languages: list< str > / None
+        only the input directories in this list are used if provided
+
+
+    :return: dict< tuple< str, str / None >, dict< str, set< str > > >
+    ----------------------------------------------------------------------------
+        key: input directory and Uncrustify -l argument,
+        value: dict of config names to the set of input files they are used
+        with
+    """
+    tests = {}
+
+    for test_file in sorted(glob(path.join(test_dir, "*.test"))):
+        for idx, cfg, file_path, lang in parse_test_file(test_file):
+            lang_dir = file_path.split('/', 1)[0]
+            if languages and lang_dir not in languages:
+                continue
+
+            configs = tests.setdefault((lang_dir, lang), {})
+            configs.setdefault(cfg, set()).add(file_path)
+
+    return tests
+
+
+def cluster_configs(configs, digests):
+    """
+    greedily groups configs so that all configs of a group produce the same
+    output on every input that one of them is used with
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param configs: dict< str, set< str > >
+        config names to the set of input files they are used with
+
+    :param digests: dict< tuple< str, str >, str / None >
+        output digests, key: config name and input file
+
+
+    :return: list< list< str > >
+    ----------------------------------------------------------------------------
+        the groups, the config that is used with the most inputs first
+    """
+    order = sorted(configs, key=lambda cfg: (-len(configs[cfg]), cfg))
+    clusters = []
+
+    for cfg in order:
+        for cluster in clusters:
+            members = cluster[0]
+            inputs = cluster[1] | configs[cfg]
+
+            if all(digests[(cfg, i)] is not None
+                   and digests[(cfg, i)] == digests[(member, i)]
+                   for member in members for i in inputs):
+                members.append(cfg)
+                cluster[1] = inputs
+                break
+        else:
+            clusters.append([[cfg], set(configs[cfg])])
+
+    return [members for members, inputs in clusters]
+
+
+def find_equivalences(tests, config_dir, input_dir):
+    """
+    formats every input of a language with every config of that language
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param tests: dict
+        see collect_tests()
+
+    :params config_dir, input_dir: str
+        the config and input subdirectories of the tests directory
+
+
+    :return: dict< tuple< str, str / None >, list< list< str > > >
+    ----------------------------------------------------------------------------
+        the clusters of every language, see cluster_configs()
+    """
+    tasks = []
+    for lang_key, configs in sorted(tests.items(),
+                                    key=lambda t: (t[0][0], t[0][1] or "")):
+        inputs = sorted(set(i for v in configs.values() for i in v))
+        print("%s%s: %d configs, %d inputs"
+              % (lang_key[0], "" if lang_key[1] is None
+                 else " (-l %s)" % lang_key[1], len(configs), len(inputs)),
+              file=stderr)
+
+        tasks.extend((cfg, i, lang_key[1]) for cfg in sorted(configs)
+                     for i in inputs)
+
+    config_names = sorted(set(cfg for cfg, i, lang in tasks))
+    input_keys = sorted(set((i, lang) for cfg, i, lang in tasks),
+                        key=lambda k: (k[0], k[1] or ""))
+    config_index = dict((cfg, idx) for idx, cfg in enumerate(config_names))
+    input_index = dict((key, idx) for idx, key in enumerate(input_keys))
+
+    init_args = (FLAGS.uncrustify_binary_path,
+                 [path.join(config_dir, cfg) for cfg in config_names],
+                 [path.join(input_dir, i) for i, lang in input_keys],
+                 [lang for i, lang in input_keys])
+
+    digests = {}
+    with Pool(processes=FLAGS.jobs, initializer=init_worker,
+              initargs=init_args) as pool:
+        for config_idx, input_idx, digest in pool.imap_unordered(
+                output_digest,
+                [(config_index[cfg], input_index[(i, lang)])
+                 for cfg, i, lang in tasks],
+                chunksize=max(1, len(tasks) // (4 * FLAGS.jobs))):
+            i, lang = input_keys[input_idx]
+            digests[(config_names[config_idx], i, lang)] = digest
+
+    clusters = {}
+    for lang_key, configs in tests.items():
+        lang_digests = dict(((cfg, i), digest)
+                            for (cfg, i, lang), digest in digests.items()
+                            if lang == lang_key[1])
+        clusters[lang_key] = cluster_configs(configs, lang_digests)
+
+    return clusters
+
+
+def main():
+    root_dir = path.dirname(path.dirname(path.abspath(__file__)))
+    test_dir = path.join(root_dir, "tests")
+    config_dir = path.join(test_dir, "config")
+    input_dir = path.join(test_dir, "input")
+
+    unc_bin_path = path.abspath(FLAGS.uncrustify_binary_path)
+    FLAGS.uncrustify_binary_path = unc_bin_path
+    chdir(test_dir)
+
+    tests = collect_tests(test_dir, FLAGS.language)
+    clusters = find_equivalences(tests, config_dir, input_dir)
+
+    proposals = []
+    for lang_key in sorted(clusters, key=lambda k: (k[0], k[1] or "")):
+        for cluster in clusters[lang_key]:
+            if len(cluster) > 1:
+                proposals.append({"language": lang_key[0],
+                                  "lang": lang_key[1],
+                                  "keep": cluster[0],
+                                  "merge": cluster[1:]})
+
+    for proposal in proposals:
+        print("%s: keep %s, merge %s"
+              % (proposal["language"], proposal["keep"],
+                 ", ".join(proposal["merge"])))
+    print("%d configs can be merged into others"
+          % sum(len(p["merge"]) for p in proposals))
+
+    if FLAGS.output:
+        with open(FLAGS.output, 'w') as f:
+            json_dump(proposals, f, indent=1)
+
+    return 0
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument(
+        '-b', '--uncrustify_binary_path',
+        metavar='<path>',
+        type=str,
+        default="../build/uncrustify",
+        help='The Uncrustify binary file path.'
+    )
+    arg_parser.add_argument(
+        '-j', '--jobs',
+        metavar='<nr>',
+        type=int,
+        default=cpu_count(),
+        help='Number of concurrent jobs.'
+    )
+    arg_parser.add_argument(
+        '-l', '--language',
+        metavar='<dir>',
+        nargs='+',
+        default=None,
+        help="Only check the tests whose inputs are in these 'tests/input/' "
+             "subdirectories."
+    )
+    arg_parser.add_argument(
+        '-o', '--output',
+        metavar='<path>',
+        type=str,
+        default=None,
+        help='JSON file into which the merge proposals are written.'
+    )
+
+    FLAGS = arg_parser.parse_args()
+    sys_exit(main())
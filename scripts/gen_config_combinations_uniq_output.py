@@ -1,11 +1,27 @@
 from __future__ import print_function  # python >= 2.6
-from os import makedirs, path, listdir, rename, remove
-from subprocess import Popen
-from filecmp import cmp
-from glob import iglob
-from shutil import rmtree
-from json import loads as json_loads, dump as json_dump
-from sys import stderr, argv, path as sys_path
+from os import makedirs, path, listdir, rename, remove, name as os_name, \
+    open as os_open, close as os_close, replace as os_replace, utime, \
+    getpid, link, O_CREAT, O_EXCL, O_WRONLY
+from socket import gethostname
+from time import sleep, time
+from subprocess import Popen, PIPE
+from hashlib import blake2b
+from itertools import islice, combinations
+from random import Random
+from math import exp, log, sqrt
+from difflib import SequenceMatcher
+from shutil import rmtree, copyfile
+from json import loads as json_loads, dumps as json_dumps, \
+    dump as json_dump
+from sys import stderr, argv, maxsize, path as sys_path
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool
+
+from option_graph import load_graph, interaction_groups
+from result_store import load_store, save_store, file_digest, result_key, \
+    lookup_result, add_result, read_output
+from combination_groups import new_columns, append_row, save_columns, \
+    group_count, group_file_order, group_sizes, row_combination, row_settings
 
 """
 gen_config_combinations_uniq_output.py
@@ -14,13 +30,37 @@ Creates from a given set of options all possible option settings
 combinations, formats files with those and displays how much non equal
 formatted outputs have been created.
 
+The combinations are passed to Uncrustify with --set, only one formatted file
+per group of equal outputs is written into 'out_dir'. The groups are saved in
+a compact column form as 'out_dir'/out.cols, see combination_groups.py.
+
 Expects arg1 to be a filepath to a json config file
   (see config example below)
 
+With a 'queue_dir' the process is a coordinator that splits the combinations
+into chunks, the chunks are formatted by workers that can run on other hosts
+with access to the same paths:
+  gen_config_combinations_uniq_output.py --worker <queue_dir>
+A restarted coordinator with the same config continues the existing queue and
+keeps the results that the workers have already written.
+
 :author:  Daniel Chumak
 :license: GPL v2+
 """
 
+NULL_DEV = "/dev/null" if os_name != "nt" else "nul"
+
+# amount of combinations that a pool process takes at once
+FORMAT_CHUNK_SIZE = 16
+
+# see gen_combinations
+SAMPLING_MODES = ("full", "pairwise", "t-wise", "random")
+# amount of random rows that are tried per covering array row
+COVERING_CANDIDATES = 50
+
+# seconds between the checks of the queue directory
+QUEUE_POLL_INTERVAL = 0.5
+
 
 # config = {
 #     "option_settings": {
@@ -43,8 +83,20 @@ Expects arg1 to be a filepath to a json config file
 #     "in_files": ["./t.cpp", "./t2.cpp"],
 #     "unc_bin": "../build/uncrustify",
 #     "cleanup_lvl": 2,
+#     "link_outputs": false,
 #     "force_cleanup": false,
-#     "json_output": false
+#     "json_output": false,
+#     "jobs": 4,
+#     "factorize": false,
+#     "option_graph": "../tests/option_graph.json",
+#     "sampling": "full",
+#     "strength": 2,
+#     "samples": 1000,
+#     "seed": 0,
+#     "result_store": "./result_store",
+#     "queue_dir": null,
+#     "queue_chunk_size": 256,
+#     "lease_timeout": 60
 # }
 #
 
@@ -89,115 +141,618 @@ def len_index_combinations(max_indices):
                 accu[pos] += 1
 
 
-def write_config_files(config):
-    """Writes a configuration file for each possible combination of 'option'
-       settings
+def combination_settings(config, combination):
+    """Maps a combination of setting indices to the option settings
 
     :param config: configuration object, expects that it was processed by
                    check_config
+
+    :param combination: list of setting indices, one per option
+
+    :return: list of (option name, setting) tuples
     """
 
-    options_len = len(config["options"])
+    settings = []
+    for i in range(len(combination)):
+        option_name = config["options"][i]["name"]
+        option_type = config["options"][i]["type"]
+        settings.append((option_name,
+                         config["option_settings"][option_type][
+                             combination[i]]))
 
-    # populate len_options with amount of settings for the types of each option
-    len_options = [0] * options_len
-    for i in range(options_len):
-        option_setting = config["options"][i]["type"]
-        len_options[i] = len(config["option_settings"][option_setting])
-
-    # write configuration files, one per possible combination
-    for combination in len_index_combinations(len_options):
-        len_indices = len(combination)
-
-        # generate output filepath
-        file_path = config['out_dir'] + "/"
-        for i in range(len_indices):
-            option_name = config["options"][i]["name"]
-            file_path += ("%s__" % option_name)
-        for i in range(len_indices):
-            option_type = config["options"][i]["type"]
-            option_setting = combination[i]
-            file_path += ("%d__" % option_setting)
-        file_path += "unc.cfg"
-
-        # write configuration file
-        with open(file_path, 'w') as f:
-            for i in range(len_indices):
-                option_name = config["options"][i]["name"]
-                option_type = config["options"][i]["type"]
-                option_setting = config["option_settings"][option_type][
-                    combination[i]]
-
-                f.write("%s = %s\n" % (option_name, option_setting))
+    return settings
 
 
-def gen_equal_output_map(config):
-    """Formats 'in_files' with configs inside the 'out_dir' with Uncrustify and
-       groups formatted files with equal content together.
-       Expects config filename format generated by write_config_files
+def combination_file_path(config, combination, in_file_idx):
+    """Generates the path of the formatted file of a combination
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param combination: list of setting indices, one per option
+
+    :param in_file_idx: index of the input file
+
+    :return: path inside of 'out_dir'
+    """
+
+    file_path = config['out_dir'] + "/"
+    for option in config["options"]:
+        file_path += ("%s__" % option["name"])
+    for option_setting in combination:
+        file_path += ("%d__" % option_setting)
+    file_path += ("%d" % in_file_idx)
+
+    return file_path
+
+
+def format_file(args):
+    """Formats a file with Uncrustify and captures its output, intended to be
+       called by multiprocessing.pool.imap().
+       The option settings are passed with --set, no config file is needed.
+
+    :param args: tuple of the Uncrustify binary path, the list of
+                 (option name, setting) tuples, the input file path, the
+                 combination and the input file index
+
+    :return: tuple of the combination, the input file index, the BLAKE2 digest
+             of the output and the output, digest and output are None if
+             Uncrustify failed
+    """
+
+    unc_bin, settings, in_file, combination, in_file_idx = args
+
+    proc_args = [unc_bin, "-q", "-c", NULL_DEV]
+    for option_name, option_setting in settings:
+        proc_args.extend(("--set", "%s=%s" % (option_name, option_setting)))
+    proc_args.extend(("-f", in_file))
+
+    proc = Popen(proc_args, stdout=PIPE)
+    output, _ = proc.communicate()
+    if proc.returncode != 0:
+        return combination, in_file_idx, None, None
+
+    return combination, in_file_idx, blake2b(output).digest(), output
+
+
+def option_defaults(unc_bin):
+    """Reads the default settings of all options from Uncrustify
+
+    :param unc_bin: path to the Uncrustify binary
+
+    :return: dict of option names to their lower case default setting, empty
+             if Uncrustify failed
+    """
+
+    proc = Popen([unc_bin, "-c", NULL_DEV, "--update-config"], stdout=PIPE,
+                 stderr=PIPE)
+    output, _ = proc.communicate()
+    if proc.returncode != 0:
+        return {}
+
+    defaults = {}
+    for line in output.decode("UTF-8", "replace").splitlines():
+        option_name, sep, value = line.partition('=')
+        if sep and not line.startswith('#'):
+            defaults[option_name.strip()] = value.split('#', 1)[0].strip() \
+                .lower()
+
+    return defaults
+
+
+def normalized_assignment(settings, defaults):
+    """Sorted option -> setting assignment without the options that are set
+       to their default, equal assignments format equally, independent of the
+       option list they were generated from
+
+    :param settings: list of (option name, setting) tuples
+
+    :param defaults: dict generated by option_defaults
+
+    :return: sorted list of (option name, setting str) tuples
+    """
+
+    return sorted((option_name, str(option_setting))
+                  for option_name, option_setting in settings
+                  if str(option_setting).lower() != defaults.get(option_name))
+
+
+def option_lengths(config):
+    """Amount of settings of every option
 
     :param config: configuration object, expects that it was processed by
                    check_config
-    :return: dict of files with equal content
-                     key   -- group index
-                     value -- filepath list
+
+    :return: list of ints
     """
 
-    # maps that will hold configurations that produce the same formatted files
-    equal_output_map = {}
-    # map len counter
-    map_val_idx = 0
+    return [len(config["option_settings"][option["type"]])
+            for option in config["options"]]
+
+
+def combination_count(len_options):
+    """Amount of combinations of the full product
+
+    :param len_options: amount of settings of every option
+
+    :return: int
+    """
+
+    count = 1
+    for len_option in len_options:
+        count *= len_option
+    return count
+
+
+def gen_random_combinations(len_options, samples, seed):
+    """generator function that yields a seeded random sample of the
+       combinations without repetitions, in the order of
+       len_index_combinations
+
+    :param len_options: amount of settings of every option
+
+    :param samples: amount of combinations, capped by the full product
+
+    :param seed: seed of the random generator
+
+    :yield: combination tuple
+    """
+
+    count = combination_count(len_options)
+    samples = min(samples, count)
+    rng = Random(seed)
+
+    # sample() needs len(range(count)), which overflows above sys.maxsize,
+    # such products are far larger than any sample so redraws are rare
+    if count <= maxsize:
+        indices = rng.sample(range(count), samples)
+    else:
+        indices = set()
+        while len(indices) < samples:
+            indices.add(rng.randrange(count))
+    indices = sorted(indices)
+
+    for index in indices:
+        combination = [0] * len(len_options)
+        # mixed radix, the last option changes fastest
+        for pos in range(len(len_options) - 1, -1, -1):
+            index, combination[pos] = divmod(index, len_options[pos])
+        yield tuple(combination)
+
+
+def gen_covering_array(len_options, strength, seed,
+                       candidates=COVERING_CANDIDATES):
+    """generator function that yields the rows of a covering array: every
+       combination of settings of every `strength` options appears in at least
+       one row.
+       Rows are built greedily (AETG like): each row starts with the smallest
+       uncovered tuple, the remaining settings are chosen out of `candidates`
+       seeded random rows so that the most uncovered tuples are covered.
+
+    :param len_options: amount of settings of every option
+
+    :param strength: amount of options whose settings combinations are covered
+
+    :param seed: seed of the random generator
+
+    :param candidates: amount of random rows that are tried per row
+
+    :yield: combination tuple
+    """
+
+    rng = Random(seed)
+    options_len = len(len_options)
+    strength = min(strength, options_len)
+    column_sets = list(combinations(range(options_len), strength))
+
+    uncovered = set()
+    for columns in column_sets:
+        for values in len_index_combinations([len_options[c]
+                                              for c in columns]):
+            uncovered.add((columns, tuple(values)))
+
+    def covered_by(row):
+        return [(columns, tuple(row[c] for c in columns))
+                for columns in column_sets
+                if (columns, tuple(row[c] for c in columns)) in uncovered]
+
+    while uncovered:
+        columns, values = min(uncovered)
+
+        best_row = None
+        best_covered = None
+        for _ in range(candidates):
+            row = [rng.randrange(n) for n in len_options]
+            for c, v in zip(columns, values):
+                row[c] = v
+
+            row_covered = covered_by(row)
+            if best_covered is None or len(row_covered) > len(best_covered):
+                best_row, best_covered = row, row_covered
+
+        uncovered.difference_update(best_covered)
+        yield tuple(best_row)
+
+
+def gen_combinations(config):
+    """generator function that yields the combinations that are formatted,
+       depending on the 'sampling' mode: the full product, a covering array
+       ('pairwise', 't-wise') or a random sample ('random')
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :yield: combination tuple
+    """
+
+    len_options = option_lengths(config)
+    sampling = config["sampling"]
+
+    if sampling == "full":
+        for combination in len_index_combinations(len_options):
+            # len_index_combinations reuses its list
+            yield tuple(combination)
+    elif sampling == "random":
+        for combination in gen_random_combinations(
+                len_options, config["samples"], config["seed"]):
+            yield combination
+    else:
+        strength = 2 if sampling == "pairwise" else config["strength"]
+        for combination in gen_covering_array(len_options, strength,
+                                              config["seed"]):
+            yield combination
+
+
+def estimate_group_count(group_sizes, total):
+    """Estimates the amount of distinct outputs of the full product from a
+       sample with the bias corrected Chao1 estimator and its log-normal 95%
+       confidence interval
+
+    :param group_sizes: amount of sampled combinations in every observed group
+
+    :param total: amount of combinations of the full product
+
+    :return: tuple of the estimate, the lower and the upper bound
+    """
+
+    observed = len(group_sizes)
+    f1 = sum(1 for size in group_sizes if size == 1)
+    f2 = sum(1 for size in group_sizes if size == 2)
+
+    unseen = f1 * (f1 - 1) / (2.0 * (f2 + 1))
+    if unseen <= 0:
+        return observed, observed, observed
+
+    variance = (unseen
+                + f1 * (2 * f1 - 1) ** 2 / (4.0 * (f2 + 1) ** 2)
+                + f1 ** 2 * f2 * (f1 - 1) ** 2 / (4.0 * (f2 + 1) ** 4))
+    k = exp(1.96 * sqrt(log(1 + variance / unseen ** 2)))
 
-    # iterate through all generated config file names
+    return (min(observed + unseen, total), observed + unseen / k,
+            min(observed + unseen * k, total))
 
-    for cfg_path in sorted(iglob('%s/*.cfg' % config["out_dir"])):
+
+def gen_format_tasks(config):
+    """generator function that streams the format_file arguments of every
+       (combination, input file) pair in a deterministic order
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :yield: format_file arguments
+    """
+
+    for combination in gen_combinations(config):
         for in_file_idx in range(len(config["in_files"])):
-            # extract substring form config gile name (removes __unc.cfg)
-            splits_file = cfg_path.split("__unc")
-            if len(splits_file) < 1:
-                raise Exception('split with "__unc" | Wrong split len: %d'
-                                % len(splits_file))
-
-            out_path = ("%s__%d" % (splits_file[0], in_file_idx))
-
-            # gen formatted files with uncrustify binary
-            proc = Popen([config["unc_bin"],
-                          "-c", cfg_path,
-                          "-f", config["in_files"][in_file_idx],
-                          "-o", out_path,
-                          ])
-            proc.wait()
-            if proc.returncode != 0:
+            yield format_args(config, combination, in_file_idx)
+
+
+def format_args(config, combination, in_file_idx):
+    """format_file arguments of a (combination, input file) pair
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param combination: tuple of setting indices
+
+    :param in_file_idx: index of the input file
+
+    :return: tuple
+    """
+
+    return (config["unc_bin"], combination_settings(config, combination),
+            config["in_files"][in_file_idx], combination, in_file_idx)
+
+
+def gen_chunks(iterable, size):
+    """generator function that splits an iterable into lists
+
+    :param iterable: the elements that are going to be split
+
+    :param size: max. amount of elements per list
+
+    :yield: list of at most size elements
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def gen_equal_output_map(config):
+    """Formats 'in_files' with every combination of 'option' settings with
+       Uncrustify and groups formatted files with equal content together.
+
+       The combinations are streamed to 'jobs' processes in chunks, the
+       results are grouped in the order of gen_format_tasks so that the group
+       numbering does not depend on the amount of processes.
+
+       Outputs are grouped by the digest of their content, only the first
+       file of every group is written to disk, see combination_file_path.
+
+       With a 'result_store' only the assignments that are not stored yet
+       are formatted, see result_store.py. With a 'queue_dir' the
+       combinations are formatted by queue workers, see gen_queue_results.
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+    :return: column store of the (combination, input file index, group index)
+             rows, see combination_groups.new_columns
+    """
+
+    # rows of the configurations that produce the same formatted files
+    columns = new_columns(config["option_settings"], config["options"],
+                          config["in_files"])
+    # group index of every output digest
+    digest_map = {}
+
+    pool = None
+    store = None
+    if config["queue_dir"]:
+        results = gen_queue_results(config)
+    else:
+        if config["result_store"]:
+            store = load_store(config["result_store"])
+        pool = Pool(processes=config["jobs"])
+        results = gen_pool_results(config, pool, store)
+
+    # cleanup_lvl 0 keeps an output per combination, see link_output
+    manifest = None
+    if config["cleanup_lvl"] == 0:
+        blobs_dir = path.join(config["out_dir"], "blobs")
+        if not path.isdir(blobs_dir):
+            makedirs(blobs_dir)
+        manifest = open(path.join(config["out_dir"], "manifest.txt"), 'w')
+
+    try:
+        for combination, in_file_idx, digest, output in results:
+            if digest is None:
+                continue
+
+            group_idx = digest_map.get(digest)
+            if group_idx is not None:
+                append_row(columns, combination, in_file_idx, group_idx)
+
+                if manifest is not None:
+                    link_output(config, manifest, combination, in_file_idx,
+                                digest)
                 continue
 
-            # populate 'equal_output_map' map
-            if len(equal_output_map) == 0:
-                equal_output_map[0] = [out_path]
-                map_val_idx += 1
+            # create new group, its first row is the representative
+            group_idx = len(digest_map)
+            digest_map[digest] = group_idx
+            append_row(columns, combination, in_file_idx, group_idx)
+
+            # stored and queued results come without their output
+            if output is None and store is not None:
+                output = read_output(store, digest)
+            elif output is None:
+                output = format_file(format_args(config, combination,
+                                                 in_file_idx))[3]
+
+            if manifest is None:
+                out_path = combination_file_path(config, combination,
+                                                 in_file_idx)
             else:
-                found_flag = False
-                for i in range(map_val_idx):
-                    # compare first file of group i with the generated file
-                    if cmp(equal_output_map[i][0], out_path):
-                        equal_output_map[i].append(out_path)
-                        found_flag = True
-                        break
-                # create new group if files do not match
-                if not found_flag:
-                    equal_output_map[map_val_idx] = [out_path]
-                    map_val_idx += 1
-
-    return equal_output_map
-
-
-def gen_output_dict(config, equal_output_map):
+                out_path = blob_path(config, digest)
+            with open(out_path, 'wb') as f:
+                f.write(output)
+
+            if manifest is not None:
+                link_output(config, manifest, combination, in_file_idx,
+                            digest, True)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if store is not None:
+            save_store(store)
+
+    return columns
+
+
+def blob_path(config, digest):
+    """Path of the content addressed blob of an output
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param digest: output digest, bytes or hex str
+
+    :return: path inside of 'out_dir'/blobs
+    """
+
+    if not isinstance(digest, str):
+        digest = digest.hex()
+    return path.join(config["out_dir"], "blobs", digest)
+
+
+def link_output(config, manifest, combination, in_file_idx, digest,
+                representative=False):
+    """Records the output of a combination as a manifest entry that points at
+       its blob. The representative of a group and, with 'link_outputs', every
+       combination is also shown as a hardlink to the blob under its
+       combination_file_path, so that all equal outputs share one inode.
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param manifest: opened 'out_dir'/manifest.txt, one
+                     "<combination file name> <blob name>" line per output
+
+    :param combination: tuple of setting indices
+
+    :param in_file_idx: index of the input file
+
+    :param digest: output digest, bytes or hex str
+
+    :param representative: True for the first output of a group
+    """
+
+    out_path = combination_file_path(config, combination, in_file_idx)
+    src_path = blob_path(config, digest)
+    manifest.write("%s %s\n" % (path.basename(out_path),
+                                path.basename(src_path)))
+
+    if not representative and not config["link_outputs"]:
+        return
+
+    if path.lexists(out_path):
+        remove(out_path)
+    try:
+        link(src_path, out_path)
+    except OSError:
+        copyfile(src_path, out_path)  # no hardlink support
+
+
+def gen_pool_results(config, pool, store=None):
+    """generator function that formats the combinations with a process pool
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param pool: process pool
+
+    :param store: store dict, see result_store.load_store, None to format
+                  every combination
+
+    :yield: format_file results in the order of gen_format_tasks
+    """
+
+    if store is not None:
+        binary_digest = file_digest(config["unc_bin"])
+        input_digests = [file_digest(f) for f in config["in_files"]]
+        defaults = option_defaults(config["unc_bin"])
+
+    # gen formatted files with uncrustify binary, a bounded amount of
+    # tasks is queued at a time
+    for chunk in gen_chunks(gen_format_tasks(config),
+                            config["jobs"] * FORMAT_CHUNK_SIZE * 4):
+        if store is None:
+            results = pool.imap(format_file, chunk,
+                                chunksize=FORMAT_CHUNK_SIZE)
+        else:
+            results = gen_stored_results(store, pool, chunk, binary_digest,
+                                         input_digests, defaults)
+
+        for result in results:
+            yield result
+
+
+def gen_stored_results(store, pool, chunk, binary_digest, input_digests,
+                       defaults):
+    """generator function that yields the format_file results of a chunk,
+       stored results are looked up, the others are formatted and stored
+
+    :param store: store dict, see result_store.load_store
+
+    :param pool: process pool
+
+    :param chunk: list of format_file arguments
+
+    :param binary_digest: content hash of the Uncrustify binary
+
+    :param input_digests: content hashes of the 'in_files'
+
+    :param defaults: dict generated by option_defaults
+
+    :yield: format_file results in the order of chunk, the digests are hex
+            strings, the outputs of stored results are None
+    """
+
+    keys = [result_key(binary_digest, input_digests[args[4]],
+                       normalized_assignment(args[1], defaults))
+            for args in chunk]
+    # equal keys are formatted once
+    missing = {}
+    for args, key in zip(chunk, keys):
+        if key not in missing and lookup_result(store, key) is None:
+            missing[key] = args
+    results = pool.imap(format_file, missing.values(),
+                        chunksize=FORMAT_CHUNK_SIZE)
+
+    for args, key in zip(chunk, keys):
+        digest = lookup_result(store, key)
+        if digest is None:
+            combination, in_file_idx, digest, output = next(results)
+            digest = "" if digest is None else digest.hex()
+            add_result(store, key, digest, output)
+        else:
+            combination, in_file_idx, output = args[3], args[4], None
+
+        yield combination, in_file_idx, digest or None, output
+
+
+def gen_estimates(config, columns):
+    """Estimates the amount of distinct outputs of the full product per file
+       if only a sample of the combinations was formatted. Only a random
+       sample supports the estimate, the rows of a covering array are not
+       drawn independently, for them only the observed groups are reported
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param columns: column store generated by gen_equal_output_map
+
+    :return: list of dicts, one per file, empty for the full product
+    """
+
+    if config["sampling"] == "full":
+        return []
+
+    total = combination_count(option_lengths(config))
+    estimates = []
+
+    for file_idx in range(len(config["in_files"])):
+        sizes = group_sizes(columns, file_idx)
+        estimate = {"sampled": sum(sizes),
+                    "total": total,
+                    "observed": len(sizes)}
+
+        if config["sampling"] == "random":
+            estimate["estimate"], estimate["lower"], estimate["upper"] = \
+                estimate_group_count(sizes, total)
+        estimates.append(estimate)
+
+    return estimates
+
+
+def gen_output_dict(config, columns, estimates=()):
     """Makes an output dict with the generated results.
 
     :param config: configuration object, expects that it was processed by
                    check_config
 
-    :param equal_output_map: dict of files with equal content,
-                             expects format generated by gen_equal_output_map
+    :param columns: column store generated by gen_equal_output_map
+
+    :param estimates: list generated by gen_estimates
     :return: output dict, format:
              copies objects option_settings, options and in_files (renamed as
              files) from the config object. Additionally has the object groups
@@ -210,6 +765,7 @@ def gen_output_dict(config, equal_output_map):
                                [settingIdx0, settingIdx1, ...],
                                [settingIdx0, settingIdx1, ...] ] ]
                          ]
+             and the object estimates if a sample was formatted
     """
 
     output_dict = {"option_settings": config["option_settings"],
@@ -217,45 +773,361 @@ def gen_output_dict(config, equal_output_map):
                    "files": config["in_files"],
                    "groups": []}
 
-    options_len = len(output_dict["options"])
     files_len = len(output_dict["files"])
+    order, starts = group_file_order(columns)
 
-    for key in equal_output_map:
+    for group_idx in range(group_count(columns)):
         group_dict = []
-        for file_arr_idx in range(files_len):
-            group_dict.append([])
+        for file_idx in range(files_len):
+            bucket = group_idx * files_len + file_idx
+            group_dict.append([list(row_combination(columns, row))
+                               for row in order[starts[bucket]:
+                                                starts[bucket + 1]]])
 
-        for list_value in equal_output_map[key]:
-            split = list_value.rsplit("/", 1)
-            split = split[len(split) - 1].split("__")
-            split_len = len(split)
+        output_dict["groups"].append(group_dict)
 
-            # n option names + n option values + file idx
-            if split_len < options_len * 2 + 1:
-                print(" wrong split len on  %s\n" % list_value, file=stderr)
-                continue
+    if estimates:
+        output_dict["estimates"] = list(estimates)
 
-            file_idx = int(split[split_len - 1])
-            file_combinations = [int(i) for i in split[options_len:split_len-1]]
+    return output_dict
 
-            group_dict[file_idx].append(file_combinations)
 
-        output_dict["groups"].append(group_dict)
+def write_output_dict_pretty(columns, out_path, estimates=()):
+    """pretty prints the generated results into a file, row by row
+
+    :param columns: column store generated by gen_equal_output_map
+
+    :param out_path: output filepath
+
+    :param estimates: list generated by gen_estimates
+    """
+
+    files_len = len(columns["files"])
+    order, starts = group_file_order(columns)
+
+    with open(out_path, 'w') as f:
+
+        f.write("Files:\n")
+        for in_file_idx in range(files_len):
+            f.write("    %d: %s\n" % (in_file_idx,
+                                      columns["files"][in_file_idx]))
+
+        f.write("\nOptions:\n")
+        for option_idx, option_name in enumerate(columns["option_names"]):
+            f.write("    %d: %s\n" % (option_idx, option_name))
+        f.write("\n\n")
+
+        for group_idx in range(group_count(columns)):
+            f.write("Group: %d\n" % group_idx)
+
+            for file_idx in range(files_len):
+                bucket = group_idx * files_len + file_idx
+
+                for row in order[starts[bucket]:starts[bucket + 1]]:
+                    f.write("    (%s: %s)\n" % (
+                        file_idx,
+                        " - ".join(str(s) for s in row_settings(columns,
+                                                                 row))))
+            f.write("\n")
+
+        for file_idx, estimate in enumerate(estimates):
+            f.write("File %d: %d of %d combinations sampled, %d groups "
+                    "observed" % (file_idx, estimate["sampled"],
+                                  estimate["total"], estimate["observed"]))
+            if "estimate" in estimate:
+                f.write(", estimated %.1f groups (95%% CI %.1f - %.1f)"
+                        % (estimate["estimate"], estimate["lower"],
+                           estimate["upper"]))
+            f.write("\n")
+
+
+def changed_ranges(base_lines, lines):
+    """Calculates which lines of a base output are changed in another output
+
+    :param base_lines: list of lines of the base output
+
+    :param lines: list of lines of the other output, None if Uncrustify failed
+
+    :return: list of (start, end, replacement lines) tuples in base line
+             coordinates, a failed output changes the whole base output
+    """
+
+    if lines is None:
+        return [(0, len(base_lines) + 1, None)]
+
+    matcher = SequenceMatcher(None, base_lines, lines, autojunk=False)
+    return [(i1, i2, lines[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def ranges_overlap(ranges_a, ranges_b):
+    """Checks if two sets of changes touch the same or adjacent base lines
+
+    :param ranges_a: list of changed_ranges tuples
+
+    :param ranges_b: list of changed_ranges tuples
+
+    :return: True if the changes can not be composed line-wise
+    """
+
+    for a1, a2, _ in ranges_a:
+        for b1, b2, _ in ranges_b:
+            # a change in between two lines is adjacent to both of them
+            if a1 <= b2 and b1 <= a2:
+                return True
+    return False
+
+
+def compose_changes(base_lines, *ranges_lists):
+    """Applies non overlapping changes to a base output
+
+    :param base_lines: list of lines of the base output
+
+    :param ranges_lists: lists of changed_ranges tuples
+
+    :return: list of lines
+    """
+
+    lines = list(base_lines)
+    changes = sorted((c for ranges in ranges_lists for c in ranges),
+                     key=lambda c: (c[0], c[1]), reverse=True)
+    for i1, i2, replacement in changes:
+        lines[i1:i2] = replacement
+
+    return lines
+
+
+def output_lines(output):
+    """Splits an Uncrustify output into lines
+
+    :param output: bytes or None
+
+    :return: list of lines (including line endings) or None
+    """
+
+    if output is None:
+        return None
+    return output.decode("UTF-8", "replace").splitlines(True)
+
+
+def run_combinations(config, pool, combinations):
+    """Formats all 'in_files' with a list of combinations
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param pool: process pool
+
+    :param combinations: list of combinations (tuples of setting indices)
+
+    :return: dict, key: (combination, input file index),
+                   value: (digest, output), both None if Uncrustify failed
+    """
+
+    tasks = []
+    for combination in combinations:
+        settings = combination_settings(config, combination)
+        for in_file_idx in range(len(config["in_files"])):
+            tasks.append((config["unc_bin"], settings,
+                          config["in_files"][in_file_idx], combination,
+                          in_file_idx))
+
+    results = {}
+    for combination, in_file_idx, digest, output in pool.imap(
+            format_file, tasks, chunksize=FORMAT_CHUNK_SIZE):
+        results[(combination, in_file_idx)] = (digest, output)
+
+    return results
+
+
+def find_option_clusters(config, pool):
+    """Splits the options into clusters of interacting options.
+
+       Every option is probed on its own against a base combination (all
+       options at their first setting). Two options interact if their changes
+       touch the same or adjacent lines of one of the base outputs, or if a
+       probe of both options together (each at its last setting) differs from
+       the line-wise composition of their single probes. Options that the
+       optional 'option_graph' (see option_graph.py) links are put into the
+       same cluster as well.
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :param pool: process pool
+
+    :return: list of clusters, each cluster is a sorted list of option indices
+    """
+
+    options = config["options"]
+    options_len = len(options)
+    files_len = len(config["in_files"])
+    len_options = [len(config["option_settings"][o["type"]]) for o in options]
+    base = (0,) * options_len
+
+    def with_settings(*settings):
+        combination = list(base)
+        for option_idx, setting_idx in settings:
+            combination[option_idx] = setting_idx
+        return tuple(combination)
+
+    # single option probes
+    probes = [with_settings((i, v)) for i in range(options_len)
+              for v in range(1, len_options[i])]
+    results = run_combinations(config, pool, [base] + probes)
+
+    base_lines = [output_lines(results[(base, f)][1]) for f in range(files_len)]
+    if None in base_lines:
+        raise Exception("Uncrustify failed with the base combination")
+
+    # changes of every option (all its settings) in base line coordinates
+    option_ranges = [[[] for f in range(files_len)]
+                     for i in range(options_len)]
+    last_ranges = [[[] for f in range(files_len)]
+                   for i in range(options_len)]
+    for i in range(options_len):
+        for v in range(1, len_options[i]):
+            for f in range(files_len):
+                ranges = changed_ranges(
+                    base_lines[f],
+                    output_lines(results[(with_settings((i, v)), f)][1]))
+                option_ranges[i][f].extend(ranges)
+                if v == len_options[i] - 1:
+                    last_ranges[i][f] = ranges
+
+    # union-find over the option indices
+    parents = list(range(options_len))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    def union(i, j):
+        parents[find(i)] = find(j)
+
+    pair_probes = []
+    for i in range(options_len):
+        for j in range(i + 1, options_len):
+            if any(ranges_overlap(option_ranges[i][f], option_ranges[j][f])
+                   for f in range(files_len)):
+                union(i, j)
+            else:
+                pair_probes.append((i, j))
+
+    # options that do not touch the same lines still have to compose
+    pair_combinations = [with_settings((i, len_options[i] - 1),
+                                       (j, len_options[j] - 1))
+                         for i, j in pair_probes]
+    pair_results = run_combinations(config, pool, pair_combinations)
+    for (i, j), combination in zip(pair_probes, pair_combinations):
+        for f in range(files_len):
+            lines = output_lines(pair_results[(combination, f)][1])
+            if lines != compose_changes(base_lines[f], last_ranges[i][f],
+                                        last_ranges[j][f]):
+                union(i, j)
+                break
+
+    if config["option_graph"]:
+        graph = load_graph(config["option_graph"])
+        name_index = dict((o["name"], i) for i, o in enumerate(options))
+        for group in interaction_groups(graph, list(name_index)):
+            for name in group[1:]:
+                union(name_index[group[0]], name_index[name])
+
+    clusters = {}
+    for i in range(options_len):
+        clusters.setdefault(find(i), []).append(i)
+
+    return sorted(clusters.values())
+
+
+def gen_factorized_output_dict(config):
+    """Enumerates the option settings combinations only inside of the
+       clusters of interacting options (see find_option_clusters), the
+       options of the other clusters stay at their first setting.
+       Assuming that the clusters are independent, the amount of distinct
+       outputs of a file is the product of the amount of distinct outputs
+       of every cluster.
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :return: output dict, format:
+             copies objects option_settings, options and in_files (renamed as
+             files) from the config object. Additionally has the objects
+                clusters = [ [optionIdx0, optionIdx1, ...], ... ]
+                cluster_groups = [ fileIdx0[ clusterIdx0[ group0[
+                                       [settingIdx0, settingIdx1, ...], ...
+                                   ] ] ] ]
+                    with one setting index per option of the cluster
+                group_counts = [ fileIdx0 total groups, ... ]
+    """
+
+    options = config["options"]
+    files_len = len(config["in_files"])
+    len_options = [len(config["option_settings"][o["type"]]) for o in options]
+
+    output_dict = {"option_settings": config["option_settings"],
+                   "options": options,
+                   "files": config["in_files"],
+                   "clusters": [],
+                   "cluster_groups": [[] for f in range(files_len)],
+                   "group_counts": [1] * files_len}
+
+    pool = Pool(processes=config["jobs"])
+    try:
+        clusters = find_option_clusters(config, pool)
+        output_dict["clusters"] = clusters
+
+        for cluster in clusters:
+            cluster_combinations = []
+            for cluster_combination in len_index_combinations(
+                    [len_options[i] for i in cluster]):
+                combination = [0] * len(options)
+                for i, setting_idx in zip(cluster, cluster_combination):
+                    combination[i] = setting_idx
+                cluster_combinations.append((tuple(cluster_combination),
+                                             tuple(combination)))
+
+            results = run_combinations(config, pool,
+                                       [c for _, c in cluster_combinations])
+
+            for f in range(files_len):
+                # group index of every output digest
+                digest_map = {}
+                groups = []
+                for cluster_combination, combination in cluster_combinations:
+                    digest = results[(combination, f)][0]
+                    if digest is None:
+                        continue
+
+                    if digest not in digest_map:
+                        digest_map[digest] = len(groups)
+                        groups.append([])
+                    groups[digest_map[digest]].append(
+                        list(cluster_combination))
+
+                output_dict["cluster_groups"][f].append(groups)
+                output_dict["group_counts"][f] *= len(groups)
+    finally:
+        pool.close()
+        pool.join()
 
     return output_dict
 
 
-def write_output_dict_pretty(out_dict, out_path):
-    """pretty prints the output dict into a file
+def write_factorized_output_dict_pretty(out_dict, out_path):
+    """pretty prints the factorized output dict into a file
 
     :param out_dict: dict that will be printed, expects format generated by
-                     gen_output_dict
+                     gen_factorized_output_dict
 
     :param out_path: output filepath
     """
 
-    group_id = 0
-    options_len = len(out_dict["options"])
+    options = out_dict["options"]
 
     with open(out_path, 'w') as f:
 
@@ -265,30 +1137,242 @@ def write_output_dict_pretty(out_dict, out_path):
                                       out_dict["files"][in_file_idx]))
 
         f.write("\nOptions:\n")
-        for option_idx in range(options_len):
-            f.write("    %d: %s\n" % (option_idx,
-                                      out_dict["options"][option_idx]["name"]))
+        for option_idx in range(len(options)):
+            f.write("    %d: %s\n" % (option_idx, options[option_idx]["name"]))
+
+        f.write("\nClusters:\n")
+        for cluster_idx, cluster in enumerate(out_dict["clusters"]):
+            f.write("    %d: %s\n" % (cluster_idx,
+                                      ", ".join(options[i]["name"]
+                                                for i in cluster)))
         f.write("\n\n")
 
-        for group in out_dict["groups"]:
-            f.write("Group: %d\n" % group_id)
-            group_id += 1
+        for file_idx, file_groups in enumerate(out_dict["cluster_groups"]):
+            f.write("File: %d, groups: %d\n"
+                    % (file_idx, out_dict["group_counts"][file_idx]))
+
+            for cluster_idx, groups in enumerate(file_groups):
+                cluster = out_dict["clusters"][cluster_idx]
+                f.write("    Cluster: %d, groups: %d\n"
+                        % (cluster_idx, len(groups)))
+
+                for group_id, group in enumerate(groups):
+                    for combinations in group:
+                        combination_strings = [
+                            str(out_dict["option_settings"][
+                                options[cluster[k]]["type"]][setting_idx])
+                            for k, setting_idx in enumerate(combinations)]
+                        f.write("        (%d: %s)\n"
+                                % (group_id, " - ".join(combination_strings)))
+            f.write("\n")
 
-            for file_idx in range(len(group)):
-                file = group[file_idx]
+        f.write("Total groups: %d\n" % sum(out_dict["group_counts"]))
 
-                for combinations in file:
-                    combination_strings = []
-                    for combination_idx in range(len(combinations)):
 
-                        combination_id = combinations[combination_idx]
-                        combination_string = out_dict["option_settings"][
-                                out_dict["options"][combination_idx]["type"]][
-                                            combination_id]
-                        combination_strings.append(str(combination_string))
-                    f.write("    (%s: %s)\n" % (file_idx,
-                                                " - ".join(combination_strings)))
-            f.write("\n")
+def queue_path(queue_dir, *names):
+    return path.join(queue_dir, *names)
+
+
+def write_atomic(file_path, obj, owner=""):
+    """Writes an object as json into a file so that readers never see a
+       partially written file
+
+    :param file_path: path to the file
+
+    :param obj: json serializable object
+
+    :param owner: makes the temporary file name unique per writer
+    """
+
+    tmp_path = "%s.%s.tmp" % (file_path, owner)
+    with open(tmp_path, 'w') as f:
+        json_dump(obj, f)
+    os_replace(tmp_path, file_path)
+
+
+def init_queue(config):
+    """Creates the work queue directory of a coordinator. A complete queue
+       of the same config is continued with its finished chunks, any other
+       former queue content is removed.
+       Layout: config.json, chunks/<nr>.json (lists of combinations),
+               queued (amount of chunks, written after the last chunk),
+               leases/<nr>, results/<nr>.json, done
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :return: amount of chunks
+    """
+
+    queue_dir = config["queue_dir"]
+    config_path = queue_path(queue_dir, "config.json")
+    queued_path = queue_path(queue_dir, "queued")
+
+    if path.exists(config_path) and path.exists(queued_path):
+        try:
+            same_config = (load_config(config_path)
+                           == json_loads(json_dumps(config)))
+            chunk_count = load_config(queued_path)
+        except ValueError:
+            same_config = False
+
+        if same_config:
+            # lets the workers continue
+            done_path = queue_path(queue_dir, "done")
+            if path.exists(done_path):
+                remove(done_path)
+            return chunk_count
+
+    if path.isdir(queue_dir):
+        rmtree(queue_dir)
+    for sub_dir in ("chunks", "leases", "results"):
+        makedirs(queue_path(queue_dir, sub_dir))
+
+    write_atomic(config_path, config)
+
+    chunk_count = 0
+    for chunk in gen_chunks(gen_combinations(config),
+                            config["queue_chunk_size"]):
+        write_atomic(queue_path(queue_dir, "chunks", "%d.json" % chunk_count),
+                     chunk)
+        chunk_count += 1
+
+    write_atomic(queued_path, chunk_count)
+    return chunk_count
+
+
+def gen_queue_results(config):
+    """generator function that splits the combinations into numbered chunks
+       inside of 'queue_dir' and yields the results of the chunks in their
+       order as soon as queue workers (see run_queue_worker) have finished
+       them. Workers report only the digests of the outputs.
+
+    :param config: configuration object, expects that it was processed by
+                   check_config
+
+    :yield: format_file results without the output, the digests are hex
+            strings
+    """
+
+    queue_dir = config["queue_dir"]
+    chunk_count = init_queue(config)
+    print("%d chunks queued in %s, start workers with: %s --worker %s"
+          % (chunk_count, queue_dir, argv[0], queue_dir), file=stderr)
+
+    try:
+        for chunk_idx in range(chunk_count):
+            result_path = queue_path(queue_dir, "results", "%d.json"
+                                     % chunk_idx)
+            while not path.exists(result_path):
+                sleep(QUEUE_POLL_INTERVAL)
+
+            with open(result_path, 'r') as f:
+                rows = json_loads(f.read())
+
+            for combination, in_file_idx, digest in rows:
+                yield tuple(combination), in_file_idx, digest, None
+    finally:
+        # lets the workers exit
+        write_atomic(queue_path(queue_dir, "done"), chunk_count)
+
+
+def acquire_chunk(queue_dir, lease_timeout, worker_id):
+    """Leases the first chunk that has neither a result nor a valid lease.
+       Leases expire if their file was not touched for lease_timeout seconds,
+       an expired lease is taken over. Two workers that end up with the same
+       chunk produce the same result, so that this is harmless.
+
+    :param queue_dir: path to the queue directory
+
+    :param lease_timeout: seconds after which a lease expires
+
+    :param worker_id: written into the lease file
+
+    :return: chunk index or None if no chunk is available
+    """
+
+    chunk_names = listdir(queue_path(queue_dir, "chunks"))
+    chunk_indices = sorted(int(name[:-len(".json")]) for name in chunk_names
+                           if name.endswith(".json"))
+
+    for chunk_idx in chunk_indices:
+        if path.exists(queue_path(queue_dir, "results", "%d.json"
+                                  % chunk_idx)):
+            continue
+
+        lease_path = queue_path(queue_dir, "leases", str(chunk_idx))
+        try:
+            fd = os_open(lease_path, O_CREAT | O_EXCL | O_WRONLY)
+            os_close(fd)
+            write_atomic(lease_path, worker_id, worker_id)
+            return chunk_idx
+        except FileExistsError:
+            pass
+
+        try:
+            expired = time() - path.getmtime(lease_path) > lease_timeout
+        except OSError:
+            continue  # the lease was released in the meantime
+
+        if expired:
+            print("lease of chunk %d expired, reassigned to %s"
+                  % (chunk_idx, worker_id), file=stderr)
+            write_atomic(lease_path, worker_id, worker_id)
+            return chunk_idx
+
+    return None
+
+
+def run_queue_worker(queue_dir):
+    """Formats the chunks of a coordinators 'queue_dir' until the coordinator
+       is done. Workers on other hosts need the same paths to the queue
+       directory, the Uncrustify binary and the input files.
+
+    :param queue_dir: path to the queue directory
+    """
+
+    config_path = queue_path(queue_dir, "config.json")
+    while not path.exists(config_path):
+        sleep(QUEUE_POLL_INTERVAL)
+    config = load_config(config_path)
+
+    worker_id = "%s-%d" % (gethostname(), getpid())
+    lease_timeout = config["lease_timeout"]
+
+    pool = Pool(processes=config["jobs"])
+    try:
+        while not path.exists(queue_path(queue_dir, "done")):
+            chunk_idx = acquire_chunk(queue_dir, lease_timeout, worker_id)
+            if chunk_idx is None:
+                sleep(QUEUE_POLL_INTERVAL)
+                continue
+
+            lease_path = queue_path(queue_dir, "leases", str(chunk_idx))
+            with open(queue_path(queue_dir, "chunks", "%d.json"
+                                 % chunk_idx), 'r') as f:
+                chunk = json_loads(f.read())
+
+            tasks = [format_args(config, tuple(combination), in_file_idx)
+                     for combination in chunk
+                     for in_file_idx in range(len(config["in_files"]))]
+
+            rows = []
+            renewed = time()
+            for combination, in_file_idx, digest, _ in pool.imap(
+                    format_file, tasks, chunksize=FORMAT_CHUNK_SIZE):
+                rows.append([combination, in_file_idx,
+                             None if digest is None else digest.hex()])
+
+                # renew the lease
+                if time() - renewed > lease_timeout / 4.0:
+                    renewed = time()
+                    utime(lease_path, None)
+
+            write_atomic(queue_path(queue_dir, "results", "%d.json"
+                                    % chunk_idx), rows, worker_id)
+    finally:
+        pool.close()
+        pool.join()
 
 
 def load_config(file_path):
@@ -395,33 +1479,132 @@ def check_config(config, cfg_path=""):
     if "cleanup_lvl" not in config:
         config["cleanup_lvl"] = 1
 
+    if "link_outputs" not in config:
+        config["link_outputs"] = False
+
     if "force_cleanup" not in config:
         config["force_cleanup"] = False
 
     if "json_output" not in config:
         config["json_output"] = False
 
+    if "jobs" not in config:
+        config["jobs"] = cpu_count()
+
+    if "factorize" not in config:
+        config["factorize"] = False
+
+    if "option_graph" not in config:
+        config["option_graph"] = None
+
+    if config["option_graph"] and extend_relative_paths \
+            and not path.isabs(config["option_graph"]):
+        config["option_graph"] = make_abs_path(cfg_path,
+                                               config["option_graph"])
+
+    if not isinstance(config["jobs"], int) or config["jobs"] < 1:
+        raise Exception("config file: 'jobs' has to be a positive integer")
+
+    if "sampling" not in config:
+        config["sampling"] = "full"
+
+    if config["sampling"] not in SAMPLING_MODES:
+        raise Exception("config file: 'sampling' has to be one of %s"
+                        % ", ".join(SAMPLING_MODES))
+
+    if config["sampling"] != "full" and config["factorize"]:
+        raise Exception("config file: 'sampling' can not be combined with "
+                        "'factorize'")
+
+    if "strength" not in config:
+        config["strength"] = 2
+
+    if "samples" not in config:
+        config["samples"] = 1000
+
+    if "seed" not in config:
+        config["seed"] = 0
+
+    if "result_store" not in config:
+        config["result_store"] = None
+
+    if config["result_store"] and extend_relative_paths \
+            and not path.isabs(config["result_store"]):
+        config["result_store"] = make_abs_path(cfg_path,
+                                               config["result_store"])
 
-def cleanup(level, eq_map, clean_target_dir, keep_files=()):
+    if "queue_dir" not in config:
+        config["queue_dir"] = None
+
+    if config["queue_dir"] and extend_relative_paths \
+            and not path.isabs(config["queue_dir"]):
+        config["queue_dir"] = make_abs_path(cfg_path, config["queue_dir"])
+
+    if config["queue_dir"] and not path.relpath(
+            config["queue_dir"], config["out_dir"]).startswith(path.pardir):
+        raise Exception("config file: 'queue_dir' can not be inside of "
+                        "'out_dir'")
+
+    if config["queue_dir"] and (config["result_store"]
+                                or config["factorize"]):
+        raise Exception("config file: 'queue_dir' can not be combined with "
+                        "'result_store' or 'factorize'")
+
+    if "queue_chunk_size" not in config:
+        config["queue_chunk_size"] = 256
+
+    if "lease_timeout" not in config:
+        config["lease_timeout"] = 60
+
+    if config["result_store"] and path.normpath(config["result_store"]) \
+            == path.normpath(config["out_dir"]):
+        raise Exception("config file: 'result_store' can not be 'out_dir'")
+
+
+def cleanup(level, columns, config, keep_files=()):
     """cleans up output_dir
 
-    :param level: 0 - do nothing,
+    :param level: 0 - do nothing, the outputs are kept as blobs,
+                      see link_output
                   1 - keep `keep_files` and 1 file for each group,
                   2 - remove everything
+                  a 'result_store' inside of 'out_dir' is never removed
 
-    :param equal_output_map: dict of files with equal content,
-                             expects format generated by gen_equal_output_map
+    :param columns: column store generated by gen_equal_output_map, None if
+                    no formatted files were written
 
-    :param clean_target_dir: directory which content will be cleaned
+    :param config: configuration object, its 'out_dir' will be cleaned
 
     :param keep_files: list of files should not be removed
     """
 
+    clean_target_dir = config["out_dir"]
+
     if level == 0:
         return
 
+    # the top level entry of 'out_dir' that contains the result store
+    store_entry = None
+    if config["result_store"]:
+        store_rel_path = path.relpath(config["result_store"],
+                                      clean_target_dir)
+        if not store_rel_path.startswith(path.pardir):
+            store_entry = clean_target_dir + "/" + \
+                store_rel_path.split(path.sep)[0]
+
     if level == 2:
-        rmtree(clean_target_dir)
+        if store_entry is None:
+            rmtree(clean_target_dir)
+            return
+
+        for f in listdir(clean_target_dir):
+            f = clean_target_dir + "/" + f
+            if f == store_entry:
+                continue
+            if path.isdir(f):
+                rmtree(f)
+            else:
+                remove(f)
 
     if level == 1:
         rm_files = [clean_target_dir + "/" + f for f in
@@ -430,8 +1613,14 @@ def cleanup(level, eq_map, clean_target_dir, keep_files=()):
         for f in keep_files:
             rm_files.remove(f)
 
-        for idx in eq_map:
-            old_path = eq_map[idx][0]
+        if store_entry is not None:
+            rm_files.remove(store_entry)
+
+        first_rows = () if columns is None else columns["first"]
+        for idx, row in enumerate(first_rows):
+            old_path = combination_file_path(config,
+                                             row_combination(columns, row),
+                                             columns["file"][row])
             new_path = ("%s/g_%d" % (path.dirname(path.abspath(old_path)), idx))
             rename(old_path, new_path)
 
@@ -450,6 +1639,10 @@ def cleanup(level, eq_map, clean_target_dir, keep_files=()):
 
 
 def main(args):
+    if args[0] == "--worker":
+        run_queue_worker(path.abspath(args[1]))
+        return
+
     config = load_config(args[0])
     check_config(config, args[0])
 
@@ -463,30 +1656,43 @@ def main(args):
         raise Exception("cleanup_lvl > 0 on an existing directory: %s"
                         % config["out_dir"])
 
-    write_config_files(config)
-    eq_map = gen_equal_output_map(config)
-    output_dict = gen_output_dict(config, eq_map)
-
     # write output as txt file
     output_dict_path = path.join(config["out_dir"], "out.txt")
-    write_output_dict_pretty(output_dict, output_dict_path)
+
+    keep_files = [output_dict_path]
+
+    if config["factorize"]:
+        columns = None
+        output_dict = gen_factorized_output_dict(config)
+        write_factorized_output_dict_pretty(output_dict, output_dict_path)
+    else:
+        columns = gen_equal_output_map(config)
+        estimates = gen_estimates(config, columns)
+        write_output_dict_pretty(columns, output_dict_path, estimates)
+
+        # compact binary form of the results, see combination_groups.py
+        columns_path = path.join(config["out_dir"], "out.cols")
+        save_columns(columns, columns_path,
+                     {"sampling": config["sampling"], "estimates": estimates})
+        keep_files.append(columns_path)
 
     # read ouput txt file to print it
     with open(output_dict_path, 'r') as f:
         print()
         print(f.read())
 
-    keep_files = [output_dict_path]
-
     # write output as json file
     if config["json_output"]:
+        if columns is not None:
+            output_dict = gen_output_dict(config, columns, estimates)
+
         output_dict_json_path = path.join(config["out_dir"], "out.json")
         with open(output_dict_json_path, 'w') as f:
             json_dump(output_dict, f)
         keep_files.append(output_dict_json_path)
 
     # clean output directory
-    cleanup(config["cleanup_lvl"], eq_map, config["out_dir"], keep_files)
+    cleanup(config["cleanup_lvl"], columns, config, keep_files)
 
 
 if __name__ == "__main__":
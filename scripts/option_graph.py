@@ -0,0 +1,229 @@
+#!/usr/bin/python
+"""
+option_graph.py
+
+persistent graph of option interactions that were observed during
+reductions: options that had to be restored, edges connect the options that
+had to be restored together. The graph is used as a prior to test grouped
+restores before the option combinations are searched.
+
+:license: GPL v2+
+"""
+
+from __future__ import print_function  # python >= 2.6
+
+from os import replace as os_replace
+from os.path import exists
+from json import dump as json_dump, load as json_load
+from sys import stderr
+
+
+def new_graph():
+    """
+    creates an empty graph
+
+
+    :return: dict
+    ----------------------------------------------------------------------------
+        restored: dict< str, int >
+            how often an option had to be restored
+
+        edges: dict< str, dict< str, int > >
+            symmetric evidence counts between the option names
+    """
+    return {"restored": {}, "edges": {}}
+
+
+def load_graph(file_path):
+    """
+    reads a graph file, a missing or unreadable file yields an empty graph
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param file_path: str
+        path to the graph file
+
+
+    :return: dict
+    ----------------------------------------------------------------------------
+        see new_graph()
+    """
+    if not exists(file_path):
+        return new_graph()
+
+    try:
+        with open(file_path, 'r') as f:
+            graph = json_load(f)
+    except ValueError:
+        print("ignoring invalid option graph: %s" % file_path, file=stderr)
+        return new_graph()
+
+    graph.setdefault("restored", {})
+    graph.setdefault("edges", {})
+    return graph
+
+
+def save_graph(graph, file_path):
+    """
+    writes a graph file atomically
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param graph: dict
+        see new_graph()
+
+    :param file_path: str
+        path to the graph file
+    """
+    tmp_path = "%s.tmp" % file_path
+    with open(tmp_path, 'w') as f:
+        json_dump(graph, f, indent=1, sort_keys=True)
+    os_replace(tmp_path, file_path)
+
+
+def add_restore(graph, restored_names):
+    """
+    records that options had to be restored together after they were removed,
+    the options that could stay removed are no evidence of an interaction and
+    get no edges
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param graph: dict
+        see new_graph()
+
+    :param restored_names: iterable< str >
+        names of the options that had to be restored together
+    """
+    restored_names = set(restored_names)
+    edges = graph["edges"]
+
+    for name in restored_names:
+        graph["restored"][name] = graph["restored"].get(name, 0) + 1
+
+        for other in restored_names:
+            if other != name:
+                neighbours = edges.setdefault(name, {})
+                neighbours[other] = neighbours.get(other, 0) + 1
+
+
+def record_restore(file_path, restored_names):
+    """
+    add_restore() for a graph file
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param file_path: str
+        path to the graph file
+
+    :param restored_names: iterable< str >
+        see add_restore()
+    """
+    graph = load_graph(file_path)
+    add_restore(graph, restored_names)
+    save_graph(graph, file_path)
+
+
+def interaction_weight(graph, name, names):
+    """
+    sums the evidence counts of the edges between an option and a set of
+    options
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param graph: dict
+        see new_graph()
+
+    :param name: str
+        name of an option
+
+    :param names: set< str >
+        names of other options
+
+
+    :return: int
+    """
+    neighbours = graph["edges"].get(name, {})
+    return sum(count for other, count in neighbours.items() if other in names)
+
+
+def likely_restores(graph, names):
+    """
+    names of the options that most likely have to be restored if all of the
+    given options are removed together: options that had to be restored
+    before, those with edges to other given options first, then the most
+    often restored ones
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param graph: dict
+        see new_graph()
+
+    :param names: iterable< str >
+        names of the options that are removed together
+
+
+    :return: list< str >
+    """
+    names = set(names)
+    weights = {}
+
+    for name in names:
+        restored = graph["restored"].get(name, 0)
+        if restored > 0:
+            weights[name] = (interaction_weight(graph, name, names), restored)
+
+    return sorted(weights, key=lambda name: (-weights[name][0],
+                                             -weights[name][1], name))
+
+
+def interaction_groups(graph, names):
+    """
+    splits options into the connected components of the graph, restricted to
+    the given options
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param graph: dict
+        see new_graph()
+
+    :param names: iterable< str >
+        names of options
+
+
+    :return: list< list< str > >
+    ----------------------------------------------------------------------------
+        groups of interacting options, in the order of their first option in
+        names, options without known interactions form their own group
+    """
+    names = list(names)
+    name_set = set(names)
+    edges = graph["edges"]
+    seen = set()
+    groups = []
+
+    for name in names:
+        if name in seen:
+            continue
+
+        group = []
+        stack = [name]
+        seen.add(name)
+        while stack:
+            current = stack.pop()
+            group.append(current)
+            for other in edges.get(current, {}):
+                if other in name_set and other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+
+        groups.append(sorted(group, key=names.index))
+
+    return groups
@@ -10,37 +10,128 @@ desired formatting
 """
 
 # Possible improvements:
-# - parallelize add_back()
 # - (maybe) reduce amount of written config file, see Uncrustify --set
 
-from __future__ import print_function  # python >= 2.6
 import argparse
 
 from os import name as os_name, sep as os_path_sep, fdopen as os_fdopen, \
-    remove as os_remove
+    remove as os_remove, replace as os_replace, makedirs
 from os.path import exists, join as path_join
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, TimeoutExpired
 from sys import exit as sys_exit, stderr, stdout
 from shutil import rmtree
 from multiprocessing import cpu_count
 from tempfile import mkdtemp, mkstemp
 from contextlib import contextmanager
 from collections import OrderedDict
-from threading import Timer
 from multiprocessing.pool import Pool
 from itertools import combinations
+from re import compile as re_compile
+from json import dump as json_dump, load as json_load
+from time import time
+from difflib import unified_diff
+from hashlib import sha256
+from queue import Queue
+
+from option_table import non_default_options, sort_options
+from option_graph import load_graph, likely_restores, record_restore
 
 FLAGS = None
 NULL_DEV = "/dev/null" if os_name != "nt" else "nul"
 
+# state shared by all tasks of a pool, installed once per worker process by
+# init_worker() so that the tasks themselves only need to carry indices
+WORKER_STATE = {}
+
+# max. seconds between two checkpoints inside of a stage
+CHECKPOINT_INTERVAL = 30
+# amount of add_back_steps() combinations between two checkpoints
+CHECKPOINT_BATCH = 16
+# amount of main loop runs per pool process that are queued as one step
+MAIN_LOOP_BATCH = 64
+
+# seconds after which an Uncrustify run is killed before its input file was
+# calibrated by the sanity run
+DEFAULT_TIMEOUT = 60
+# calibrated timeout: TIMEOUT_FACTOR * sanity run time + TIMEOUT_MARGIN
+TIMEOUT_FACTOR = 10
+TIMEOUT_MARGIN = 1.0
+
+# min. seconds between two progress lines, on a terminal and in a log file
+PROGRESS_INTERVAL = 1.0
+PROGRESS_LOG_INTERVAL = 10.0
+
 
 def enum(**enums):
     return type('Enum', (), enums)
 
 
-RESTULTSFLAG = enum(NONE=0, REMOVE=1, KEEP=2)
+RESTULTSFLAG = enum(NONE=0, REMOVE=1, KEEP=2, TIMEOUT=3)
 ERROR_CODE = enum(NONE=0, FLAGS=200, SANITY0=201, SANITY1=202)
 MODES = ("reduce", "no-default")
+ADD_BACK_MODES = ("cover", "combinations")
+
+# options that can only change the formatted output if at least one of the
+# listed token types appears (as tag or parent) in Uncrustifys -p output of an
+# input file
+TOKEN_TRIGGERS = (
+    (("ENUM", "ENUM_CLASS"),
+     ("align_enum_equ_span", "align_enum_equ_thresh", "nl_enum_brace",
+      "nl_enum_class", "nl_enum_class_identifier", "nl_enum_colon_type",
+      "nl_enum_identifier_colon", "nl_enum_leave_one_liners",
+      "nl_enum_own_lines", "pos_enum_comma", "sp_enum_after_assign",
+      "sp_enum_assign", "sp_enum_before_assign", "sp_enum_colon",
+      "sp_enum_paren", "sp_inside_braces_enum")),
+    (("TEMPLATE",),
+     ("indent_template_param", "nl_template_class",
+      "sp_before_template_paren", "sp_template_angle")),
+    (("ANGLE_OPEN", "ANGLE_CLOSE"),
+     ("sp_after_angle", "sp_angle_colon", "sp_angle_paren",
+      "sp_angle_paren_empty", "sp_angle_shift", "sp_angle_word",
+      "sp_before_angle", "sp_inside_angle")),
+    (("NAMESPACE",),
+     ("indent_namespace", "indent_namespace_level", "indent_namespace_limit",
+      "indent_namespace_single_indent",
+      "mod_add_long_namespace_closebrace_comment", "nl_namespace_brace",
+      "nl_namespace_two_to_one_liner")),
+    (("UNION",),
+     ("nl_union_brace",)),
+    (("SWITCH",),
+     ("indent_switch_case", "indent_switch_pp",
+      "mod_add_long_switch_closebrace_comment", "nl_after_switch",
+      "nl_before_switch", "nl_switch_brace")),
+    (("CASE",),
+     ("indent_case_brace", "indent_case_shift", "mod_case_brace",
+      "mod_move_case_break", "nl_after_case", "nl_before_case",
+      "nl_case_colon_brace", "sp_before_case_colon", "sp_case_label")),
+    (("TRY",),
+     ("nl_try_brace", "sp_try_brace")),
+    (("CATCH",),
+     ("nl_brace_catch", "nl_catch_brace", "sp_brace_catch", "sp_catch_brace",
+      "sp_catch_paren")),
+    (("FINALLY",),
+     ("nl_brace_finally", "nl_finally_brace", "sp_brace_finally",
+      "sp_finally_brace")),
+    (("TRY", "CATCH", "FINALLY"),
+     ("nl_after_try_catch_finally",)),
+    (("WHILE", "WHILE_OF_DO"),
+     ("mod_full_brace_while", "nl_after_while", "nl_before_while",
+      "nl_brace_while", "nl_create_while_one_liner",
+      "nl_split_while_one_liner", "nl_while_brace",
+      "nl_while_leave_one_liners")),
+    (("DO",),
+     ("mod_full_brace_do", "nl_after_do", "nl_before_do", "nl_do_brace")),
+    (("THROW",),
+     ("nl_before_throw", "sp_after_throw", "sp_throw_paren")),
+    (("SIZEOF",),
+     ("sp_sizeof_paren",)),
+    (("RETURN",),
+     ("mod_paren_on_return", "mod_remove_empty_return", "nl_after_return",
+      "nl_before_return", "nl_return_expr", "sp_return_paren")),
+)
+
+# matches the tag and parent column of a chunk line in Uncrustifys -p output
+DEBUG_CHUNK_RE = re_compile(r"^#\s*\d+>\s*(\w+)\[\s*(\w+)\]")
 
 
 @contextmanager
@@ -109,26 +200,9 @@ def open_fd(*args, **kwargs):
         fp.close()
 
 
-def term_proc(proc, timeout):
-    """
-    helper function to terminate a process
-
-
-    Parameters
-    ----------------------------------------------------------------------------
-    :param proc: process object
-        the process object that is going to be terminated
-
-    :param timeout: dictionary
-        a dictionary (used as object reference) to set a flag that indicates
-        that the process is going to be terminated
-    """
-    timeout["value"] = True
-    proc.terminate()
-
-
 def uncrustify(unc_bin_path, cfg_file_path, unformatted_file_path,
-               lang=None, debug_file=None, check=False):
+               lang=None, debug_file=None, check=False,
+               timeout_sec=DEFAULT_TIMEOUT, timeout=None):
     """
     executes Uncrustify and captures its stdout
 
@@ -153,11 +227,18 @@ def uncrustify(unc_bin_path, cfg_file_path, unformatted_file_path,
     :param check: bool
         Used to control whether Uncrustifys --check is going to be used
 
+    :param timeout_sec: float
+        seconds after which the process is killed
+
+    :param timeout: dictionary / None
+        a dictionary (used as object reference) whose "value" is set to True
+        if the process was killed
+
 
     :return: str / None
     ----------------------------------------------------------------------------
         returns the stdout from Uncrustify or None if the process takes to much
-        time (set to 5 sec)
+        time (see timeout_sec)
     """
 
     args = [unc_bin_path, "-q", "-c", cfg_file_path, '-f',
@@ -171,16 +252,16 @@ def uncrustify(unc_bin_path, cfg_file_path, unformatted_file_path,
 
     proc = Popen(args, stdout=PIPE, stderr=PIPE)
 
-    timeout = {"value": False}
-    timer = Timer(5, term_proc, [proc, timeout])
-    timer.start()
-
-    output_b, error_txt_b = proc.communicate()
-
-    timer.cancel()
-
-    if timeout["value"]:
-        print("uncrustify proc timeout: %s" % ' '.join(args), file=stderr)
+    try:
+        output_b, error_txt_b = proc.communicate(timeout=timeout_sec)
+    except TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+
+        if timeout is not None:
+            timeout["value"] = True
+        print("uncrustify proc timeout (%.1f sec): %s"
+              % (timeout_sec, ' '.join(args)), file=stderr)
         return None
 
     error = error_txt_b.decode("UTF-8")
@@ -222,321 +303,494 @@ def same_expected_generated(formatted_path, unc_bin_path, cfg_file_path,
     return True if formatted_string == expected_string else False
 
 
-def process_uncrustify(args):
+def init_worker(jobs):
     """
-    special wrapper for same_expected_generated()
+    pool initializer, installs the state that is shared between all tasks of
+    the reduction jobs into the global WORKER_STATE of the worker process
 
-    accesses global var(s): RESTULTSFLAG
+    accesses global var(s): WORKER_STATE
 
 
     Parameters
     ----------------------------------------------------------------------------
-    :param args: list / tuple< int, ... >
-        this function is intended to be called by multiprocessing.pool.map()
-        therefore all arguments are inside a list / tuple:
-            id: int
-                an index number needed by the caller to differentiate runs
+    :param jobs: dict< int, dict >
+        the static part of every reduction job that is going to use the pool,
+        key: job id, value: dict with the entries
+            unc_bin_path: str
+                path to the Uncrustify binary
 
-            other parameters:
-                see same_expected_generated()
+            config_file_path: str
+                path to the provided config file
 
+            input_files: list / tuple< str >
+                a list containing paths to a files that are going to be
+                formatted
 
-    :return: tuple< int, RESTULTSFLAG >
+            formatted_files: list / tuple< str >
+                a list containing paths to files containing the expected
+                contents
+
+            langs: list / tuple< str / None > / None
+                a list of languages the files, used as Uncrustifys -l argument
+                can be None or shorter than the amount of provided files
+
+            tmp_dir: str
+                path to a directory in which the config files are going to be
+                written
+    """
+    WORKER_STATE.clear()
+
+    for job_id, job in jobs.items():
+        file_len = len(job["input_files"])
+        if len(job["formatted_files"]) != file_len:
+            raise Exception("len(input_files) != len(formatted_files)")
+
+        langs = job["langs"]
+        lang_max_idx = -1 if langs is None else len(langs) - 1
+
+        WORKER_STATE[job_id] = dict(
+            unc_bin_path=job["unc_bin_path"],
+            config_file_path=job["config_file_path"],
+            input_files=tuple(job["input_files"]),
+            formatted_files=tuple(job["formatted_files"]),
+            langs=tuple(None if idx > lang_max_idx else langs[idx]
+                        for idx in range(file_len)),
+            tmp_dir=job["tmp_dir"],
+            options=(-1, ()),
+            timeouts=None,
+            expected={})
+
+
+def worker_options(job_id, version):
+    """
+    returns an option list that was published with publish_options(), the
+    list is read only once per worker process and version
+
+    accesses global var(s): WORKER_STATE
+
+
+    Parameters
     ----------------------------------------------------------------------------
-        returns a tuple containing the id and a RESTULTSFLAG, REMOVE if both
-        strings are equal, KEEP if not
+    :param job_id: int
+        id of the reduction job
+
+    :param version: int
+        version of the option list
+
+
+    :return: tuple< tuple< str, str > >
     """
+    state = WORKER_STATE[job_id]
 
-    id = args[0]
-    res = same_expected_generated(*args[1:])
+    if state["options"][0] != version:
+        with open(options_file_path(state["tmp_dir"], version), 'r') as f:
+            state["options"] = (version,
+                                tuple(tuple(o) for o in json_load(f)))
 
-    return id, RESTULTSFLAG.REMOVE if res else RESTULTSFLAG.KEEP
+    return state["options"][1]
 
 
-def write_config_file(args):
+def worker_timeout(job_id, file_idx):
     """
-    Writes all but one excluded option into a config file
+    returns the calibrated timeout of an input file, see publish_timeouts(),
+    the timeouts are read only once per worker process after they were
+    published
+
+    accesses global var(s): WORKER_STATE, DEFAULT_TIMEOUT
 
 
     Parameters
     ----------------------------------------------------------------------------
-    :param args: list / tuple< list< tuple< str, str > >, str, int >
-        this function is intended to be called by multiprocessing.pool.map()
-        therefore all arguments are inside a list / tuple:
+    :param job_id: int
+        id of the reduction job
 
-            config_list: list< tuple< str, str > >
-                a list of tuples containing option names and values
+    :param file_idx: int
+        index of the file inside of the jobs input_files
 
-            tmp_dir: str
-                path to a directory in which the config file is going to be
-                written
 
-            exclude_idx: int
-                index for an option that is not going to be written into the
-                config file
+    :return: float
     """
+    state = WORKER_STATE[job_id]
 
-    config_list, tmp_dir, exclude_idx = args
+    if state["timeouts"] is None:
+        timeouts_path = timeouts_file_path(state["tmp_dir"])
+        if not exists(timeouts_path):
+            return DEFAULT_TIMEOUT
 
-    with open("%s%suncr-%d.cfg" % (tmp_dir, os_path_sep, exclude_idx),
-              'w') as f:
-        print_config(config_list, target_file_obj=f, exclude_idx=exclude_idx)
+        with open(timeouts_path, 'r') as f:
+            state["timeouts"] = tuple(json_load(f))
 
+    return state["timeouts"][file_idx]
 
-def write_config_file2(args):
+
+def worker_expected(job_id, file_idx):
     """
-    Writes two option lists into a config file
+    returns the content of an expected file, the file is read only once per
+    worker process
+
+    accesses global var(s): WORKER_STATE
 
 
     Parameters
     ----------------------------------------------------------------------------
-    :param args: list< tuple< str, str > >,
-                 list< tuple< str, str > >, str, int
-        this function is intended to be called by multiprocessing.pool.map()
-        therefore all arguments are inside a list / tuple:
+    :param job_id: int
+        id of the reduction job
 
-            config_list: list< tuple< str, str > >
-                the first list of tuples containing option names and values
-
-            test_list: list< tuple< str, str > >
-                the second list of tuples containing option names and values
+    :param file_idx: int
+        index of the file inside of the jobs formatted_files
 
-            tmp_dir: str
-                path to a directory in which the config file is going to be
-                written
 
-            idx: int
-                index that is going to be used for the filename
+    :return: bytes
+    ----------------------------------------------------------------------------
+        the content of the expected file
     """
+    state = WORKER_STATE[job_id]
+    expected = state["expected"]
 
-    config_list0, config_list1, tmp_dir, idx = args
+    if file_idx not in expected:
+        with open(state["formatted_files"][file_idx], 'rb') as f:
+            expected[file_idx] = f.read()
 
-    with open("%s%suncr-r-%d.cfg" % (tmp_dir, os_path_sep, idx), 'w') as f:
-        print_config(config_list0, target_file_obj=f)
-        print("", end='\n', file=f)
-        print_config(config_list1, target_file_obj=f)
+    return expected[file_idx]
 
 
-def gen_multi_combinations(elements, N):
+def worker_same_expected_generated(job_id, file_idx, cfg_file_path,
+                                   timeout=None):
     """
-    generator function that generates, based on a set of elements, all
-    combinations of 1..N elements
+    same_expected_generated() for the files installed by init_worker()
+
+    accesses global var(s): WORKER_STATE
 
 
     Parameters
     ----------------------------------------------------------------------------
-    :param elements: list / tuple
-        a list of elements from which the combinations will be generated
+    :param job_id: int
+        id of the reduction job
 
-    :param N:
-        the max number of element in a combination
+    :param file_idx: int
+        index of the input / expected file pair
 
+    :param cfg_file_path: str
+        path to a config file for Uncrustify
 
-    :return: list
-    ----------------------------------------------------------------------------
-        yields a single combination of the elements
+    :param timeout: dictionary / None
+        see uncrustify()
 
-    >>> gen_multi_combinations(["a", "b", "c"], 3)
-    (a); (b); (c); (a,b); (a,c); (b,c); (a,b,c)
-    """
 
-    fields = len(elements)
-    if N > fields:
-        raise Exception("Error: N > len(options)")
-    if N <= 0:
-        raise Exception("Error: N <= 0")
+    :return: bool
+    ----------------------------------------------------------------------------
+        True if the strings match, False otherwise
+    """
+    state = WORKER_STATE[job_id]
+    formatted_string = uncrustify(state["unc_bin_path"], cfg_file_path,
+                                  state["input_files"][file_idx],
+                                  state["langs"][file_idx],
+                                  timeout_sec=worker_timeout(job_id, file_idx),
+                                  timeout=timeout)
 
-    for n in range(1, N + 1):
-        yield combinations(elements, n)
+    return formatted_string == worker_expected(job_id, file_idx)
 
 
-def add_back(unc_bin_path, input_files, formatted_files, langs, options_r,
-             options_k, tmp_dir):
+def worker_token_types(args):
     """
-    lets Uncrustify format files with generated configs files until all
-    formatted files match their according expected files.
+    collects the token types of an input file from Uncrustifys -p output
 
-    Multiple config files are generated based on a (base) list of Uncrustify
-    options combined with additional (new) options derived from combinations of
-    another list of options.
+    accesses global var(s): WORKER_STATE, DEBUG_CHUNK_RE
 
 
-    accesses global var(s): RESTULTSFLAG
+    Parameters
+    ----------------------------------------------------------------------------
+    :param args: tuple< int, int >
+        this function is intended to be called by multiprocessing.pool.map(),
+        the job id and the index of the input file
 
 
-    Parameters
+    :return: set< str > / None
     ----------------------------------------------------------------------------
-    :param unc_bin_path: str
-        path to the Uncrustify binary
+        the tag and parent types of all chunks, None if Uncrustify failed or
+        its output could not be read
+    """
+    job_id, file_idx = args
+    state = WORKER_STATE[job_id]
+    token_types = set()
+
+    with make_raw_temp_file(suffix='.unc') as (fd, file_path):
+        output = uncrustify(state["unc_bin_path"], state["config_file_path"],
+                            state["input_files"][file_idx],
+                            state["langs"][file_idx], debug_file=file_path,
+                            timeout_sec=worker_timeout(job_id, file_idx))
+        if output is None:
+            return None
+
+        # the chunk texts are the raw bytes of the input file
+        try:
+            with open_fd(fd, 'r', encoding='UTF-8', errors='replace') as fp:
+                for line in fp:
+                    match = DEBUG_CHUNK_RE.match(line)
+                    if match:
+                        token_types.update(match.groups())
+        except (IOError, OSError, ValueError) as e:
+            print("token types of %s: %s" % (state["input_files"][file_idx], e),
+                  file=stderr)
+            return None
 
-    :param input_files: list / tuple< str >
-        a list containing paths to a files that are going to be formatted
+    return token_types
 
-    :param formatted_files: list / tuple< str >
-        a list containing paths to files containing the expected contents
 
-    :param langs: list / tuple< str > / None
-        a list of languages the files, used as Uncrustifys -l argument
-        can be None or shorter than the amount of provided files
+def process_uncrustify(args):
+    """
+    formats one input file with a config file that was written by
+    write_config_file() and compares the output with the expected file
 
-    :param options_r: list< tuple< str, str > >
-        the list of options from which combinations will be derived
+    accesses global var(s): RESTULTSFLAG, WORKER_STATE
 
-    :param options_k: list< tuple< str, str > >
-        the (base) list of Uncrustify options
 
-    :param tmp_dir: str
-        the directory in which the config files will be written to
+    Parameters
+    ----------------------------------------------------------------------------
+    :param args: tuple< int, int, int >
+        this function is intended to be called by multiprocessing.pool.map(),
+        the job id, the version of the option list and an index that encodes
+        both the file index (idx // len(options_list)) and the index of the
+        excluded option (idx % len(options_list))
 
 
-    :return: list< tuple< str, str > > / None
+    :return: tuple< int, RESTULTSFLAG >
     ----------------------------------------------------------------------------
-        list of additional option that were needed to generate matching file
-        contents
+        returns a tuple containing the id and a RESTULTSFLAG, REMOVE if both
+        strings are equal, TIMEOUT if Uncrustify was killed, KEEP otherwise
     """
+    job_id, version, idx = args
 
-    lang_max_idx = -1 if langs is None else len(langs) - 1
-    file_len = len(input_files)
+    config_list_len = len(worker_options(job_id, version))
+    file_idx = idx // config_list_len
+    option_idx = idx % config_list_len
 
-    if len(formatted_files) != file_len:
-        raise Exception("len(input_files) != len(formatted_files)")
+    cfg_file_path = "%s%suncr-%d.cfg" \
+                    % (WORKER_STATE[job_id]["tmp_dir"], os_path_sep,
+                       option_idx)
+    timeout = {"value": False}
+    res = worker_same_expected_generated(job_id, file_idx, cfg_file_path,
+                                         timeout)
 
-    for m_combination in gen_multi_combinations(options_r, len(options_r)):
-        for idx, (r_combination) in enumerate(m_combination):
-            write_config_file2((options_k, r_combination, tmp_dir, idx))
+    if timeout["value"]:
+        return idx, RESTULTSFLAG.TIMEOUT
+    return idx, RESTULTSFLAG.REMOVE if res else RESTULTSFLAG.KEEP
 
-            cfg_file_path = "%s%suncr-r-%d.cfg" % (tmp_dir, os_path_sep, idx)
-            res = []
 
-            for file_idx in range(file_len):
-                lang = None if idx > lang_max_idx else langs[file_idx]
+def write_config_file(args):
+    """
+    Writes all but one excluded option of a published option list into a
+    config file inside of the jobs tmp_dir
+
+    accesses global var(s): WORKER_STATE
 
-                r = process_uncrustify(
-                    (0, formatted_files[file_idx], unc_bin_path, cfg_file_path,
-                     input_files[file_idx], lang))
-                res.append(r[1])
 
-            # all files, flag = remove -> option can be removed -> equal output
-            if res.count(RESTULTSFLAG.REMOVE) == len(res):
-                return r_combination
-    return None
+    Parameters
+    ----------------------------------------------------------------------------
+    :param args: tuple< int, int, int >
+        this function is intended to be called by multiprocessing.pool.map(),
+        the job id, the version of the option list and the index for an option
+        that is not going to be written into the config file
+    """
+    job_id, version, exclude_idx = args
+
+    with open("%s%suncr-%d.cfg" % (WORKER_STATE[job_id]["tmp_dir"],
+                                   os_path_sep, exclude_idx), 'w') as f:
+        print_config(worker_options(job_id, version), target_file_obj=f,
+                     exclude_idx=exclude_idx)
 
 
 def sanity_raw_run(args):
     """
-    wrapper for same_expected_generated(), prints error message if the config
-    file does not generate the expected result
+    wrapper for worker_same_expected_generated(), prints error message if the
+    config file does not generate the expected result and measures the time
+    of the run, see calibrate_timeouts()
+
+    accesses global var(s): WORKER_STATE
+
 
     Parameters
     ----------------------------------------------------------------------------
-    :param args:
-        see same_expected_generated
+    :param args: tuple< int, int, str >
+        job id, file index and config file path,
+        see worker_same_expected_generated()
 
 
-    :return:
+    :return: tuple< bool, float >
     ----------------------------------------------------------------------------
-        see same_expected_generated
+        see worker_same_expected_generated(), seconds the run took
     """
-    res = same_expected_generated(*args)
+    job_id, file_idx, config_file_path = args
+    start = time()
+    res = worker_same_expected_generated(job_id, file_idx, config_file_path)
+    elapsed = time() - start
 
     if not res:
-        formatted_file_path = args[0]
-        config_file_path = args[2]
-        input_file_path = args[3]
-
+        state = WORKER_STATE[job_id]
         print("\nprovided config does not create formatted source file:\n"
               "    %s\n    %s\n->| %s"
-              % (input_file_path, config_file_path, formatted_file_path),
+              % (state["input_files"][file_idx], config_file_path,
+                 state["formatted_files"][file_idx]),
               file=stderr)
-    return res
+    return res, elapsed
 
 
 def sanity_run(args):
     """
-    wrapper for same_expected_generated(), prints error message if the config
-    file does not generate the expected result
+    wrapper for worker_same_expected_generated(), prints error message if the
+    config file does not generate the expected result
+
+    accesses global var(s): WORKER_STATE
 
 
     Parameters
     ----------------------------------------------------------------------------
-    :param args:
-        see same_expected_generated
+    :param args: tuple< int, int, str >
+        job id, file index and config file path,
+        see worker_same_expected_generated()
 
 
     :return:
     ----------------------------------------------------------------------------
-        see same_expected_generated
+        see worker_same_expected_generated()
     """
-    res = same_expected_generated(*args)
+    job_id, file_idx, config_file_path = args
+    res = worker_same_expected_generated(job_id, file_idx, config_file_path)
 
     if not res:
-        formatted_file_path = args[0]
-        input_file_path = args[3]
-
+        state = WORKER_STATE[job_id]
         print("\ngenerated config does not create formatted source file:\n"
               "    %s\n    %s"
-              % (input_file_path, formatted_file_path), file=stderr)
+              % (state["input_files"][file_idx],
+                 state["formatted_files"][file_idx]), file=stderr)
     return res
 
 
-def sanity_run_splitter(uncr_bin, config_list, input_files, formatted_files,
-                        langs, tmp_dir, jobs):
+def check_run(args):
     """
-    writes config option into a file and tests if every input file is formatted
-    so that is matches the content of the according expected file
+    wrapper for worker_same_expected_generated() without error messages
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param args: tuple< int, int, str >
+        job id, file index and config file path,
+        see worker_same_expected_generated()
+
+
+    :return:
+    ----------------------------------------------------------------------------
+        see worker_same_expected_generated()
+    """
+    return worker_same_expected_generated(*args)
+
+
+def diff_run(args):
+    """
+    formats one input file and counts the lines in which the output differs
+    from the according expected file
+
+    accesses global var(s): WORKER_STATE
 
 
     Parameters
     ----------------------------------------------------------------------------
-    :param uncr_bin: str
-        path to the Uncrustify binary
+    :param args: tuple< int, int, str >
+        job id, file index and config file path,
+        see worker_same_expected_generated()
 
-    :param config_list: list< tuple< str, str > >
-        a list of tuples containing option names and values
 
-    :param input_files: list / tuple< str >
-        a list containing paths to a files that are going to be formatted
+    :return: int / None
+    ----------------------------------------------------------------------------
+        amount of added and removed lines, 0 if the contents match, None if
+        Uncrustify failed
+    """
+    job_id, file_idx, cfg_file_path = args
+    state = WORKER_STATE[job_id]
+
+    formatted_string = uncrustify(state["unc_bin_path"], cfg_file_path,
+                                  state["input_files"][file_idx],
+                                  state["langs"][file_idx],
+                                  timeout_sec=worker_timeout(job_id, file_idx))
+    if formatted_string is None:
+        return None
 
-    :param formatted_files: list / tuple< str >
-        a list containing paths to files containing the expected contents
+    expected_string = worker_expected(job_id, file_idx)
+    if formatted_string == expected_string:
+        return 0
 
-    :param langs: list / tuple< str > / None
-        a list of languages the files, used as Uncrustifys -l argument
-        can be None or shorter than the amount of provided files
+    diff = unified_diff(
+        expected_string.decode("UTF-8", "replace").splitlines(),
+        formatted_string.decode("UTF-8", "replace").splitlines(), n=0)
 
-    :param tmp_dir: str
-        the directory in which the config files will be written to
+    return sum(1 for line in diff
+               if line[:1] in "+-" and line[:3] not in ("+++", "---"))
 
-    :param jobs: int
-        number of processes to use
+
+def write_config_file2(args):
+    """
+    Writes two option lists into a config file
 
 
-    :return: bool
+    Parameters
     ----------------------------------------------------------------------------
-        True if all files generate correct results, False oterhwise
+    :param args: list< tuple< str, str > >,
+                 list< tuple< str, str > >, str, int
+        this function is intended to be called by multiprocessing.pool.map()
+        therefore all arguments are inside a list / tuple:
+
+            config_list: list< tuple< str, str > >
+                the first list of tuples containing option names and values
+
+            test_list: list< tuple< str, str > >
+                the second list of tuples containing option names and values
+
+            tmp_dir: str
+                path to a directory in which the config file is going to be
+                written
+
+            idx: int
+                index that is going to be used for the filename
     """
 
-    file_len = len(input_files)
-    if len(formatted_files) != file_len:
-        raise Exception("len(input_files) != len(formatted_files)")
+    config_list0, config_list1, tmp_dir, idx = args
+
+    with open("%s%suncr-r-%d.cfg" % (tmp_dir, os_path_sep, idx), 'w') as f:
+        print_config(config_list0, target_file_obj=f)
+        print("", end='\n', file=f)
+        print_config(config_list1, target_file_obj=f)
+
+
+def gen_multi_combinations(elements, N):
+    """
+    generator function that generates, based on a set of elements, all
+    combinations of 1..N elements
 
-    gen_cfg_path = path_join(tmp_dir, "gen.cfg")
-    with open(gen_cfg_path, 'w') as f:
-        print_config(config_list, target_file_obj=f)
 
-    lang_max_idx = -1 if langs is None else len(langs) - 1
-    args = []
+    Parameters
+    ----------------------------------------------------------------------------
+    :param elements: list / tuple
+        a list of elements from which the combinations will be generated
 
-    for idx in range(file_len):
-        lang = None if idx > lang_max_idx else langs[idx]
+    :param N:
+        the max number of element in a combination
 
-        args.append((formatted_files[idx], uncr_bin, gen_cfg_path,
-                     input_files[idx], lang))
 
-    pool = Pool(processes=jobs)
-    sr = pool.map(sanity_run, args)
+    :return: list
+    ----------------------------------------------------------------------------
+        yields a single combination of the elements
 
-    return False not in sr
+    >>> gen_multi_combinations(["a", "b", "c"], 3)
+    (a); (b); (c); (a,b); (a,c); (b,c); (a,b,c)
+    """
+
+    fields = len(elements)
+    if N > fields:
+        raise Exception("Error: N > len(options)")
+    if N <= 0:
+        raise Exception("Error: N <= 0")
+
+    for n in range(1, N + 1):
+        yield combinations(elements, n)
 
 
 def print_config(config_list, target_file_obj=stdout, exclude_idx=()):
@@ -602,8 +856,11 @@ def print_config(config_list, target_file_obj=stdout, exclude_idx=()):
 
 def get_non_default_options(unc_bin_path, cfg_file_path):
     """
-    calls Uncrustify to generate a debug file from which a config only with
-    non default valued options are extracted
+    extracts the options with non default values from a config file
+
+    The option table is read from the Uncrustify sources (see option_table.py),
+    only if that fails Uncrustify is called to generate a debug file from
+    which the options are extracted
 
     accesses global var(s): NULL_DEV
 
@@ -617,10 +874,17 @@ def get_non_default_options(unc_bin_path, cfg_file_path):
         path to a config file for Uncrustify
 
 
-    :return: list< str >
+    :return: list< tuple< str, str > >
     ----------------------------------------------------------------------------
-        amount of lines in the provided and shortened config
+        a list containing pairs of option names and option values, sorted in
+        the order in which Uncrustify prints them
     """
+    try:
+        return non_default_options(cfg_file_path)
+    except (IOError, OSError, ValueError) as e:
+        print("option table unavailable, using the debug file: %s" % e,
+              file=stderr)
+
     lines = []
 
     with make_raw_temp_file(suffix='.unc') as (fd, file_path):
@@ -633,7 +897,7 @@ def get_non_default_options(unc_bin_path, cfg_file_path):
             lines = fp.read().splitlines()
             lines = [line for line in lines if not line[:1] == '#']
 
-    return lines
+    return parse_config_file(lines)
 
 
 def parse_config_file(file_obj):
@@ -710,211 +974,1319 @@ def count_lines(file_path):
     return in_count
 
 
-def reduce(options_list):
+def options_file_path(tmp_dir, version):
     """
-    Reduces the given options to a minimum
+    path of a published option list, see publish_options()
 
-    accesses global var(s): FLAGS, RESTULTSFLAG, ERROR_CODE
 
     Parameters
     ----------------------------------------------------------------------------
-    :param options_list: list< tuple< str, str > >
-        the list of options that are going to be reduced
+    :param tmp_dir: str
+        the temporary directory of a reduction job
 
-    :return: int, list< tuple< str, str > >
-        status return code, reduced options
+    :param version: int
+        version of the option list
+
+
+    :return: str
     """
-    config_list_len = len(options_list)
-    ret_flag = ERROR_CODE.NONE
+    return path_join(tmp_dir, "options-%d.json" % version)
 
-    file_count = len(FLAGS.input_file_path)
-        lang_max_idx = -1 if FLAGS.lang is None else len(FLAGS.lang) - 1
 
-    pool = Pool(processes=FLAGS.jobs)
-    with make_temp_directory() as tmp_dir:
-        # region sanity run ----------------------------------------------------
-        args = []
-        for idx in range(file_count):
-            lang = None if idx > lang_max_idx else FLAGS.lang[idx]
+def timeouts_file_path(tmp_dir):
+    """
+    path of the published timeouts, see publish_timeouts()
 
-            args.append((FLAGS.formatted_file_path[idx],
-                         FLAGS.uncrustify_binary_path, FLAGS.config_file_path,
-                         FLAGS.input_file_path[idx], lang))
-        sr = pool.map(sanity_raw_run, args)
-        del args[:]
 
-        if False in sr:
-            return ERROR_CODE.SANITY0, []
-        del sr[:]
-
-        # endregion
-        # region config generator loop -----------------------------------------
-        args = []
-
-        for e_idx in range(config_list_len):
-            args.append((options_list, tmp_dir, e_idx))
-        pool.map(write_config_file, args)
-
-        del args[:]
-
-        # endregion
-        # region main loop -----------------------------------------------------
-        args = []
-        jobs = config_list_len * file_count
-
-        for idx in range(jobs):
-            file_idx = idx // config_list_len
-            option_idx = idx % config_list_len
-
-            cfg_file_path = "%s%suncr-%d.cfg" \
-                            % (tmp_dir, os_path_sep, option_idx)
-            lang = None if idx > lang_max_idx else FLAGS.lang[file_idx]
-
-            args.append((idx, FLAGS.formatted_file_path[file_idx],
-                         FLAGS.uncrustify_binary_path, cfg_file_path,
-                         FLAGS.input_file_path[file_idx], lang))
-
-        results = pool.map(process_uncrustify, args)
-        del args[:]
-        # endregion
-        # region clean results -------------------------------------------------
-        option_flags = [RESTULTSFLAG.NONE] * config_list_len
-
-        for r in results:
-            idx = r[0]
-            flag = r[1]
-
-            option_idx = idx % config_list_len
-
-            if option_flags[option_idx] == RESTULTSFLAG.KEEP:
-                    continue
-
-            option_flags[option_idx] = flag
-        del results[:]
-        # endregion
-
-        options_r = [options_list[idx] for idx, x in enumerate(option_flags)
-                     if x == RESTULTSFLAG.REMOVE]
-        options_list = [options_list[idx] for idx, x in enumerate(option_flags)
-                        if x == RESTULTSFLAG.KEEP]
-
-        del option_flags[:]
-
-        # region sanity run ----------------------------------------------------
-        # options can be removed one at a time generating appropriate results,
-        # oddly enough sometimes a config generated this way can fail when a
-        # combination of multiple options is missing
-        s_flag = True
-        if options_r:
-            s_flag = sanity_run_splitter(
-                FLAGS.uncrustify_binary_path, options_list,
-                FLAGS.input_file_path, FLAGS.formatted_file_path, FLAGS.lang,
-                tmp_dir, FLAGS.jobs)
-
-        if not s_flag:
-            ret_flag = ERROR_CODE.SANITY1
-            print("\n\nstumbled upon complex option dependencies in \n"
-                  "    %s\n"
-                  "trying to add back minimal amount of removed options\n"
-                  % FLAGS.config_file_path, file=stderr)
-
-            ret_options = add_back(
-                FLAGS.uncrustify_binary_path, FLAGS.input_file_path,
-                FLAGS.formatted_file_path, FLAGS.lang, options_r,
-                options_list, tmp_dir)
-
-            if ret_options:
-                options_list.extend(ret_options)
-
-                s_flag = sanity_run_splitter(
-                    FLAGS.uncrustify_binary_path, options_list,
-                    FLAGS.input_file_path, FLAGS.formatted_file_path,
-                    FLAGS.lang, tmp_dir, FLAGS.jobs)
-
-                if s_flag:
-                    print("Success!", file=stderr)
-                    ret_flag = ERROR_CODE.NONE
-                    # endregion
-    return ret_flag, options_list if ret_flag == ERROR_CODE.NONE else []
+    Parameters
+    ----------------------------------------------------------------------------
+    :param tmp_dir: str
+        the temporary directory of a reduction job
 
 
-def reduce_mode():
+    :return: str
+    """
+    return path_join(tmp_dir, "timeouts.json")
+
+
+def make_job(job_id, unc_bin_path, config_file_path, input_files,
+             formatted_files, langs=None, tmp_root=None, passes=5,
+             checkpoint=None, resume=False, token_filter=True,
+             add_back=ADD_BACK_MODES[0], graph=None, event_log=None,
+             quiet=False, jobs=cpu_count()):
+    """
+    creates the description of a reduction job, see reduce_job_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job_id: int
+        id of the job, unique for all jobs that share a pool
+
+    :params unc_bin_path, config_file_path, input_files, formatted_files, langs:
+        see init_worker()
+
+    :param tmp_root: str
+        directory in which the temporary directory of the job is created
+
+    :param passes: int
+        max. number of cleaning passes
+
+    :param checkpoint: str / None
+        file into which the state of the reduction is written after each stage
+
+    :param resume: bool
+        whether an existing checkpoint is going to be continued
+
+    :param token_filter: bool
+        whether token_filter_steps() is used before the reduction passes
+
+    :param add_back: str
+        one of ADD_BACK_MODES, whether add_back_cover_steps() is tried before
+        add_back_steps() if the reduced options fail the sanity run
+
+    :param graph: str / None
+        path to an option graph file (see option_graph.py) that is used to
+        guess the options to restore and that records the restored options
+
+    :param event_log: str / None
+        file to which the telemetry events are appended as JSON lines
+
+    :param quiet: bool
+        whether status messages are suppressed
+
+    :param jobs: int
+        number of processes of the pool, used to size the batches
+
+
+    :return: dict
+    """
+    return dict(id=job_id, unc_bin_path=unc_bin_path,
+                config_file_path=config_file_path,
+                input_files=list(input_files),
+                formatted_files=list(formatted_files), langs=langs,
+                tmp_dir=path_join(tmp_root, str(job_id)), passes=passes,
+                checkpoint=checkpoint, resume=resume,
+                token_filter=token_filter, add_back=add_back, graph=graph,
+                event_log=event_log, quiet=quiet, jobs=jobs,
+                options_version=-1, state={},
+                telemetry=dict(stage=None, stages=OrderedDict()))
+
+
+def create_pool(jobs, processes):
+    """
+    creates a process pool whose workers were set up with init_worker()
+
+    the file paths and the binary path of every job are passed once per
+    worker, the tasks only carry indices
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param jobs: list< dict >
+        the jobs that are going to use the pool, see make_job()
+
+    :param processes: int
+        number of processes to use
+
+
+    :return: multiprocessing.pool.Pool
+    """
+    static_keys = ("unc_bin_path", "config_file_path", "input_files",
+                   "formatted_files", "langs", "tmp_dir")
+
+    return Pool(processes=processes, initializer=init_worker,
+                initargs=(dict((job["id"], dict((k, job[k])
+                                                for k in static_keys))
+                               for job in jobs),))
+
+
+def run_steps(pool, steps):
+    """
+    drives a step generator (see reduce_job_steps()) with a pool, one step
+    after another
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param pool: multiprocessing.pool.Pool
+        a pool created by create_pool()
+
+    :param steps: generator
+        yields tuples of a pool function and a list of its arguments and
+        receives the list of results
+
+
+    :return:
+    ----------------------------------------------------------------------------
+        the return value of the generator
+    """
+    value = None
+    while True:
+        try:
+            func, args = steps.send(value)
+        except StopIteration as e:
+            return e.value
+        value = pool.map(func, args)
+
+
+def run_concurrent_steps(pool, keyed_steps, max_active, on_done):
+    """
+    drives many step generators (see reduce_job_steps()) with one shared pool,
+    the steps of up to max_active generators are queued on the pool at the
+    same time so that all processes stay busy
+
+    a generator that raises an exception or whose pool tasks raise an
+    exception is finished with the value None
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param pool: multiprocessing.pool.Pool
+        a pool created by create_pool()
+
+    :param keyed_steps: iterable< tuple< object, generator > >
+        pairs of a key and a step generator, consumed lazily
+
+    :param max_active: int
+        max. number of generators that are run at the same time
+
+    :param on_done: callable
+        called with the key and the return value of every finished generator
+    """
+    results_queue = Queue()
+    keyed_steps = iter(keyed_steps)
+    active = {}
+
+    def advance(key, value):
+        # map_async() never calls back for an empty args list, the results
+        # of such a step are sent to the generator right away
+        args = ()
+        while not args:
+            try:
+                func, args = active[key].send(value)
+            except StopIteration as e:
+                del active[key]
+                on_done(key, e.value)
+                return
+            except Exception as e:
+                del active[key]
+                print("%s: %s" % (key, e), file=stderr)
+                on_done(key, None)
+                return
+            value = []
+
+        pool.map_async(func, args,
+                       callback=lambda res: results_queue.put((key, res,
+                                                               None)),
+                       error_callback=lambda err: results_queue.put((key,
+                                                                     None,
+                                                                     err)))
+
+    while True:
+        while len(active) < max_active:
+            try:
+                key, steps = next(keyed_steps)
+            except StopIteration:
+                break
+            active[key] = steps
+            advance(key, None)
+
+        if not active:
+            break
+
+        key, results, error = results_queue.get()
+        if error is not None:
+            active.pop(key).close()
+            print("%s: %s" % (key, error), file=stderr)
+            on_done(key, None)
+            continue
+
+        advance(key, results)
+
+
+def file_digest(file_path):
+    """
+    sha256 digest of the content of a file
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param file_path: str
+        path to the file
+
+
+    :return: str
+    """
+    with open(file_path, 'rb') as f:
+        return sha256(f.read()).hexdigest()
+
+
+def checkpoint_key(job):
+    """
+    identifies the reduction a checkpoint belongs to: the paths and the
+    content digests of the binary, the config and the input and expected
+    files, so that editing one of them invalidates the checkpoint
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+
+    :return: list
+    """
+    file_paths = ([job["unc_bin_path"], job["config_file_path"]]
+                  + job["input_files"] + job["formatted_files"])
+
+    return [job["unc_bin_path"], job["config_file_path"], job["input_files"],
+            job["formatted_files"], job["langs"],
+            [file_digest(file_path) for file_path in file_paths]]
+
+
+def load_checkpoint(job):
+    """
+    initializes the state of a job, with the content of its checkpoint file if
+    it is resumed and the checkpoint belongs to the same reduction
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+    """
+    state = job["state"]
+    state.clear()
+    state.update(key=checkpoint_key(job), sanity=False, timeouts=None,
+                 pass_idx=0, option_list=None, last_len=-1, results={},
+                 add_back=None)
+
+    checkpoint = job["checkpoint"]
+    if not job["resume"] or not checkpoint or not exists(checkpoint):
+        return
+
+    with open(checkpoint, 'r') as f:
+        saved_state = json_load(f)
+
+    if saved_state.get("key") != state["key"]:
+        print("checkpoint %s belongs to another reduction, starting over"
+              % checkpoint, file=stderr)
+        return
+
+    state.update(saved_state)
+    if state["option_list"] is not None:
+        state["option_list"] = [tuple(o) for o in state["option_list"]]
+    print("resuming from %s, pass %d" % (checkpoint, state["pass_idx"]),
+          file=stderr)
+
+
+def save_checkpoint(job, **changes):
+    """
+    updates the state of a job and writes it atomically to its checkpoint file
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param changes:
+        the state entries that are going to be changed
+    """
+    job["state"].update(changes)
+
+    checkpoint = job["checkpoint"]
+    if not checkpoint:
+        return
+
+    tmp_path = "%s.tmp" % checkpoint
+    with open(tmp_path, 'w') as f:
+        json_dump(job["state"], f)
+    os_replace(tmp_path, checkpoint)
+
+
+def remove_checkpoint(job):
+    """
+    removes the checkpoint file of a finished reduction
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+    """
+    checkpoint = job["checkpoint"]
+    if checkpoint and exists(checkpoint):
+        os_remove(checkpoint)
+
+
+def log_event(job, event, **fields):
+    """
+    appends an event as a JSON line to the event log of a job
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param event: str
+        name of the event
+
+    :param fields:
+        additional entries of the event
+    """
+    if not job["event_log"]:
+        return
+
+    fields.update(time=time(), job=job["id"],
+                  config=job["config_file_path"], event=event)
+    with open(job["event_log"], 'a') as f:
+        json_dump(fields, f, sort_keys=True)
+        f.write("\n")
+
+
+def stage_begin(job, stage, total=0, hits=0):
+    """
+    starts the telemetry of a reduction stage
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param stage: str
+        name of the stage
+
+    :param total: int
+        amount of tasks of the stage, 0 if unknown
+
+    :param hits: int
+        amount of tasks whose results are already known, see stage_progress()
+    """
+    telemetry = job["telemetry"]
+    telemetry.update(stage=stage, start=time(), total=total, done=hits,
+                     hits=hits, runs=0, last_print=0.0, printed=False)
+    log_event(job, "stage_begin", stage=stage, total=total, hits=hits)
+
+
+def stage_progress(job, runs, hits=0):
+    """
+    counts finished tasks of the current stage and prints a progress line to
+    stderr: stage, done / total tasks, Uncrustify runs per second, memo hit
+    rate (results reused from a checkpoint) and ETA
+
+    accesses global var(s): PROGRESS_INTERVAL, PROGRESS_LOG_INTERVAL
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param runs: int
+        amount of tasks that were run
+
+    :param hits: int
+        amount of tasks whose results were reused
+    """
+    telemetry = job["telemetry"]
+    telemetry["runs"] += runs
+    telemetry["hits"] += hits
+    telemetry["done"] += runs + hits
+
+    now = time()
+    tty = stderr.isatty()
+    if now - telemetry["last_print"] < (PROGRESS_INTERVAL if tty
+                                        else PROGRESS_LOG_INTERVAL):
+        return
+    telemetry["last_print"] = now
+
+    elapsed = max(now - telemetry["start"], 1e-6)
+    rate = telemetry["runs"] / elapsed
+    hit_rate = 100.0 * telemetry["hits"] / max(telemetry["done"], 1)
+
+    total = telemetry["total"]
+    if total and rate > 0:
+        eta = "%ds" % ((total - telemetry["done"]) / rate)
+    else:
+        eta = "?"
+
+    log_event(job, "progress", stage=telemetry["stage"],
+              done=telemetry["done"], total=total, rate=rate,
+              hit_rate=hit_rate)
+
+    if job["quiet"]:
+        return
+
+    line = "%s: %d/%s runs, %.1f runs/s, memo %.0f%%, ETA %s" \
+           % (telemetry["stage"], telemetry["done"], total or "?", rate,
+              hit_rate, eta)
+    if tty:
+        print("\r%s\033[K" % line, end='', file=stderr)
+        telemetry["printed"] = True
+    else:
+        print(line, file=stderr)
+
+
+def stage_end(job):
+    """
+    finishes the telemetry of the current stage and adds its time to the
+    stage times of the job, see print_stage_times()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+    """
+    telemetry = job["telemetry"]
+    stage = telemetry["stage"]
+    if stage is None:
+        return
+
+    elapsed = time() - telemetry["start"]
+    seconds, runs = telemetry["stages"].get(stage, (0.0, 0))
+    telemetry["stages"][stage] = (seconds + elapsed, runs + telemetry["runs"])
+    telemetry["stage"] = None
+
+    if telemetry["printed"]:
+        print("", file=stderr)
+
+    log_event(job, "stage_end", stage=stage, seconds=elapsed,
+              runs=telemetry["runs"], hits=telemetry["hits"])
+
+
+def timed_steps(job, stage, steps, total=0):
+    """
+    wraps a step generator into a telemetry stage, every finished step counts
+    as one run per task, a known total grows with the tasks that are
+    submitted beyond it
+
+    step generator, see run_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param stage: str
+        name of the stage
+
+    :param steps: generator
+        the wrapped step generator
+
+    :param total: int
+        least amount of tasks of the stage, 0 if unknown
+
+
+    :return:
+    ----------------------------------------------------------------------------
+        the return value of the wrapped generator
+    """
+    telemetry = job["telemetry"]
+    stage_begin(job, stage, total)
+    try:
+        value = None
+        while True:
+            try:
+                func, args = steps.send(value)
+            except StopIteration as e:
+                return e.value
+
+            if total:
+                telemetry["total"] = max(telemetry["total"],
+                                         telemetry["done"] + len(args))
+            value = yield func, args
+            stage_progress(job, len(args))
+    finally:
+        stage_end(job)
+
+
+def print_stage_times(job):
+    """
+    prints the time and the amount of Uncrustify runs per stage to stderr and
+    logs them as a summary event
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+    """
+    stages = job["telemetry"]["stages"]
+    log_event(job, "summary", stages=stages)
+
+    if job["quiet"] or not stages:
+        return
+
+    total = sum(seconds for seconds, runs in stages.values())
+    print("stage times:", file=stderr)
+    for stage, (seconds, runs) in stages.items():
+        print("    %-18s %8.2fs %5.1f%% %8d runs"
+              % (stage, seconds, 100.0 * seconds / max(total, 1e-6), runs),
+              file=stderr)
+
+
+def publish_options(job, options_list):
+    """
+    writes an option list into the temporary directory of a job so that the
+    pool workers can read it once, see worker_options()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_list: list< tuple< str, str > >
+        a list of tuples containing option names and values
+
+
+    :return: int
+    ----------------------------------------------------------------------------
+        the version of the published list
+    """
+    job["options_version"] += 1
+    version = job["options_version"]
+
+    with open(options_file_path(job["tmp_dir"], version), 'w') as f:
+        json_dump(options_list, f)
+
+    if version > 0:
+        os_remove(options_file_path(job["tmp_dir"], version - 1))
+
+    return version
+
+
+def calibrate_timeouts(run_times):
+    """
+    derives the per file timeouts from the times of the sanity run
+
+    accesses global var(s): TIMEOUT_FACTOR, TIMEOUT_MARGIN
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param run_times: list< float >
+        seconds the sanity run took for each input file
+
+
+    :return: list< float >
+    """
+    return [TIMEOUT_FACTOR * run_time + TIMEOUT_MARGIN
+            for run_time in run_times]
+
+
+def publish_timeouts(job, timeouts):
+    """
+    writes the per file timeouts into the temporary directory of a job so
+    that the pool workers can read them once, see worker_timeout()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param timeouts: list< float >
+        seconds after which a run is killed, one per input file
+    """
+    tmp_path = "%s.tmp" % timeouts_file_path(job["tmp_dir"])
+    with open(tmp_path, 'w') as f:
+        json_dump(timeouts, f)
+    os_replace(tmp_path, timeouts_file_path(job["tmp_dir"]))
+
+
+def add_back_steps(job, options_r, options_k, start_idx=0, progress=None):
+    """
+    lets Uncrustify format files with generated configs files until all
+    formatted files match their according expected files.
+
+    Multiple config files are generated based on a (base) list of Uncrustify
+    options combined with additional (new) options derived from combinations of
+    another list of options.
+
+    step generator, see run_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_r: list< tuple< str, str > >
+        the list of options from which combinations will be derived
+
+    :param options_k: list< tuple< str, str > >
+        the (base) list of Uncrustify options
+
+    :param start_idx: int
+        amount of combinations that were already checked by a previous run
+
+    :param progress: callable / None
+        called with the amount of checked combinations after every
+        CHECKPOINT_BATCH combinations
+
+
+    :return: list< tuple< str, str > > / None
+    ----------------------------------------------------------------------------
+        list of additional option that were needed to generate matching file
+        contents
     """
-    the mode that minimizes a config file as much as possible
+    tmp_dir = job["tmp_dir"]
+    file_range = range(len(job["input_files"]))
 
-    accesses global var(s): FLAGS, ERROR_CODE
+    combination_idx = 0
+    for m_combination in gen_multi_combinations(options_r, len(options_r)):
+        for idx, (r_combination) in enumerate(m_combination):
+            combination_idx += 1
+            if combination_idx <= start_idx:
+                continue
+            if progress is not None \
+                    and combination_idx % CHECKPOINT_BATCH == 0:
+                progress(combination_idx - 1)
+
+            write_config_file2((options_k, r_combination, tmp_dir, idx))
+
+            cfg_file_path = "%s%suncr-r-%d.cfg" % (tmp_dir, os_path_sep, idx)
+            res = yield check_run, [(job["id"], file_idx, cfg_file_path)
+                                    for file_idx in file_range]
+
+            # all files equal -> the added back options are sufficient
+            if False not in res:
+                return r_combination
+    return None
+
+
+def add_back_prior_steps(job, options_r, options_k):
+    """
+    restores the removed options that the option graph of the job knows to
+    have been restored before, checked with a single run per file, see
+    option_graph.likely_restores(). If they are sufficient, the ones that are
+    not needed are dropped again, weakest evidence first, see
+    prune_restores_steps()
+
+    step generator, see run_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_r: list< tuple< str, str > >
+        the removed options from which the restored ones are chosen
+
+    :param options_k: list< tuple< str, str > >
+        the (base) list of Uncrustify options
+
+
+    :return: list< tuple< str, str > > / None
+    ----------------------------------------------------------------------------
+        the restored options if they are sufficient, None otherwise
+    """
+    names = likely_restores(load_graph(job["graph"]),
+                            [option[0] for option in options_r])
+    if not names:
+        return None
+
+    option_map = dict(options_r)
+    options_p = [(name, option_map[name]) for name in names]
+
+    cfg_file_path = path_join(job["tmp_dir"], "uncr-p.cfg")
+    with open(cfg_file_path, 'w') as f:
+        print_config(options_k + options_p, target_file_obj=f)
+
+    res = yield check_run, [(job["id"], file_idx, cfg_file_path)
+                            for file_idx in range(len(job["input_files"]))]
+    if False in res:
+        return None
+
+    # the graph may know more restores than this config needs
+    return (yield from prune_restores_steps(job, options_p, options_k))
+
+
+def prune_restores_steps(job, options_p, options_k):
+    """
+    drops restored options that are not needed: each of them is removed once,
+    the last restored first, and stays removed if all formatted files still
+    match their expected files, at least one option is kept
+
+    step generator, see run_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_p: list< tuple< str, str > >
+        the restored options, sufficient together with options_k
+
+    :param options_k: list< tuple< str, str > >
+        the (base) list of Uncrustify options
+
+
+    :return: list< tuple< str, str > >
+    ----------------------------------------------------------------------------
+        the needed restored options
+    """
+    cfg_file_path = path_join(job["tmp_dir"], "uncr-d.cfg")
+    file_range = range(len(job["input_files"]))
+
+    for option in reversed(list(options_p)):
+        if len(options_p) == 1:
+            break
+
+        options_d = [o for o in options_p if o is not option]
+        with open(cfg_file_path, 'w') as f:
+            print_config(options_k + options_d, target_file_obj=f)
+
+        res = yield check_run, [(job["id"], file_idx, cfg_file_path)
+                                for file_idx in file_range]
+        if False not in res:
+            options_p = options_d
+
+    return options_p
+
+
+def add_back_cover_steps(job, options_r, options_k):
+    """
+    restores removed options greedily until all formatted files match their
+    expected files, then drops the ones that are not needed, see
+    prune_restores_steps()
+
+    every round records which of the still failing files each removed option
+    fixes when it is restored on its own and by how many differing lines, then
+    restores the option that fixes the most files, with the least remaining
+    differing lines as tie-breaker. Only the amount of rounds times the amount
+    of removed options is checked, instead of all combinations that
+    add_back_steps() enumerates.
+
+    step generator, see run_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_r: list< tuple< str, str > >
+        the removed options from which the restored ones are chosen
+
+    :param options_k: list< tuple< str, str > >
+        the (base) list of Uncrustify options
+
+
+    :return: list< tuple< str, str > > / None
+    ----------------------------------------------------------------------------
+        list of additional option that were needed to generate matching file
+        contents, None if no option brings the formatted files closer to their
+        expected files
+    """
+    tmp_dir = job["tmp_dir"]
+    file_range = range(len(job["input_files"]))
+    base_cfg_path = path_join(tmp_dir, "uncr-c.cfg")
+
+    def diff_lines(diff):
+        return float("inf") if diff is None else diff
+
+    restored = []
+    candidates = list(options_r)
+    while True:
+        with open(base_cfg_path, 'w') as f:
+            print_config(options_k + restored, target_file_obj=f)
+
+        diffs = yield diff_run, [(job["id"], file_idx, base_cfg_path)
+                                 for file_idx in file_range]
+
+        failing = [file_idx for file_idx in file_range if diffs[file_idx] != 0]
+        if not failing:
+            # options restored early may be covered by later ones
+            return (yield from prune_restores_steps(job, restored, options_k))
+        if not candidates:
+            return None
+
+        for idx, option in enumerate(candidates):
+            write_config_file2((options_k + restored, [option], tmp_dir, idx))
+
+        candidate_diffs = yield diff_run, [
+            (job["id"], file_idx,
+             "%s%suncr-r-%d.cfg" % (tmp_dir, os_path_sep, idx))
+            for idx in range(len(candidates)) for file_idx in failing]
+
+        failing_len = len(failing)
+        best_idx = None
+        best_score = None
+        for idx in range(len(candidates)):
+            row = candidate_diffs[idx * failing_len:(idx + 1) * failing_len]
+            score = (row.count(0), -sum(diff_lines(diff) for diff in row))
+
+            if best_score is None or score > best_score:
+                best_idx, best_score = idx, score
+
+        # nothing gets fixed and nothing gets closer, a single option is not
+        # enough to make progress
+        if best_score[0] == 0 and -best_score[1] >= sum(
+                diff_lines(diffs[file_idx]) for file_idx in failing):
+            return None
+
+        restored.append(candidates.pop(best_idx))
+
+
+def sanity_check_steps(job, config_list):
+    """
+    writes config option into a file and tests if every input file is formatted
+    so that is matches the content of the according expected file
+
+    step generator, see run_steps()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param config_list: list< tuple< str, str > >
+        a list of tuples containing option names and values
+
+
+    :return: bool
+    ----------------------------------------------------------------------------
+        True if all files generate correct results, False oterhwise
+    """
+
+    gen_cfg_path = path_join(job["tmp_dir"], "gen.cfg")
+    with open(gen_cfg_path, 'w') as f:
+        print_config(config_list, target_file_obj=f)
+
+    sr = yield sanity_run, [(job["id"], idx, gen_cfg_path)
+                            for idx in range(len(job["input_files"]))]
+
+    return False not in sr
+
+
+def token_filter_steps(job, options_list):
+    """
+    speculatively removes all options whose trigger tokens (see TOKEN_TRIGGERS)
+    do not appear in any of the input files, the removal is checked with a
+    single sanity run and discarded if it fails
+
+    step generator, see run_steps()
+
+    accesses global var(s): TOKEN_TRIGGERS
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_list: list< tuple< str, str > >
+        the list of options that are going to be filtered
+
+
+    :return: list< tuple< str, str > >
+    ----------------------------------------------------------------------------
+        the options that are left for reduce_steps()
+    """
+    inventory = set()
+    file_range = range(len(job["input_files"]))
+
+    all_token_types = yield worker_token_types, [(job["id"], idx)
+                                                 for idx in file_range]
+    for token_types in all_token_types:
+        if token_types is None:
+            return options_list
+        inventory.update(token_types)
+
+    untriggered = set()
+    for token_types, option_names in TOKEN_TRIGGERS:
+        if inventory.isdisjoint(token_types):
+            untriggered.update(option_names)
+
+    options_k = [option for option in options_list
+                 if option[0] not in untriggered]
+    removed_len = len(options_list) - len(options_k)
+
+    if removed_len == 0:
+        return options_list
+
+    if not (yield from sanity_check_steps(job, options_k)):
+        print("token filter: keeping %d untriggered options" % removed_len,
+              file=stderr)
+        return options_list
+
+    if not job["quiet"]:
+        print("token filter: removed %d untriggered options" % removed_len,
+              file=stderr)
+    return options_k
+
+
+def reduce_steps(job, options_list):
     """
+    Reduces the given options to a minimum, continues the stages recorded in
+    the state of the job
+
+    step generator, see run_steps()
+
+    accesses global var(s): RESTULTSFLAG, ERROR_CODE, ADD_BACK_MODES
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+    :param options_list: list< tuple< str, str > >
+        the list of options that are going to be reduced
+
+    :return: int, list< tuple< str, str > >
+        status return code, reduced options
+    """
+    config_list_len = len(options_list)
     ret_flag = ERROR_CODE.NONE
-    option_list = {}
 
+    job_id = job["id"]
+    state = job["state"]
+    file_count = len(job["input_files"])
+
+    # region sanity run --------------------------------------------------------
+    if not state["sanity"]:
+        stage_begin(job, "sanity", file_count)
+        sr = yield sanity_raw_run, [(job_id, idx, job["config_file_path"])
+                                    for idx in range(file_count)]
+        stage_progress(job, file_count)
+        stage_end(job)
+
+        if False in [res for res, run_time in sr]:
+            return ERROR_CODE.SANITY0, []
+
+        timeouts = calibrate_timeouts([run_time for res, run_time in sr])
+        publish_timeouts(job, timeouts)
+        save_checkpoint(job, sanity=True, timeouts=timeouts)
+
+    # endregion
+    # region config generator loop ---------------------------------------------
+    # results of an interrupted run of this pass, key: str(idx)
+    results = dict(state["results"])
+
+    jobs = config_list_len * file_count
+    todo = [idx for idx in range(jobs) if str(idx) not in results]
+
+    version = publish_options(job, options_list)
+    option_indices = sorted(set(idx % config_list_len for idx in todo))
+
+    if option_indices:
+        stage_begin(job, "config generation", len(option_indices))
+        yield write_config_file, [(job_id, version, option_idx)
+                                  for option_idx in option_indices]
+        stage_progress(job, len(option_indices))
+        stage_end(job)
+
+    # endregion
+    # region main loop ---------------------------------------------------------
+    last_save = time()
+    batch_size = job["jobs"] * MAIN_LOOP_BATCH
+
+    stage_begin(job, "main loop", jobs, hits=jobs - len(todo))
+    for batch_start in range(0, len(todo), batch_size):
+        batch = todo[batch_start:batch_start + batch_size]
+        batch_results = yield process_uncrustify, [(job_id, version, idx)
+                                                   for idx in batch]
+        for idx, flag in batch_results:
+            results[str(idx)] = flag
+        stage_progress(job, len(batch))
+
+        if time() - last_save > CHECKPOINT_INTERVAL:
+            save_checkpoint(job, results=results)
+            last_save = time()
+    stage_end(job)
+    save_checkpoint(job, results=results)
+    # endregion
+    # region clean results -----------------------------------------------------
+    option_flags = [RESTULTSFLAG.NONE] * config_list_len
+
+    for idx, flag in results.items():
+        option_idx = int(idx) % config_list_len
+
+        if option_flags[option_idx] in (RESTULTSFLAG.KEEP,
+                                        RESTULTSFLAG.TIMEOUT):
+            continue
+
+        option_flags[option_idx] = flag
+    results.clear()
+
+    # an option whose removal makes Uncrustify hang is kept, but not silently
+    timed_out = [options_list[idx][0] for idx, x in enumerate(option_flags)
+                 if x == RESTULTSFLAG.TIMEOUT]
+    if timed_out:
+        print("%s: keeping %d options whose removal timed out: %s"
+              % (job["config_file_path"], len(timed_out),
+                 ", ".join(timed_out)), file=stderr)
+    # endregion
+
+    options_r = [options_list[idx] for idx, x in enumerate(option_flags)
+                 if x == RESTULTSFLAG.REMOVE]
+    options_list = [options_list[idx] for idx, x in enumerate(option_flags)
+                    if x in (RESTULTSFLAG.KEEP, RESTULTSFLAG.TIMEOUT)]
+
+    del option_flags[:]
+
+    # region sanity run --------------------------------------------------------
+    # options can be removed one at a time generating appropriate results,
+    # oddly enough sometimes a config generated this way can fail when a
+    # combination of multiple options is missing
+    s_flag = True
+    if options_r:
+        s_flag = yield from timed_steps(
+            job, "sanity", sanity_check_steps(job, options_list), file_count)
+
+    if not s_flag:
+        ret_flag = ERROR_CODE.SANITY1
+        print("\n\nstumbled upon complex option dependencies in \n"
+              "    %s\n"
+              "trying to add back minimal amount of removed options\n"
+              % job["config_file_path"], file=stderr)
+
+        # continue an interrupted add back of the same options
+        add_back_state = {"options_k": [list(o) for o in options_list],
+                          "options_r": [list(o) for o in options_r],
+                          "idx": 0}
+        previous_state = state["add_back"]
+        if previous_state is not None \
+                and previous_state["options_k"] == add_back_state["options_k"] \
+                and previous_state["options_r"] == add_back_state["options_r"]:
+            add_back_state["idx"] = previous_state["idx"]
+
+        def add_back_progress(combination_idx):
+            add_back_state["idx"] = combination_idx
+            save_checkpoint(job, add_back=add_back_state)
+
+        ret_options = None
+        if job["graph"] and add_back_state["idx"] == 0:
+            ret_options = yield from timed_steps(
+                job, "add-back", add_back_prior_steps(job, options_r,
+                                                      options_list))
+
+        if ret_options is None and job["add_back"] == ADD_BACK_MODES[0] \
+                and add_back_state["idx"] == 0:
+            ret_options = yield from timed_steps(
+                job, "add-back", add_back_cover_steps(job, options_r,
+                                                      options_list))
+
+        if ret_options is None:
+            ret_options = yield from timed_steps(
+                job, "add-back",
+                add_back_steps(job, options_r, options_list,
+                               add_back_state["idx"], add_back_progress))
+
+        if ret_options:
+            options_list.extend(ret_options)
+
+            s_flag = yield from timed_steps(
+                job, "sanity", sanity_check_steps(job, options_list),
+                file_count)
+
+            if s_flag:
+                print("Success!", file=stderr)
+                ret_flag = ERROR_CODE.NONE
+
+                if job["graph"]:
+                    record_restore(job["graph"],
+                                   [option[0] for option in ret_options])
+    # endregion
+
+    return ret_flag, options_list if ret_flag == ERROR_CODE.NONE else []
+
+
+def reduce_job_steps(job):
+    """
+    minimizes the config file of a job as much as possible
+
+    step generator, see run_steps() and run_concurrent_steps()
+
+    accesses global var(s): ERROR_CODE
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param job: dict
+        see make_job()
+
+
+    :return: int, list< tuple< str, str > >, tuple< int, int, int, bool >
+    ----------------------------------------------------------------------------
+        status return code, the reduced options and the stats for
+        print_reduce_result(): initial config lines, non default options,
+        kept options and whether all options were already removed before the
+        reduction
+    """
     # gen & parse non default config
-    lines = get_non_default_options(FLAGS.uncrustify_binary_path,
-                                    FLAGS.config_file_path)
-    option_list = parse_config_file(lines)
+    option_list = get_non_default_options(job["unc_bin_path"],
+                                          job["config_file_path"])
     config_list_len = len(option_list)
 
-    config_lines_init = count_lines(FLAGS.config_file_path)
-    config_lines_ndef = len(lines)
-    del lines[:]
+    config_lines_init = count_lines(job["config_file_path"])
+    config_lines_ndef = config_list_len
 
     # early return if all options are already removed at this point
     if config_list_len == 0:
-        if not FLAGS.empty_nochange \
-                or (config_lines_init - config_lines_ndef) > 0:
-            if not FLAGS.quiet:
-                print("\n%s" % '# '.ljust(78, '-'))
+        return ERROR_CODE.NONE, [], (config_lines_init, config_lines_ndef, 0,
+                                     True)
 
-            print(" ")
+    ret_flag = ERROR_CODE.NONE
+    makedirs(job["tmp_dir"])
+    try:
+        load_checkpoint(job)
+        state = job["state"]
 
-            if not FLAGS.quiet:
-                print("%s" % '# '.ljust(78, '-'))
-                print("# initial config lines: %d,\n"
-                      "# default options and unneeded lines: %d,\n"
-                      "# unneeded options: 0,\n"
-                      "# kept options: 0"
-                      % (config_lines_init, config_lines_init))
-        print("ret_flag: 0", file=stderr)
-        return ERROR_CODE.NONE
+        if state["timeouts"] is not None:
+            publish_timeouts(job, state["timeouts"])
 
-    # gen reduced options
-    config_lines_redu = -1
-    for i in range(FLAGS.passes):
-        old_config_lines_redu = config_lines_redu
+        if state["option_list"] is not None:
+            option_list = state["option_list"]
+        else:
+            # drop options that can not affect any input in one batched step
+            if job["token_filter"]:
+                option_list = yield from timed_steps(
+                    job, "token filter", token_filter_steps(job, option_list),
+                    len(job["input_files"]))
+            save_checkpoint(job, option_list=option_list)
+
+        # gen reduced options
+        config_lines_redu = state["last_len"]
+        for i in range(state["pass_idx"], job["passes"]):
+            old_config_lines_redu = config_lines_redu
+
+            ret_flag, option_list = yield from reduce_steps(job, option_list)
+            config_lines_redu = len(option_list)
+
+            if ret_flag != ERROR_CODE.NONE:
+                break
+
+            converged = config_lines_redu == old_config_lines_redu
+            save_checkpoint(job, pass_idx=job["passes"] if converged else i + 1,
+                            option_list=option_list,
+                            last_len=config_lines_redu, results={},
+                            add_back=None)
+            if converged:
+                break
+    finally:
+        # the tmp root may already be gone if an abandoned job is finalized
+        rmtree(job["tmp_dir"], ignore_errors=True)
+        print_stage_times(job)
 
-        ret_flag, option_list = reduce(option_list)
-        config_lines_redu = len(option_list)
+    if ret_flag != ERROR_CODE.NONE:
+        return ret_flag, [], None
 
-        if ret_flag != ERROR_CODE.NONE \
-                or config_lines_redu == old_config_lines_redu:
-                    break
+    remove_checkpoint(job)
 
-    if ret_flag == ERROR_CODE.NONE:
-        # use the debug file trick again to get correctly sorted options
+    try:
+        option_list = sort_options(option_list)
+    except (IOError, OSError, ValueError):
+        # parse the reduced config again to get correctly sorted options
         with make_raw_temp_file(suffix='.unc') as (fd, file_path):
             with open_fd(fd, 'w') as f:
                 print_config(option_list, target_file_obj=f)
 
-            lines = get_non_default_options(FLAGS.uncrustify_binary_path,
-                                            file_path)
-            option_list = parse_config_file(lines)
+            option_list = get_non_default_options(job["unc_bin_path"],
+                                                  file_path)
 
-        # print output + stats
-        if not FLAGS.empty_nochange or config_lines_ndef != config_lines_redu:
-            if not FLAGS.quiet:
-                print("\n%s" % '# '.ljust(78, '-'))
+    return ret_flag, option_list, (config_lines_init, config_lines_ndef,
+                                   config_lines_redu, False)
 
-            print_config(option_list)
 
-            if not FLAGS.quiet:
-                print("\n%s" % '# '.ljust(78, '-'))
+def print_reduce_result(option_list, stats, quiet=False, empty_nochange=False,
+                        target_file_obj=stdout):
+    """
+    prints the reduced config and its stats
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param option_list: list< tuple< str, str > >
+        the reduced options
+
+    :param stats: tuple< int, int, int, bool >
+        see reduce_job_steps()
+
+    :param quiet: bool
+        whether the stats are suppressed
+
+    :param empty_nochange: bool
+        whether nothing is printed if no options could be removed
+
+    :param target_file_obj: file object
+        see file param of print()
+    """
+    config_lines_init, config_lines_ndef, config_lines_redu, early = stats
+
+    if early:
+        if not empty_nochange \
+                or (config_lines_init - config_lines_ndef) > 0:
+            if not quiet:
+                print("\n%s" % '# '.ljust(78, '-'), file=target_file_obj)
+
+            print(" ", file=target_file_obj)
+
+            if not quiet:
+                print("%s" % '# '.ljust(78, '-'), file=target_file_obj)
                 print("# initial config lines: %d,\n"
                       "# default options and unneeded lines: %d,\n"
-                      "# unneeded options: %d,\n"
-                      "# kept options: %d"
-                      % (config_lines_init,
-                         config_lines_init - config_lines_ndef,
-                         config_lines_ndef - config_lines_redu,
-                         config_lines_redu))
+                      "# unneeded options: 0,\n"
+                      "# kept options: 0"
+                      % (config_lines_init, config_lines_init),
+                      file=target_file_obj)
+        return
+
+    if not empty_nochange or config_lines_ndef != config_lines_redu:
+        if not quiet:
+            print("\n%s" % '# '.ljust(78, '-'), file=target_file_obj)
+
+        print_config(option_list, target_file_obj=target_file_obj)
+
+        if not quiet:
+            print("\n%s" % '# '.ljust(78, '-'), file=target_file_obj)
+            print("# initial config lines: %d,\n"
+                  "# default options and unneeded lines: %d,\n"
+                  "# unneeded options: %d,\n"
+                  "# kept options: %d"
+                  % (config_lines_init,
+                     config_lines_init - config_lines_ndef,
+                     config_lines_ndef - config_lines_redu,
+                     config_lines_redu), file=target_file_obj)
+
+
+def reduce_mode():
+    """
+    the mode that minimizes a config file as much as possible
+
+    accesses global var(s): FLAGS, ERROR_CODE
+    """
+    with make_temp_directory() as tmp_root:
+        job = make_job(0, FLAGS.uncrustify_binary_path, FLAGS.config_file_path,
+                       FLAGS.input_file_path, FLAGS.formatted_file_path,
+                       FLAGS.lang, tmp_root, FLAGS.passes, FLAGS.checkpoint,
+                       FLAGS.resume, not FLAGS.no_token_filter,
+                       FLAGS.add_back, FLAGS.graph, FLAGS.event_log,
+                       FLAGS.quiet, FLAGS.jobs)
+
+        pool = create_pool([job], FLAGS.jobs)
+        try:
+            ret_flag, option_list, stats = run_steps(pool,
+                                                     reduce_job_steps(job))
+        finally:
+            pool.close()
+            pool.join()
+
+    if ret_flag == ERROR_CODE.NONE:
+        print_reduce_result(option_list, stats, FLAGS.quiet,
+                            FLAGS.empty_nochange)
 
     print("ret_flag: %d" % ret_flag, file=stderr)
     return ret_flag
@@ -927,20 +2299,20 @@ def no_default_mode():
     accesses global var(s): FLAGS, ERROR_CODE
     """
 
-    lines = get_non_default_options(FLAGS.uncrustify_binary_path,
-                                    FLAGS.config_file_path, )
-    config_lines_ndef = len(lines)
+    option_list = get_non_default_options(FLAGS.uncrustify_binary_path,
+                                          FLAGS.config_file_path)
+    config_lines_ndef = len(option_list)
     config_lines_init = count_lines(FLAGS.config_file_path)
 
     if not FLAGS.empty_nochange or (config_lines_ndef != config_lines_init):
         if not FLAGS.quiet:
             print("%s" % '# '.ljust(78, '-'))
 
-        options_str = '\n'.join(lines)
-        if not options_str:
+        if not option_list:
             print(" ")
         else:
-            print(options_str, file=stdout)
+            print_config(option_list)
+            print("")
 
         if not FLAGS.quiet:
             print("%s" % '# '.ljust(78, '-'))
@@ -1095,6 +2467,57 @@ if __name__ == "__main__":
         default=5,
         help='Max. number of cleaning passes.'
     )
+    group_reduce.add_argument(
+        '--checkpoint',
+        metavar='<path>',
+        type=str,
+        default=None,
+        help='File into which the state of the reduction is written after '
+             'each stage. Removed after a successful reduction.'
+    )
+    group_reduce.add_argument(
+        '--resume',
+        default=False,
+        action='store_true',
+        help='Continue the reduction recorded in the --checkpoint file.'
+    )
+    group_reduce.add_argument(
+        '--no-token-filter',
+        default=False,
+        action='store_true',
+        help='Do not remove options whose trigger tokens do not appear in any '
+             'input file before the one-by-one reduction.'
+    )
+
+    group_reduce.add_argument(
+        '--add-back',
+        type=str,
+        choices=ADD_BACK_MODES,
+        default=ADD_BACK_MODES[0],
+        help="How removed options are restored if they can only be removed "
+             "one at a time. '%s' restores them greedily based on the files "
+             "they fix and falls back to '%s', which tries all combinations."
+             " Defaults to '%s'" % (ADD_BACK_MODES[0], ADD_BACK_MODES[1],
+                                    ADD_BACK_MODES[0])
+    )
+
+    group_reduce.add_argument(
+        '--graph',
+        metavar='<path>',
+        type=str,
+        default=None,
+        help='Option graph file. Options that had to be restored together '
+             'are recorded in it and restored first in later reductions.'
+    )
+
+    group_reduce.add_argument(
+        '--event-log',
+        metavar='<path>',
+        type=str,
+        default=None,
+        help='File to which the progress and stage timing events are '
+             'appended as JSON lines.'
+    )
 
     group_no_default = arg_parser.add_argument_group(
         'no-default mode', 'Options to remove configuration file option with '
@@ -1105,6 +2528,9 @@ if __name__ == "__main__":
     if FLAGS.lang is not None:
         FLAGS.lang = [j for i in FLAGS.lang for j in i]
 
+    if FLAGS.resume and not FLAGS.checkpoint:
+        arg_parser.error("--resume requires --checkpoint")
+
     if FLAGS.mode == MODES[0]:
         if not FLAGS.input_file_path or not FLAGS.formatted_file_path:
             arg_parser.error("Flags -f and -i are required in Mode '%s'!"
@@ -1112,12 +2538,12 @@ if __name__ == "__main__":
             sys_exit(ERROR_CODE.FLAGS)
 
         # flatten 2 dimensional args: -f p -f p -f p -f p0 p1 p2 -> [[],[], ...]
-    FLAGS.input_file_path = [j for i in FLAGS.input_file_path for j in i]
+        FLAGS.input_file_path = [j for i in FLAGS.input_file_path for j in i]
 
-    FLAGS.formatted_file_path = [j for i in
-                                 FLAGS.formatted_file_path for j in i]
+        FLAGS.formatted_file_path = [j for i in
+                                     FLAGS.formatted_file_path for j in i]
 
-    if len(FLAGS.input_file_path) != len(FLAGS.formatted_file_path):
+        if len(FLAGS.input_file_path) != len(FLAGS.formatted_file_path):
             print("Unequal amount of input and formatted file paths.",
                   file=stderr)
             sys_exit(ERROR_CODE.FLAGS)
@@ -0,0 +1,530 @@
+#!/usr/bin/python
+"""
+option_table.py
+
+reads the Uncrustify option table (names, types, groups and defaults) from
+src/options.cpp and parses and normalizes config files natively, without
+starting the Uncrustify binary
+
+:license: GPL v2+
+"""
+
+from __future__ import print_function  # python >= 2.6
+
+from os.path import abspath, dirname, isabs, join as path_join
+from collections import OrderedDict, namedtuple
+from re import compile as re_compile, DOTALL, MULTILINE
+from sys import stderr
+
+SRC_DIR = path_join(dirname(dirname(abspath(__file__))), "src")
+
+# cache of already read option tables, key: path to options.cpp
+OPTION_TABLE_CACHE = {}
+
+OptionEntry = namedtuple("OptionEntry", "name type group default")
+
+# keyword token types that have their own config key, see print_keywords()
+KEYWORD_KEYS = OrderedDict((("TYPE", "type"),
+                            ("MACRO_OPEN", "macro-open"),
+                            ("MACRO_CLOSE", "macro-close"),
+                            ("MACRO_ELSE", "macro-else")))
+
+# order in which Uncrustify prints the file_ext lines, see language_names[]
+LANGUAGE_NAMES = ("C", "CPP", "D", "CS", "VALA", "JAVA", "PAWN", "OC", "OC+",
+                  "CS+", "ECMA", "C-Header")
+
+# normalized representation of the zeroed option values, see
+# set_option_defaults() and op_val_to_string()
+ZERO_VALUES = {
+    "AT_BOOL": "false",
+    "AT_IARF": "ignore",
+    "AT_NUM": "0",
+    "AT_UNUM": "0",
+    "AT_LINE": "auto",
+    "AT_POS": "ignore",
+    "AT_STRING": '""',
+    "AT_TFI": "false",
+}
+
+# accepted spellings (lower case) of the enumerated option values, see
+# convert_value()
+VALUE_ALIASES = {
+    "AT_BOOL": {"true": "true", "t": "true", "1": "true",
+                "false": "false", "f": "false", "0": "false"},
+    "AT_IARF": {"add": "add", "a": "add", "remove": "remove", "r": "remove",
+                "force": "force", "f": "force", "ignore": "ignore",
+                "i": "ignore"},
+    "AT_LINE": {"auto": "auto", "lf": "lf", "crlf": "crlf", "cr": "cr"},
+    "AT_POS": {"ignore": "ignore", "join": "join", "lead": "lead",
+               "lead_break": "lead_break", "lead_force": "lead_force",
+               "trail": "trail", "trail_break": "trail_break",
+               "trail_force": "trail_force"},
+    "AT_TFI": {"true": "true", "t": "true", "1": "true",
+               "false": "false", "f": "false", "0": "false",
+               "ignore": "ignore", "i": "ignore", "2": "ignore"},
+}
+
+GROUP_OR_OPTION_RE = re_compile(
+    r'unc_begin_group\(\s*(UG_\w+)'
+    r'|unc_add_option\(\s*"(\w+)"\s*,\s*UO_\w+\s*,\s*(AT_\w+)', DOTALL)
+DEFAULT_RE = re_compile(r'cpd\.defaults\[UO_(\w+)\]\.\w+\s*=\s*([^;]+);')
+LOG_LEVEL_RE = re_compile(r'^\s*(L\w+)\s*=\s*(\d+)')
+LINE_COMMENT_RE = re_compile(r'^\s*//.*$', MULTILINE)
+STRTOL_RE = re_compile(r'\s*([+-]?)(0[xX][0-9a-fA-F]+|0[0-7]*|[1-9][0-9]*)')
+
+
+def option_key(name):
+    """
+    Uncrustify matches option names case insensitive and ignores all non
+    alphanumeric characters, see match_text()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param name: str
+        an option name
+
+
+    :return: str
+    ----------------------------------------------------------------------------
+        the key under which the option is looked up
+    """
+    return ''.join(c for c in name.lower() if c.isalnum())
+
+
+def c_strtol(text):
+    """
+    converts a string like strtol(text, nullptr, 0)
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param text: str
+        the string that is going to be converted
+
+
+    :return: int
+    ----------------------------------------------------------------------------
+        the converted number, 0 if no number could be read
+    """
+    match = STRTOL_RE.match(text)
+    if not match:
+        return 0
+
+    sign, digits = match.groups()
+    if digits[:2].lower() == "0x":
+        number = int(digits[2:], 16)
+    elif len(digits) > 1 and digits[0] == "0":
+        number = int(digits[1:], 8)
+    else:
+        number = int(digits)
+
+    return -number if sign == "-" else number
+
+
+def parse_default_value(option_type, text, log_levels):
+    """
+    converts the right hand side of a C++ default value assignment into its
+    normalized string representation
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param option_type: str
+        the type of the option, e.g. AT_IARF
+
+    :param text: str
+        the C++ expression, e.g. AV_REMOVE, true, '\\\\', 8
+
+    :param log_levels: dict< str, int >
+        values of the log_sev_t enumerators
+
+
+    :return: str
+    ----------------------------------------------------------------------------
+        the normalized value
+    """
+    text = text.strip()
+
+    if text in log_levels:
+        return str(log_levels[text])
+
+    if len(text) >= 3 and text[0] == "'" and text[-1] == "'":
+        char = text[1:-1]
+        if char[:1] == "\\":
+            char = char[1:]
+        return str(ord(char))
+
+    if option_type in ("AT_NUM", "AT_UNUM"):
+        return str(c_strtol(text))
+
+    # AV_REMOVE, LE_AUTO, TP_JOIN, TFI_IGNORE -> remove, auto, join, ignore
+    return text.split("_", 1)[-1].lower() if text[:1].isupper() \
+        else text.lower()
+
+
+def load_option_table(src_dir=SRC_DIR):
+    """
+    reads the option names, types, groups and default values from
+    src/options.cpp (and the log levels from src/log_levels.h),
+    the result is cached
+
+    accesses global var(s): OPTION_TABLE_CACHE
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param src_dir: str
+        path to the Uncrustify source directory
+
+
+    :return: OrderedDict< str, OptionEntry >
+    ----------------------------------------------------------------------------
+        all options in the order in which Uncrustify prints them,
+        key: option name
+    """
+    options_cpp_path = path_join(src_dir, "options.cpp")
+
+    if options_cpp_path in OPTION_TABLE_CACHE:
+        return OPTION_TABLE_CACHE[options_cpp_path]
+
+    # drop commented out registrations
+    with open(options_cpp_path, 'r') as f:
+        options_cpp = LINE_COMMENT_RE.sub('', f.read())
+
+    log_levels = {}
+    with open(path_join(src_dir, "log_levels.h"), 'r') as f:
+        for line in f:
+            match = LOG_LEVEL_RE.match(line)
+            if match:
+                log_levels[match.group(1)] = int(match.group(2))
+
+    # group_map is a std::map -> options are printed ordered by group id
+    group_ids = OrderedDict()
+    group_options = []
+    option_types = {}
+
+    for match in GROUP_OR_OPTION_RE.finditer(options_cpp):
+        group, name, option_type = match.groups()
+        if group is not None:
+            group_ids.setdefault(group, len(group_ids))
+            group_options.append((group, []))
+        else:
+            group_options[-1][1].append(name)
+            option_types[name] = option_type
+
+    defaults = {}
+    for match in DEFAULT_RE.finditer(options_cpp):
+        name, text = match.groups()
+        if name in option_types:
+            defaults[name] = parse_default_value(option_types[name], text,
+                                                 log_levels)
+
+    option_table = OrderedDict()
+    for group, names in sorted(group_options, key=lambda g: group_ids[g[0]]):
+        for name in names:
+            option_type = option_types[name]
+            option_table[name] = OptionEntry(
+                name, option_type, group,
+                defaults.get(name, ZERO_VALUES[option_type]))
+
+    OPTION_TABLE_CACHE[options_cpp_path] = option_table
+    return option_table
+
+
+def find_option(option_table, name):
+    """
+    looks up an option the way Uncrustify does, see unc_find_option()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param option_table: OrderedDict< str, OptionEntry >
+        see load_option_table()
+
+    :param name: str
+        the name of the option
+
+
+    :return: OptionEntry / None
+    """
+    entry = option_table.get(name)
+    if entry is not None:
+        return entry
+
+    key = option_key(name)
+    for entry in option_table.values():
+        if option_key(entry.name) == key:
+            return entry
+    return None
+
+
+def normalize_value(option_table, entry, value, settings):
+    """
+    converts an option value into the string that Uncrustify would print for
+    it, see convert_value() and op_val_to_string()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param option_table: OrderedDict< str, OptionEntry >
+        see load_option_table()
+
+    :param entry: OptionEntry
+        the option the value belongs to
+
+    :param value: str
+        the value as it was written in the config file
+
+    :param settings: dict< str, str >
+        the normalized values of the options read so far, used to resolve
+        values that reference other options (e.g. -indent_columns)
+
+
+    :return: str
+    ----------------------------------------------------------------------------
+        the normalized value
+
+    :raises: ValueError
+        if the value is not valid for the option type
+    """
+    option_type = entry.type
+
+    if option_type == "AT_STRING":
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        return '"%s"' % value
+
+    if option_type in ("AT_NUM", "AT_UNUM"):
+        if value[:1].isdigit() \
+                or (value[:1] in "+-" and value[1:2].isdigit()):
+            number = c_strtol(value)
+        else:
+            mult = 1
+            if value[:1] == "-":
+                mult = -1
+                value = value[1:]
+
+            ref = find_option(option_table, value)
+            if ref is None or ref.type not in ("AT_NUM", "AT_UNUM"):
+                raise ValueError("%s: can not assign '%s'"
+                                 % (entry.name, value))
+            number = int(settings.get(ref.name, ref.default)) * mult
+
+        if option_type == "AT_UNUM" and number < 0:
+            raise ValueError("%s: negative value not possible: %d"
+                             % (entry.name, number))
+        return str(number)
+
+    aliases = VALUE_ALIASES[option_type]
+    if value.lower() in aliases:
+        return aliases[value.lower()]
+
+    invert = False
+    if option_type == "AT_BOOL" and value[:1] in "-~":
+        invert = True
+        value = value[1:]
+
+    ref = find_option(option_table, value)
+    if option_type in ("AT_BOOL", "AT_IARF") and ref is not None \
+            and ref.type == option_type:
+        ref_value = settings.get(ref.name, ref.default)
+        if invert:
+            return "false" if ref_value == "true" else "true"
+        return ref_value
+
+    raise ValueError("%s: unexpected value '%s'" % (entry.name, value))
+
+
+def split_config_line(line):
+    """
+    splits a config file line into its arguments the way Uncrustify does,
+    see process_option_line()
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param line: str
+        a line of a config file
+
+
+    :return: list< str >
+    ----------------------------------------------------------------------------
+        the arguments of the line, empty for comment and blank lines
+    """
+    pound_pos = line.find('#')
+    if pound_pos != -1:
+        line = line[:pound_pos]
+
+    line = line.replace('=', ' ', 1).replace(',', ' ')
+
+    args = []
+    idx = 0
+    line_len = len(line)
+    while idx < line_len:
+        if line[idx].isspace():
+            idx += 1
+            continue
+
+        # quoted arguments keep their quotes
+        if line[idx] in "\"'":
+            end = line.find(line[idx], idx + 1)
+            end = line_len if end == -1 else end + 1
+        else:
+            end = idx
+            while end < line_len and not line[end].isspace():
+                end += 1
+
+        args.append(line[idx:end])
+        idx = end
+
+    return args
+
+
+def parse_config(file_path, option_table=None, state=None):
+    """
+    reads an Uncrustify config file (and the files it includes)
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param file_path: str
+        path to the config file
+
+    :param option_table: OrderedDict< str, OptionEntry > / None
+        see load_option_table(), loaded if None
+
+    :param state: dict / None
+        used internally for included files
+
+
+    :return: tuple< OrderedDict< str, str >,
+                    OrderedDict< str, str >,
+                    OrderedDict< str, str >,
+                    OrderedDict< str, str > >
+    ----------------------------------------------------------------------------
+        the normalized option settings, the keywords (name -> token type),
+        the defines (name -> value) and the file extensions (ext -> language)
+    """
+    if option_table is None:
+        option_table = load_option_table()
+    if state is None:
+        state = (OrderedDict(), OrderedDict(), OrderedDict(), OrderedDict())
+    settings, keywords, defines, extensions = state
+
+    with open(file_path, 'r') as f:
+        lines = f.readlines()
+
+    for line_no, line in enumerate(lines, 1):
+        args = split_config_line(line)
+        if len(args) < 2:
+            continue
+
+        key = args[0].lower()
+
+        if key == "type":
+            for arg in args[1:]:
+                keywords[arg] = "TYPE"
+        elif key == "define":
+            defines[args[1]] = args[2].strip("\"'") if len(args) > 2 else ""
+        elif key in ("macro-open", "macro-close", "macro-else"):
+            keywords[args[1]] = key.replace('-', '_').upper()
+        elif key == "set":
+            for arg in args[2:]:
+                keywords[arg] = args[1].upper()
+        elif key == "include":
+            include_path = args[1].strip("\"'")
+            if not isabs(include_path):
+                include_path = path_join(dirname(file_path), include_path)
+            parse_config(include_path, option_table, state)
+        elif key == "file_ext":
+            language = args[1].upper()
+            for arg in args[2:]:
+                extensions[arg] = language
+        else:
+            entry = find_option(option_table, args[0])
+            if entry is None:
+                print("%s:%d Unknown symbol '%s'" % (file_path, line_no,
+                                                      args[0]), file=stderr)
+                continue
+            settings[entry.name] = normalize_value(option_table, entry,
+                                                   args[1], settings)
+
+    return state
+
+
+def non_default_options(file_path, option_table=None):
+    """
+    lists all options of a config file with non default values, in the same
+    order and form as Uncrustifys -p output
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param file_path: str
+        path to the config file
+
+    :param option_table: OrderedDict< str, OptionEntry > / None
+        see load_option_table(), loaded if None
+
+
+    :return: list< tuple< str, str > >
+    ----------------------------------------------------------------------------
+        a list containing pairs of option names and option values
+    """
+    if option_table is None:
+        option_table = load_option_table()
+
+    settings, keywords, defines, extensions = parse_config(file_path,
+                                                           option_table)
+    config_list = []
+
+    for name, entry in option_table.items():
+        value = settings.get(name, entry.default)
+        if value != entry.default:
+            config_list.append((name, value))
+
+    # see print_keywords(), print_defines() and print_extensions()
+    for keyword in sorted(keywords):
+        token_type = keywords[keyword]
+        if token_type in KEYWORD_KEYS:
+            config_list.append((KEYWORD_KEYS[token_type], keyword))
+        else:
+            config_list.append(("set", "%s %s" % (token_type, keyword)))
+
+    for name in sorted(defines):
+        config_list.append(("define", '%s "%s"' % (name, defines[name])))
+
+    for language in LANGUAGE_NAMES:
+        exts = [ext for ext in sorted(extensions)
+                if extensions[ext] == language.upper()]
+        if exts:
+            config_list.append(("file_ext", "%s %s" % (language,
+                                                       ' '.join(exts))))
+
+    return config_list
+
+
+def sort_options(config_list, option_table=None):
+    """
+    sorts options in the order in which Uncrustify prints them, special keys
+    are kept in their order behind all options
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param config_list: list< tuple< str, str > >
+        a list containing pairs of option names and option values
+
+    :param option_table: OrderedDict< str, OptionEntry > / None
+        see load_option_table(), loaded if None
+
+
+    :return: list< tuple< str, str > >
+    """
+    if option_table is None:
+        option_table = load_option_table()
+
+    order = dict((name, idx) for idx, name in enumerate(option_table))
+    special_idx = len(order)
+
+    return sorted(config_list, key=lambda o: order.get(o[0], special_idx))
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+"""
+result_store.py
+
+persistent store for the formatting results of
+gen_config_combinations_uniq_output.py. A result is keyed by the content hash
+of the Uncrustify binary, the content hash of the input file and the sorted
+option -> setting assignment, its value is the BLAKE2 digest of the output.
+Every distinct output is kept once as a blob named after its digest, so that
+a rerun with an extended option list only formats the new assignments.
+
+store layout:
+    results.json  -- dict of result keys to output digests ("" if Uncrustify
+                     failed)
+    outputs/      -- the output blobs
+
+:license: GPL v2+
+"""
+
+from __future__ import print_function  # python >= 2.6
+
+from os import makedirs, path, replace as os_replace
+from hashlib import blake2b, sha256
+from json import dump as json_dump, load as json_load
+from sys import stderr
+
+
+def file_digest(file_path):
+    """sha256 digest of a files content
+
+    :param file_path: path to the file
+
+    :return: hex digest str
+    """
+
+    with open(file_path, 'rb') as f:
+        return sha256(f.read()).hexdigest()
+
+
+def load_store(store_dir):
+    """Opens a result store, a missing directory is created
+
+    :param store_dir: path to the store directory
+
+    :return: store dict
+             dir     -- path to the store directory
+             results -- dict of result keys to output digests
+             changed -- True if results has to be saved
+    """
+
+    outputs_dir = path.join(store_dir, "outputs")
+    if not path.isdir(outputs_dir):
+        makedirs(outputs_dir)
+
+    results = {}
+    results_path = path.join(store_dir, "results.json")
+    if path.exists(results_path):
+        try:
+            with open(results_path, 'r') as f:
+                results = json_load(f)
+        except ValueError:
+            print("ignoring invalid result store: %s" % results_path,
+                  file=stderr)
+
+    return {"dir": store_dir, "results": results, "changed": False}
+
+
+def save_store(store):
+    """Writes the results of a store atomically if they were changed
+
+    :param store: store dict, see load_store
+    """
+
+    if not store["changed"]:
+        return
+
+    results_path = path.join(store["dir"], "results.json")
+    tmp_path = "%s.tmp" % results_path
+    with open(tmp_path, 'w') as f:
+        json_dump(store["results"], f)
+    os_replace(tmp_path, results_path)
+    store["changed"] = False
+
+
+def result_key(binary_digest, input_digest, assignment):
+    """Key of a formatting result
+
+    :param binary_digest: content hash of the Uncrustify binary
+
+    :param input_digest: content hash of the input file
+
+    :param assignment: sorted list of (option name, setting) tuples
+
+    :return: hex digest str
+    """
+
+    key = blake2b(digest_size=20)
+    key.update(("%s\0%s" % (binary_digest, input_digest)).encode("UTF-8"))
+    for option_name, option_setting in assignment:
+        key.update(("\0%s=%s" % (option_name, option_setting)).encode("UTF-8"))
+
+    return key.hexdigest()
+
+
+def output_path(store, digest):
+    """Path of the blob of an output
+
+    :param store: store dict, see load_store
+
+    :param digest: hex digest of the output
+
+    :return: str
+    """
+
+    return path.join(store["dir"], "outputs", digest)
+
+
+def lookup_result(store, key):
+    """Stored output digest of a result
+
+    :param store: store dict, see load_store
+
+    :param key: see result_key
+
+    :return: hex digest str, "" if Uncrustify failed, None if the result is
+             not stored
+    """
+
+    return store["results"].get(key)
+
+
+def add_result(store, key, digest, output):
+    """Stores a result and the blob of its output if the blob is missing
+
+    :param store: store dict, see load_store
+
+    :param key: see result_key
+
+    :param digest: hex digest of the output, "" if Uncrustify failed
+
+    :param output: bytes of the output, None if Uncrustify failed
+    """
+
+    if digest:
+        blob_path = output_path(store, digest)
+        if not path.exists(blob_path):
+            tmp_path = "%s.tmp" % blob_path
+            with open(tmp_path, 'wb') as f:
+                f.write(output)
+            os_replace(tmp_path, blob_path)
+
+    store["results"][key] = digest
+    store["changed"] = True
+
+
+def read_output(store, digest):
+    """Reads the blob of an output
+
+    :param store: store dict, see load_store
+
+    :param digest: hex digest of the output
+
+    :return: bytes
+    """
+
+    with open(output_path(store, digest), 'rb') as f:
+        return f.read()
@@ -4,6 +4,33 @@
 # Parses a C/C++/C#/D/Java/Pawn/whatever file in an array of
 # tuples (string, type)
 #
+# Tokenizer walks the text one character at a time, RegexTokenizer produces
+# the same tokens with one compiled master regex, iter_tokens() streams them
+# with their positions from files or mmap.
+#   tokenizer.py --compare [path ...]    checks that both produce equal tokens,
+#                                        also iter_tokens() over files and mmap
+#   tokenizer.py --benchmark [path ...]  times both, defaults to tests/input
+#   tokenizer.py --punc-benchmark        times the punctuator lookup
+#   tokenizer.py --memory [path ...]     memory of the tokens of all files
+#   tokenizer.py --stats [-j N] [path ...]
+#                                        token statistics of a source tree,
+#                                        tokenized in a process pool
+#
+
+import argparse
+import mmap
+import re
+import sys
+import tracemalloc
+
+from array import array
+from collections import Counter, namedtuple
+from collections.abc import Sequence
+from contextlib import redirect_stdout
+from io import StringIO
+from multiprocessing import Pool, cpu_count
+from os import devnull, getpid, path, walk
+from time import perf_counter
 
 # punctuator lookup table
 punc_table = [
@@ -86,6 +113,21 @@ punc_table = [
 ]
 
 
+# punc_table compiled into a dict trie: character -> (punctuator or None,
+# dict of the following characters), an empty dict ends a path
+def build_punc_trie(tab_idx=0):
+    node = {}
+    while 1:
+        pte = punc_table[tab_idx]
+        node[pte[0]] = (pte[3], build_punc_trie(pte[2]) if pte[2] else {})
+        if pte[1] == 0:
+            return node
+        tab_idx += 1
+
+
+punc_trie = build_punc_trie()
+
+
 #
 # Token types:
 #  0 = newline
@@ -106,7 +148,6 @@ class Tokenizer:
         self.text = in_text
         self.text_idx = 0
 
-        print(in_text)
         try:
             while self.text_idx < len(self.text):
                 if self.parse_whitespace():
@@ -196,9 +237,34 @@ class Tokenizer:
         self.tokens.append((self.text[start_idx : self.text_idx], 4))
         return True
 
-    # Checks for punctuators
+    # Checks for punctuators, the longest match is looked up in punc_trie with
+    # one dict hit per character. Like the walk over the punc_table rows, all
+    # matched characters are consumed, even those after the last punctuator
+    # (the '%' of '%:%').
     # Returns whether a punctuator was consumed (True or False)
     def parse_punctuator(self):
+        text = self.text
+        text_idx = self.text_idx
+        node = punc_trie
+        saved_punc = None
+        while text_idx < len(text):
+            entry = node.get(text[text_idx])
+            if entry is None:
+                break
+            text_idx += 1
+            if entry[0] is not None:
+                saved_punc = entry[0]
+            node = entry[1]
+            if not node:
+                break
+        if saved_punc is not None:
+            self.text_idx = text_idx
+            self.tokens.append((saved_punc, 1))
+            return True
+        return False
+
+    # parse_punctuator() over the punc_table rows, kept for --punc-benchmark
+    def parse_punctuator_rows(self):
         tab_idx = 0
         punc_len = 0
         saved_punc = None
@@ -246,7 +312,7 @@ class Tokenizer:
                 self.text_idx += 1
                 while self.text[self.text_idx] in '_01':
                     self.text_idx += 1
-            elif ch >= '0' and ch <= 7:  # octal (but allow decimal)
+            elif ch >= '0' and ch <= '7':  # octal (but allow decimal)
                 self.text_idx += 1
                 while self.text[self.text_idx] in '_0123456789':
                     self.text_idx += 1
@@ -301,6 +367,486 @@ class Tokenizer:
         self.tokens.append((self.text[start_idx : self.text_idx], token_type))
         return True
 
+
+#
+# Master regex of RegexTokenizer. The alternatives start with different
+# characters, except for '/' and '.' which are tried as comment and number
+# before they are taken as punctuators, just like the order of the parse_*()
+# calls in Tokenizer.tokenize_text(). They also mirror their quirks: a block
+# comment is searched from its '/' on ("/*/" is a comment) and an
+# unterminated one leaves the last character, an unterminated string runs to
+# the end of the text and '%:%' is consumed as '%:'.
+# Blanks are matched in front of the tokens to halve the amount of matches.
+#
+
+# characters whose upper() is in the identifier sets of parse_identifier(),
+# as characters and as UTF-8 byte sequences for the bytes version
+IDENT_CHARS = '@_A-Za-z\u0131\u017f\ufb05\ufb06'
+IDENT_UTF8 = r'\xc4\xb1|\xc5\xbf|\xef\xac[\x85\x86]'
+
+PUNC_VALUES = dict((pte[3], pte[3]) for pte in punc_table if pte[3] is not None)
+PUNC_VALUES['%:%'] = '%:'
+
+
+# nested alternatives of the characters that can follow prefix, a greedy
+# match of the pattern is the longest punctuator
+def punc_pattern(puncs, prefix=''):
+    next_chars = sorted(set(p[len(prefix)] for p in puncs
+                            if len(p) > len(prefix) and p.startswith(prefix)))
+    if not next_chars:
+        return ''
+
+    pattern = '(?:%s)' % '|'.join(
+        re.escape(ch) + punc_pattern(puncs, prefix + ch) for ch in next_chars)
+    return pattern + '?' if prefix in puncs else pattern
+
+
+TOKEN_PATTERN = r"""
+    [ \t]*
+    (?: (?P<ident>%(ident_start)s%(ident_char)s*)
+      | (?P<ws>[\r\n][ \t\r\n]*)
+      | (?P<string>"[^"\\]*(?:\\[\s\S][^"\\]*)*(?:"|\\?\Z)
+                 |'[^'\\]*(?:\\[\s\S][^'\\]*)*(?:'|\\?\Z))
+      | (?P<comment>//[^\r\n]*|/(?=\*)(?:[\s\S]*?\*/|[\s\S]*(?=[\s\S]\Z)))
+      | (?P<number>
+            (?:0[xX][_0-9a-fA-F]*(?P<hexdot>\.[_0-9a-fA-F]*)?
+             | (?:0[bB][_01]*|0[0-7][_0-9]*|0|[1-9][_0-9]*|(?=\.[0-9]))
+               (?P<dot>\.[_0-9]*)?)
+            (?P<exp>[eEpP][+-]?[_0-9]*)?
+            (?P<suffix>[lLuUtTfFdDmM]*))
+      | (?P<punc>%(punc)s)
+      | (?P<bsnl>\\\n)
+      | (?P<bad>[\s\S])
+      | (?P<end>\Z))
+    """
+
+TOKEN_RE = re.compile(TOKEN_PATTERN % {
+    "ident_start": '[%s]' % IDENT_CHARS,
+    "ident_char": '[%s0-9]' % IDENT_CHARS,
+    "punc": punc_pattern(PUNC_VALUES)}, re.VERBOSE)
+
+TOKEN_BYTES_RE = re.compile((TOKEN_PATTERN % {
+    "ident_start": '(?:[@_A-Za-z]|%s)' % IDENT_UTF8,
+    "ident_char": '(?:[@_A-Za-z0-9]|%s)' % IDENT_UTF8,
+    "punc": punc_pattern(PUNC_VALUES)}).encode('ascii'), re.VERBOSE)
+
+PUNC_BYTES_VALUES = dict((k.encode('ascii'), v) for k, v in PUNC_VALUES.items())
+
+FLOAT_SUFFIX_RE = re.compile('[tTfFdDmM]')
+FLOAT_SUFFIX_BYTES_RE = re.compile(b'[tTfFdDmM]')
+
+
+# token types of the TOKEN_RE groups, numbers are integers or floats
+KIND_TYPES = {'ident': 5, 'ws': 0, 'punc': 1, 'string': 4}
+
+
+# Compact token list: the text is kept once, every token is a type in an
+# array('B') and its start and end offset in two array('I'). The
+# (string, type) tuples of Tokenizer.tokens are created on access, so a
+# TokenStore can be used like that list; list(store) is the tuple list.
+class TokenStore(Sequence):
+    def __init__(self, text):
+        self.text = text
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.end = 0  # text index at which the tokenizer stopped
+
+    def append(self, token_type, start, end):
+        self.types.append(token_type)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def token(self, token_type, start, end):
+        if token_type == 0:
+            return ('\n', 0)
+        if token_type == 1:
+            return (PUNC_VALUES[self.text[start:end]], 1)
+        return (self.text[start:end], token_type)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        return self.token(self.types[idx], self.starts[idx], self.ends[idx])
+
+    def __iter__(self):
+        token = self.token
+        for token_type, start, end in zip(self.types, self.starts, self.ends):
+            yield token(token_type, start, end)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in
+                                               zip(self, other))
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a)
+                   for a in (self.types, self.starts, self.ends))
+
+
+# tokenizes a text with TOKEN_RE into a TokenStore
+def scan_text(text):
+    store = TokenStore(text)
+    types_append = store.types.append
+    starts_append = store.starts.append
+    ends_append = store.ends.append
+
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        token_type = KIND_TYPES.get(kind)
+        if token_type is None:
+            if kind == 'number':
+                float_number = (match.group('hexdot') or match.group('dot')
+                                or match.group('exp')
+                                or FLOAT_SUFFIX_RE.search(
+                                    match.group('suffix')))
+                token_type = 3 if float_number else 2
+            elif kind == 'bad':
+                store.end = match.start(kind)
+                return store
+            else:
+                continue  # comment, backslash newline, end of text
+
+        types_append(token_type)
+        starts_append(match.start(kind))
+        ends_append(match.end())
+
+    store.end = len(text)
+    return store
+
+
+# Tokenizer with TOKEN_RE, tokens is a TokenStore
+class RegexTokenizer(Tokenizer):
+    def tokenize_text(self, in_text):
+        self.text = in_text
+        self.tokens = scan_text(in_text)
+        self.text_idx = self.tokens.end
+
+        if self.text_idx < len(in_text):
+            print("confused: %s" % in_text[self.text_idx:])
+
+
+# A token of iter_tokens(): text and type as in Tokenizer.tokens, the byte
+# offset into the source, the line and the column (1-based, in bytes)
+Token = namedtuple('Token', 'text type offset line column')
+
+# bytes that iter_tokens() reads at once
+CHUNK_SIZE = 1 << 16
+
+
+# Yields the tokens of a source as Token tuples, the source is a file path, a
+# binary file object or a bytes like object (bytes, mmap.mmap). Files are read
+# in chunks of chunk_size bytes, a match that reaches the last byte of a chunk
+# may continue in the next one and is matched again after the next chunk was
+# appended, so that only the current chunk and the current token are kept in
+# memory. Bytes like objects are scanned in place. Where the text can not be
+# tokenized the tokens end, with a message on stderr if verbose is set.
+def iter_tokens(source, chunk_size=CHUNK_SIZE, verbose=True):
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for token in iter_tokens(f, chunk_size, verbose):
+                yield token
+        return
+
+    read = getattr(source, 'read', None)
+    if read is None:
+        buf, eof = source, True
+    else:
+        buf, eof = read(chunk_size), False
+
+    base = 0        # offset of buf[0] in the source
+    line = 1
+    line_start = 0  # offset of the first byte of the current line
+    while True:
+        pos = 0
+        for match in TOKEN_BYTES_RE.finditer(buf):
+            # the end of the buffer decides about matches at its end
+            if not eof and match.end() >= len(buf) - 1:
+                break
+
+            kind = match.lastgroup
+            start = match.start(kind)
+            offset = base + start
+            column = offset - line_start + 1
+
+            if kind == 'ident':
+                yield Token(buf[start:match.end()].decode('utf-8', 'replace'),
+                            5, offset, line, column)
+            elif kind == 'ws':
+                yield Token('\n', 0, offset, line, column)
+            elif kind == 'punc':
+                yield Token(PUNC_BYTES_VALUES[bytes(buf[start:match.end()])],
+                            1, offset, line, column)
+            elif kind == 'number':
+                float_number = (match.group('hexdot') or match.group('dot')
+                                or match.group('exp')
+                                or FLOAT_SUFFIX_BYTES_RE.search(
+                                    match.group('suffix')))
+                yield Token(buf[start:match.end()].decode('ascii'),
+                            3 if float_number else 2, offset, line, column)
+            elif kind == 'string':
+                yield Token(buf[start:match.end()].decode('utf-8', 'replace'),
+                            4, offset, line, column)
+            elif kind == 'bad':
+                if not verbose:
+                    return
+                print("%sconfused at line %d, column %d"
+                      % ("%s: " % source.name if hasattr(source, 'name')
+                         else '', line, column), file=sys.stderr)
+                return
+            elif kind == 'end':
+                return
+
+            newlines = buf.count(b'\n', match.start(), match.end())
+            if newlines:
+                line += newlines
+                line_start = base + buf.rfind(b'\n', match.start(),
+                                              match.end()) + 1
+            pos = match.end()
+
+        if eof:
+            return
+
+        data = read(chunk_size)
+        eof = not data
+        buf = buf[pos:] + data
+        base += pos
+
+
+def read_source(file_path):
+    with open(file_path, 'r', encoding='utf-8', errors='replace',
+              newline='') as f:
+        return f.read()
+
+
+def corpus_files(paths):
+    for p in paths:
+        if path.isfile(p):
+            yield p
+            continue
+        for dir_path, dir_names, file_names in walk(p):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                yield path.join(dir_path, file_name)
+
+
+def run_tokenizer(tokenizer, text):
+    # returns the tokens and the index at which the tokenizer stopped, None
+    # if it raised an exception
+    with redirect_stdout(StringIO()):
+        try:
+            tokenizer.tokenize_text(text)
+        except Exception:
+            return None
+    return tokenizer.tokens, tokenizer.text_idx
+
+
+# the (text, type) tuples of iter_tokens() with small chunks and with mmap
+def stream_tokens(file_path, chunk_size=61):
+    tokens = [(t.text, t.type)
+              for t in iter_tokens(file_path, chunk_size, verbose=False)]
+
+    with open(file_path, 'rb') as f:
+        if path.getsize(file_path) == 0:
+            return tokens
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if [(t.text, t.type)
+                    for t in iter_tokens(buf, verbose=False)] != tokens:
+                return None
+    return tokens
+
+
+# True if RegexTokenizer and iter_tokens() produce the tokens of Tokenizer,
+# None if Tokenizer raised (the character walker indexes past the end of some
+# texts)
+def compare_file(file_path):
+    text = read_source(file_path)
+    expected = run_tokenizer(Tokenizer(), text)
+    if expected is None:
+        return None
+
+    return (run_tokenizer(RegexTokenizer(), text) == expected
+            and stream_tokens(file_path) == expected[0])
+
+
+def compare(paths):
+    same = differ = skipped = 0
+    for file_path in corpus_files(paths):
+        equal = compare_file(file_path)
+        if equal is None:
+            skipped += 1
+        elif equal:
+            same += 1
+        else:
+            differ += 1
+            print("differs: %s" % file_path)
+
+    print("%d files equal, %d differ, %d skipped (Tokenizer raised)"
+          % (same, differ, skipped))
+    return 1 if differ else 0
+
+
+# times parse_punctuator() against parse_punctuator_rows() on a text that
+# consists of punctuators only
+def punc_benchmark(repeat):
+    puncs = sorted(PUNC_VALUES)
+    text = ' '.join(puncs * 2000) + ' '
+    print("%d punctuators" % (len(puncs) * 2000))
+
+    results = {}
+    for name in ('parse_punctuator_rows', 'parse_punctuator'):
+        best = None
+        for _ in range(repeat):
+            tokenizer = Tokenizer()
+            tokenizer.text = text
+            parse = getattr(tokenizer, name)
+            start = perf_counter()
+            while tokenizer.text_idx < len(text):
+                if text[tokenizer.text_idx] == ' ':
+                    tokenizer.text_idx += 1
+                else:
+                    parse()
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+        print("%-22s %8.3f s" % (name, best))
+
+    print("speedup: %.1fx" % (results['parse_punctuator_rows']
+                              / results['parse_punctuator']))
+    return 0
+
+
+# memory of the tokens of all files: tuple lists against TokenStores, the
+# texts are kept by both
+def memory(paths):
+    texts = [read_source(f) for f in corpus_files(paths)]
+
+    results = {}
+    for name, tokenize in (('tuple lists', lambda t: list(scan_text(t))),
+                           ('TokenStores', scan_text)):
+        tracemalloc.start()
+        tokens = [tokenize(t) for t in texts]
+        results[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("%-12s %9d tokens %11d bytes"
+              % (name, sum(len(t) for t in tokens), results[name]))
+        del tokens
+
+    print("ratio: %.1fx" % (results['tuple lists'] / results['TokenStores']))
+    return 0
+
+
+TOKEN_TYPE_NAMES = ('newline', 'punctuator', 'integer', 'float', 'string',
+                    'identifier')
+
+
+# token statistics of one file, runs in the pool of stats()
+def file_stats(file_path):
+    start = perf_counter()
+    type_counts = [0] * len(TOKEN_TYPE_NAMES)
+    puncs = Counter()
+    ident_lengths = Counter()
+
+    for token in iter_tokens(file_path):
+        type_counts[token.type] += 1
+        if token.type == 1:
+            puncs[token.text] += 1
+        elif token.type == 5:
+            ident_lengths[len(token.text)] += 1
+
+    return {'worker': getpid(), 'bytes': path.getsize(file_path),
+            'seconds': perf_counter() - start, 'types': type_counts,
+            'puncs': puncs, 'ident_lengths': ident_lengths}
+
+
+def print_counts(title, counts, total):
+    print("\n%s:" % title)
+    for key, count in counts:
+        print("  %-12s %10d %6.2f%%" % (key, count, 100.0 * count / total))
+
+
+# tokenizes all files in a process pool and prints the aggregated statistics
+def stats(paths, jobs, top):
+    files = list(corpus_files(paths))
+    type_counts = [0] * len(TOKEN_TYPE_NAMES)
+    puncs = Counter()
+    ident_lengths = Counter()
+    workers = {}
+
+    start = perf_counter()
+    with Pool(processes=jobs) as pool:
+        for result in pool.imap_unordered(file_stats, files, chunksize=4):
+            for idx, count in enumerate(result['types']):
+                type_counts[idx] += count
+            puncs.update(result['puncs'])
+            ident_lengths.update(result['ident_lengths'])
+
+            worker = workers.setdefault(result['worker'], [0, 0, 0.0])
+            worker[0] += 1
+            worker[1] += result['bytes']
+            worker[2] += result['seconds']
+    elapsed = perf_counter() - start
+
+    size = sum(w[1] for w in workers.values())
+    tokens = sum(type_counts)
+    print("%d files, %d bytes, %d tokens in %.3f s (%.2f MB/s, %d jobs)"
+          % (len(files), size, tokens, elapsed, size / elapsed / 1e6, jobs))
+    if not tokens:
+        return 0
+
+    print_counts("tokens per type", zip(TOKEN_TYPE_NAMES, type_counts),
+                 tokens)
+    print_counts("punctuators", puncs.most_common(top or None),
+                 type_counts[1] or 1)
+
+    idents = type_counts[5] or 1
+    peak = max(ident_lengths.values()) if ident_lengths else 1
+    print("\nidentifier lengths:")
+    for length in sorted(ident_lengths):
+        count = ident_lengths[length]
+        print("  %3d %10d %6.2f%% %s" % (length, count, 100.0 * count / idents,
+                                         '#' * (50 * count // peak)))
+
+    print("\nworkers:")
+    for pid, (files_nr, worker_bytes, seconds) in sorted(workers.items()):
+        print("  %7d %6d files %10d bytes %8.3f s %8.2f MB/s"
+              % (pid, files_nr, worker_bytes, seconds,
+                 worker_bytes / seconds / 1e6 if seconds else 0.0))
+    return 0
+
+
+def benchmark(paths, repeat):
+    texts = [read_source(f) for f in corpus_files(paths)]
+    size = sum(len(t) for t in texts)
+    print("%d files, %d characters" % (len(texts), size))
+
+    results = {}
+    with open(devnull, 'w') as null, redirect_stdout(null):
+        for tokenizer_class in (Tokenizer, RegexTokenizer):
+            best = None
+            for _ in range(repeat):
+                tokenizer = tokenizer_class()
+                start = perf_counter()
+                for text in texts:
+                    try:
+                        tokenizer.tokenize_text(text)
+                    except Exception:
+                        pass
+                elapsed = perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[tokenizer_class.__name__] = best
+
+    for name, elapsed in results.items():
+        print("%-15s %8.3f s  %8.2f MB/s"
+              % (name, elapsed, size / elapsed / 1e6))
+    print("speedup: %.1fx" % (results['Tokenizer'] / results['RegexTokenizer']))
+    return 0
+
+
 text = """
 1.23+4-3*16%2 *sin(1.e-3 + .5p32) "hello" and "hello\\"there"
 123 // some comment
@@ -310,7 +856,47 @@ a = b + c;
 d = 5 /* hello */ + 3;
 """
 
-t = Tokenizer()
-t.tokenize_text(text)
-print(t.tokens)
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument('--compare', action='store_true',
+                      help='check that Tokenizer and RegexTokenizer produce '
+                           'the same tokens')
+    mode.add_argument('--stats', action='store_true',
+                      help='tokenize all files in a process pool and print '
+                           'token statistics')
+    mode.add_argument('--memory', action='store_true',
+                      help='compare the memory of tuple lists and '
+                           'TokenStores')
+    mode.add_argument('--punc-benchmark', action='store_true',
+                      help='time the punctuator lookup of Tokenizer')
+    mode.add_argument('--benchmark', action='store_true',
+                      help='time Tokenizer and RegexTokenizer')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=cpu_count(),
+                            help='processes of --stats')
+    arg_parser.add_argument('--top', type=int, default=0,
+                            help='punctuators printed by --stats, 0 for all')
+    arg_parser.add_argument('-r', '--repeat', type=int, default=3,
+                            help='benchmark runs, the best one counts')
+    arg_parser.add_argument('paths', nargs='*',
+                            help='files or directories, defaults to '
+                                 'tests/input')
+    args = arg_parser.parse_args()
+
+    paths = args.paths or [path.join(path.dirname(path.abspath(__file__)),
+                                     '..', 'tests', 'input')]
+    if args.compare:
+        sys.exit(compare(paths))
+    if args.stats:
+        sys.exit(stats(paths, args.jobs, args.top))
+    if args.memory:
+        sys.exit(memory(paths))
+    if args.punc_benchmark:
+        sys.exit(punc_benchmark(args.repeat))
+    if args.benchmark:
+        sys.exit(benchmark(paths, args.repeat))
+
+    t = Tokenizer()
+    t.tokenize_text(text)
+    print(t.tokens)
 
@@ -0,0 +1,175 @@
+"""
+test_option_reducer.py
+
+Tests the step drivers of scripts/option_reducer.py with test configs that
+are known to have broken reductions: a config whose options are all removed
+(the later passes of such a reduction have no tasks at all) and an input
+whose Uncrustify debug dump is not valid UTF-8
+
+:license: GPL v2+
+"""
+
+import argparse
+
+from faulthandler import dump_traceback_later, cancel_dump_traceback_later
+from os import name as os_name
+from os.path import abspath, dirname, isfile, join as path_join
+from sys import exit as sys_exit, path as sys_path, stderr
+
+if os_name == 'nt':
+    EX_OK = 0
+    EX_USAGE = 64
+    EX_SOFTWARE = 70
+else:
+    from os import EX_OK, EX_USAGE, EX_SOFTWARE
+
+TEST_DIR = dirname(abspath(__file__))
+sys_path.insert(0, path_join(dirname(TEST_DIR), "scripts"))
+
+import option_reducer
+from option_reducer import ERROR_CODE
+
+# a stuck pool would block the test forever
+TIMEOUT_SEC = 120
+
+# config, input file, expected file, language and whether the config is
+# reduced to no options at all
+REDUCTIONS = [
+    ("mod_full_brace_function-f.cfg", "pawn/gh419.pawn",
+     "pawn/60050-gh419.pawn", None, True),
+    # the -p output of the token filter contains invalid UTF-8 bytes
+    ("kw_subst3.cfg", "c/kw_subst.c", "c/01022-kw_subst.c", None, False),
+]
+
+
+def eprint(*args, **kwargs):
+    """
+        print() wraper that sets file=stderr
+    """
+    print(*args, file=stderr, **kwargs)
+
+
+def empty_steps():
+    """
+    step generator that yields a step without tasks
+
+
+    :return: list
+    ----------------------------------------------------------------------------
+        the results of the empty step
+    """
+    results = yield abs, []
+    return results
+
+
+def check_empty_step(pool):
+    """
+    checks that both step drivers pass an empty result list to a generator
+    that yields a step without tasks
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param pool: multiprocessing.pool.Pool
+        a pool created by create_pool()
+
+
+    :return: bool
+    ----------------------------------------------------------------------------
+        True if the test passed
+    """
+    done = {}
+    option_reducer.run_concurrent_steps(
+        pool, [("concurrent", empty_steps())], 1,
+        lambda key, result: done.update({key: result}))
+    done["serial"] = option_reducer.run_steps(pool, empty_steps())
+
+    if done != {"concurrent": [], "serial": []}:
+        eprint("empty step: unexpected results: %s" % done)
+        return False
+    return True
+
+
+def check_reductions(pool, jobs):
+    """
+    checks that the configs of REDUCTIONS are reduced successfully, to no
+    options if that is expected
+
+
+    Parameters
+    ----------------------------------------------------------------------------
+    :param pool: multiprocessing.pool.Pool
+        a pool created by create_pool()
+
+    :param jobs: list< dict >
+        the jobs of REDUCTIONS, see make_job()
+
+
+    :return: bool
+    ----------------------------------------------------------------------------
+        True if the test passed
+    """
+    done = {}
+    option_reducer.run_concurrent_steps(
+        pool, ((job["id"], option_reducer.reduce_job_steps(job))
+               for job in jobs), len(jobs),
+        lambda key, result: done.update({key: result}))
+
+    return_flag = True
+    for job, reduction in zip(jobs, REDUCTIONS):
+        result = done.get(job["id"])
+        if result is None or result[0] != ERROR_CODE.NONE \
+                or (reduction[4] and result[1]):
+            eprint("reduction: %s: unexpected result: %s"
+                   % (job["config_file_path"], result))
+            return_flag = False
+    return return_flag
+
+
+def main(flags):
+    if not isfile(flags.uncrustify_binary_path):
+        eprint("No Uncrustify binary found: %s" % flags.uncrustify_binary_path)
+        return EX_USAGE
+
+    dump_traceback_later(TIMEOUT_SEC, exit=True)
+    with option_reducer.make_temp_directory() as tmp_root:
+        jobs = [option_reducer.make_job(
+                    job_id, flags.uncrustify_binary_path,
+                    path_join(TEST_DIR, "config", config),
+                    [path_join(TEST_DIR, "input", input_file)],
+                    [path_join(TEST_DIR, "output", output_file)], [lang],
+                    tmp_root, quiet=True, jobs=flags.jobs)
+                for job_id, (config, input_file, output_file, lang, _)
+                in enumerate(REDUCTIONS)]
+
+        pool = option_reducer.create_pool(jobs, flags.jobs)
+        try:
+            return_flag = check_empty_step(pool)
+            return_flag = check_reductions(pool, jobs) and return_flag
+        finally:
+            pool.close()
+            pool.join()
+    cancel_dump_traceback_later()
+
+    return EX_OK if return_flag else EX_SOFTWARE
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument(
+        '-b', '--uncrustify_binary_path',
+        metavar='<path>',
+        type=str,
+        default=path_join(dirname(TEST_DIR), "build", "uncrustify"),
+        help='Path to the Uncrustify binary.'
+    )
+    arg_parser.add_argument(
+        '-j', '--jobs',
+        metavar='<nr>',
+        type=int,
+        default=2,
+        help='Number of processes to use.'
+    )
+
+    sys_exit(main(arg_parser.parse_args()))
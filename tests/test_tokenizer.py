@@ -0,0 +1,69 @@
+"""
+test_tokenizer.py
+
+Tests that RegexTokenizer and iter_tokens() of scripts/tokenizer.py (read in
+small chunks and from mmap) produce the same tokens as the character walking
+Tokenizer for every file in tests/input
+
+:license: GPL v2+
+"""
+
+import argparse
+
+from os import name as os_name
+from os.path import abspath, dirname, join as path_join, relpath
+from sys import exit as sys_exit, path as sys_path, stderr
+
+if os_name == 'nt':
+    EX_OK = 0
+    EX_SOFTWARE = 70
+else:
+    from os import EX_OK, EX_SOFTWARE
+
+TEST_DIR = dirname(abspath(__file__))
+sys_path.insert(0, path_join(dirname(TEST_DIR), "scripts"))
+
+from tokenizer import compare_file, corpus_files
+
+
+def eprint(*args, **kwargs):
+    """
+        print() wraper that sets file=stderr
+    """
+    print(*args, file=stderr, **kwargs)
+
+
+def main(flags):
+    same = skipped = 0
+    differ = []
+
+    for file_path in corpus_files(flags.paths):
+        equal = compare_file(file_path)
+        if equal is None:
+            skipped += 1
+        elif equal:
+            same += 1
+        else:
+            differ.append(file_path)
+
+    for file_path in differ:
+        eprint("tokens differ: %s" % relpath(file_path, TEST_DIR))
+
+    print("%d files equal, %d differ, %d skipped (Tokenizer raised)"
+          % (same, len(differ), skipped))
+
+    return EX_OK if same and not differ else EX_SOFTWARE
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+
+    arg_parser.add_argument(
+        'paths',
+        metavar='<path>',
+        nargs='*',
+        default=[path_join(TEST_DIR, "input")],
+        help='Files or directories to tokenize, defaults to tests/input.'
+    )
+
+    sys_exit(main(arg_parser.parse_args()))